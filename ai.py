@@ -1,44 +1,494 @@
 # ai_engine.py
-from google import genai 
-import json
+import asyncio
 import os
 import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from analysis_parser import MAX_CONDITIONS, AnalysisStreamParser, StreamValidator, parse_analysis, validate_analysis
+from cache import build_cache, normalize_symptoms
+from config import app, db
+from metrics import GEMINI_FAILURES, GEMINI_LATENCY, GEMINI_PARSE_FAILURES, record_usage, registry
+from prescreen import EmergencyPrescreen, emergency_response
+from resilience import CircuitBreaker, ResilientModels
+from semantic_cache import SemanticCache
+from singleflight import FileLockBackend, build_singleflight
+from triage import TriageEngine, watch_catalog
+
+MODEL_ID = "gemini-2.0-flash"
+
+# The google-genai SDK takes most of a second to import, so it is loaded and the
+# client built on first use (or by warm_up in the background) instead of at import.
+# Assigning ai.client directly (tests, benchmarks) skips that.
+client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """The Gemini client, created on first call"""
+    global client
+    if client is None:
+        with _client_lock:
+            if client is None:
+                import httpx
+                from google import genai
+
+                http_options = {
+                    'timeout': int(app.config['GEMINI_TIMEOUT'] * 1000),
+                    # client.aio: in-flight calls are bounded by ASGI_MAX_IN_FLIGHT, not by the pool
+                    'async_client_args': {'limits': httpx.Limits(max_connections=None, max_keepalive_connections=100)},
+                }
+                if app.config['GEMINI_BASE_URL']:
+                    http_options['base_url'] = app.config['GEMINI_BASE_URL']
+                client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"), http_options=http_options)
+    return client
+
+
+# Every model call goes through this: deadlines, retries, circuit breaker, hedging
+models = ResilientModels(
+    lambda: get_client().models,
+    timeout=app.config['GEMINI_TIMEOUT'],
+    deadline=app.config['GEMINI_DEADLINE'],
+    max_attempts=app.config['GEMINI_MAX_ATTEMPTS'],
+    backoff_base=app.config['GEMINI_BACKOFF_BASE'],
+    backoff_max=app.config['GEMINI_BACKOFF_MAX'],
+    breaker=CircuitBreaker(
+        failure_rate=app.config['GEMINI_BREAKER_FAILURE_RATE'],
+        window=app.config['GEMINI_BREAKER_WINDOW'],
+        min_calls=app.config['GEMINI_BREAKER_MIN_CALLS'],
+        cooldown=app.config['GEMINI_BREAKER_COOLDOWN'],
+    ),
+    hedge_model=app.config['GEMINI_HEDGE_MODEL'] or None,
+    hedge_percentile=app.config['GEMINI_HEDGE_PERCENTILE'],
+    hedge_min_delay=app.config['GEMINI_HEDGE_MIN_DELAY'],
+    max_concurrency=app.config['GEMINI_MAX_CONCURRENCY'],
+    get_async_models=lambda: get_client().aio.models,
+)
+for _name, _help in (('retries', 'Gemini attempts retried'), ('timeouts', 'Gemini attempts past their deadline'),
+                     ('hedges', 'Hedge requests sent to the secondary model'),
+                     ('hedge_wins', 'Hedge requests that answered first')):
+    registry.gauge(f'medicue_gemini_{_name}_total', _help, lambda _name=_name: getattr(models, _name), type='counter')
+registry.gauge('medicue_gemini_circuit_open', 'Gemini circuit breaker: 0 closed, 1 half open, 2 open',
+               lambda: {'closed': 0, 'half_open': 1, 'open': 2}[models.breaker.state])
+
+analysis_cache = build_cache(
+    app.config['ANALYSIS_CACHE_SIZE'],
+    app.config['ANALYSIS_CACHE_TTL'],
+    app.config['ANALYSIS_CACHE_DB'],
+    app.config['ANALYSIS_CACHE_DB_SIZE'],
+    app.config['ANALYSIS_CACHE_DB_TTL'],
+)
+
+semantic_cache = None
+if app.config['SEMANTIC_CACHE_ENABLED']:
+    semantic_cache = SemanticCache(
+        max_entries=app.config['SEMANTIC_CACHE_SIZE'],
+        threshold=app.config['SEMANTIC_CACHE_THRESHOLD'],
+    )
+
+analysis_flight = build_singleflight(
+    app.config['SINGLEFLIGHT_BACKEND'],
+    app.config['SINGLEFLIGHT_LOCK_DIR'],
+    analysis_cache.get,
+    app.config['SINGLEFLIGHT_TIMEOUT'],
+    app.config['SINGLEFLIGHT_LOCK_STRIPES'],
+)
+
+triage_engine = TriageEngine(refresh_interval=app.config['TRIAGE_REFRESH_INTERVAL'])
+watch_catalog(triage_engine)
+
+# Cache and coalescing counters - operator data, on /metrics only
+for _tier, _cache in (('memory', analysis_cache.memory), ('disk', analysis_cache.disk)):
+    if _cache is None:
+        continue
+    for _name in ('hits', 'misses', 'evictions', 'expirations'):
+        registry.gauge(f'medicue_analysis_cache_{_tier}_{_name}_total', f'Analysis cache {_tier} tier {_name}',
+                       lambda _cache=_cache, _name=_name: getattr(_cache, _name), type='counter')
+registry.gauge('medicue_analysis_cache_memory_entries', 'Analyses in the in-process cache tier',
+               lambda: analysis_cache.memory.stats()['entries'])
+for _name in ('hits', 'misses', 'evictions'):
+    registry.gauge(f'medicue_semantic_cache_{_name}_total', f'Near-duplicate cache {_name}',
+                   lambda _name=_name: getattr(semantic_cache, _name) if semantic_cache is not None else None,
+                   type='counter')
+registry.gauge('medicue_singleflight_leaders_total', 'Analyses that called upstream for their key',
+               lambda: analysis_flight.leaders, type='counter')
+registry.gauge('medicue_singleflight_collapsed_total', 'Analyses that waited on another caller with the same key',
+               lambda: analysis_flight.collapsed, type='counter')
+if isinstance(analysis_flight.backend, FileLockBackend):
+    registry.gauge('medicue_singleflight_collapsed_remote_total',
+                   'Analyses answered from the shared cache after waiting on another worker',
+                   lambda: analysis_flight.backend.collapsed_remote, type='counter')
+    registry.gauge('medicue_singleflight_lock_timeouts_total',
+                   'Analyses that gave up waiting on another worker and called upstream anyway',
+                   lambda: analysis_flight.backend.lock_timeouts, type='counter')
+
+prescreen = EmergencyPrescreen()
+if app.config['PRESCREEN_LEXICON']:
+    prescreen.reload_file(app.config['PRESCREEN_LEXICON'])
+
+
+SYSTEM_INSTRUCTION = (
+    "You are a medical assistant. For the patient's symptoms give the likely conditions, most likely first, "
+    "with a confidence percentage, and concise next steps based on standard clinical guidelines. "
+    'Set is_emergency to "true" for red flags such as chest pain or difficulty breathing.'
+)
+
+_generation_config = None
+
+
+def generation_config():
+    """GenerateContentConfig for analyses, built once on first use (it needs the SDK's types)"""
+    global _generation_config
+    if _generation_config is None:
+        _generation_config = _build_generation_config()
+    return _generation_config
+
+
+def _build_generation_config():
+    from google.genai import types
+
+    # The answer's shape is enforced by the API (JSON mode + schema) instead of being described in
+    # every prompt; is_emergency comes first so streaming clients can act on it before the rest arrives
+    schema = types.Schema(
+        type=types.Type.OBJECT,
+        properties={
+            'is_emergency': types.Schema(type=types.Type.STRING, enum=['true', 'false']),
+            'possible_conditions': types.Schema(
+                type=types.Type.ARRAY,
+                max_items=MAX_CONDITIONS,
+                items=types.Schema(
+                    type=types.Type.OBJECT,
+                    properties={
+                        'name': types.Schema(type=types.Type.STRING),
+                        'confidence': types.Schema(type=types.Type.STRING, description='Percentage, e.g. "70%"'),
+                    },
+                    required=['name', 'confidence'],
+                    property_ordering=['name', 'confidence'],
+                ),
+            ),
+            'recommendations': types.Schema(type=types.Type.STRING),
+        },
+        required=['is_emergency', 'possible_conditions', 'recommendations'],
+        property_ordering=['is_emergency', 'possible_conditions', 'recommendations'],
+    )
+    return types.GenerateContentConfig(
+        system_instruction=SYSTEM_INSTRUCTION,
+        response_mime_type='application/json',
+        response_schema=schema,
+        max_output_tokens=app.config['GEMINI_MAX_OUTPUT_TOKENS'],
+    )
+
+
+def warm_up():
+    """Import the SDK, build the client and config and load the triage catalog ahead of the first analysis"""
+    try:
+        get_client()
+        generation_config()
+    except Exception as e:
+        logging.warning(f"Gemini client warm-up failed: {e}")
+    if app.config['TRIAGE_MODE'] != 'off':
+        triage_engine.ensure_loaded(app, db)
+
+
+ANALYSIS_ERROR = {
+    "error_msg": "Please try again later or consult a professional.",
+}
+
+
+def _lookup_cached(symptoms_text):
+    """(cache_key, minhash signature, cached result or None) for a symptom description"""
+    cache_key = f"{MODEL_ID}:{normalize_symptoms(symptoms_text)}"
+    cached = analysis_cache.get(cache_key)
+    if cached is not None:
+        return cache_key, None, dict(cached)
+
+    signature = None
+    if semantic_cache is not None:
+        signature = semantic_cache.signature(symptoms_text)
+        similar = semantic_cache.lookup(symptoms_text, signature)
+        if similar is not None:
+            analysis_cache.set(cache_key, similar)
+            return cache_key, signature, dict(similar)
+    return cache_key, signature, None
+
+
+def _store(cache_key, symptoms_text, signature, result):
+    # error_msg fallbacks are skipped by both caches
+    analysis_cache.set(cache_key, result)
+    if semantic_cache is not None:
+        semantic_cache.add(symptoms_text, result, signature)
+
+
+def local_triage(symptoms_text):
+    """(analysis, score) from the local catalog engine, or (None, 0.0) if it has no answer"""
+    if app.config['TRIAGE_MODE'] == 'off' or not triage_engine.ensure_loaded(app, db):
+        return None, 0.0
+    return triage_engine.triage(symptoms_text)
+
+
+def screen_red_flags(symptoms_text):
+    """Red-flag categories found by the deterministic pre-screen ([] when it is off)"""
+    if app.config['PRESCREEN_MODE'] == 'off':
+        return []
+    return prescreen.scan(symptoms_text)
+
 
-# Configure your API Key
-client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
 def get_medical_analysis(symptoms_text):
-    model_id = "gemini-2.0-flash"    
-    prompt = f"""
-    You are a professional Medical Assistant AI. 
-    Analyze the following symptoms: "{symptoms_text}"
-    
-    You MUST return only a valid JSON object with this exact structure:
-    {{
-        "possible_conditions": [
-            {{"name": "Condition Name", "confidence": "0-100%"}}
-        ],
-        "recommendations": "Detailed medical advice and next steps."
-        "is_emergency": "true"/"false"
-    }}
-    
-    Guidelines:
-    - If symptoms include chest pain or difficulty breathing, set "is_emergency" to true.
-    - Provide recommendations based on standard clinical guidelines. 
-    - Do not include any text before or after the JSON.
+    """Red-flag pre-screen first, then the cached / model analysis"""
+    red_flags = screen_red_flags(symptoms_text)
+    if red_flags and app.config['PRESCREEN_MODE'] == 'immediate':
+        return emergency_response(red_flags)
+
+    return _with_red_flags(_analyze(symptoms_text), red_flags)
+
+
+def _with_red_flags(result, red_flags):
+    if red_flags:
+        if "error_msg" in result:
+            return emergency_response(red_flags)
+        result['is_emergency'] = 'true'
+        result['red_flags'] = red_flags
+    return result
+
+
+def _analyze(symptoms_text):
+    """Cached analysis - equivalent symptom descriptions share one Gemini call"""
+    cache_key, signature, cached = _lookup_cached(symptoms_text)
+    if cached is not None:
+        return cached
+
+    if app.config['TRIAGE_MODE'] == 'fastpath':
+        local, score = local_triage(symptoms_text)
+        if local is not None and score >= app.config['TRIAGE_FASTPATH_SCORE']:
+            return local
+
+    def analyze_and_store():
+        result = generate_medical_analysis(symptoms_text)
+        _store(cache_key, symptoms_text, signature, result)
+        return result
+
+    # Concurrent identical requests wait on the first caller's Gemini call
+    result = dict(analysis_flight.do(cache_key, analyze_and_store))
+    if "error_msg" in result:
+        # Gemini is unavailable - answer from the local catalog if it knows the symptoms
+        local, _ = local_triage(symptoms_text)
+        if local is not None:
+            return local
+    return result
+
+
+def get_medical_analyses(symptoms_texts, max_concurrency=8):
+    """Analyze many descriptions concurrently.
+
+    Descriptions that normalize to the same text are analyzed once. Returns one
+    (result, error) pair per input, in input order; error is None on success.
+    """
+    unique = {}
+    for text in symptoms_texts:
+        unique.setdefault(normalize_symptoms(text), text)
+
+    def analyze(text):
+        try:
+            return get_medical_analysis(text), None
+        except Exception as e:
+            return None, str(e)
+
+    workers = max(1, min(max_concurrency, len(unique)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='analysis-batch') as pool:
+        futures = {key: pool.submit(analyze, text) for key, text in unique.items()}
+        by_key = {key: future.result() for key, future in futures.items()}
+
+    results = []
+    for text in symptoms_texts:
+        result, error = by_key[normalize_symptoms(text)]
+        results.append((dict(result) if result is not None else None, error))
+    return results
+
+
+def stream_medical_analysis(symptoms_text):
+    """Yields (event, data) pairs as the analysis is generated.
+
+    is_emergency comes first, then each condition, then recommendations,
+    and finally ('done', full_result) - or ('error', ANALYSIS_ERROR).
     """
-    
+    red_flags = screen_red_flags(symptoms_text)
+    if red_flags and app.config['PRESCREEN_MODE'] == 'immediate':
+        response = emergency_response(red_flags)
+        yield from _analysis_events(response)
+        yield 'done', response
+        return
+    if not red_flags:
+        yield from _stream_analysis(symptoms_text)
+        return
+
+    # The emergency flag goes out before the model has produced anything
+    yield 'is_emergency', 'true'
+    yield 'red_flags', red_flags
+    for event, data in _stream_analysis(symptoms_text):
+        if event == 'is_emergency':
+            continue
+        if event == 'done':
+            data = dict(data, is_emergency='true', red_flags=red_flags)
+        elif event == 'error':
+            event, data = 'done', emergency_response(red_flags)
+        yield event, data
+
+
+def _stream_analysis(symptoms_text):
+    cache_key, signature, cached = _lookup_cached(symptoms_text)
+    if cached is not None:
+        yield from _analysis_events(cached)
+        yield 'done', cached
+        return
+
+    parser = AnalysisStreamParser()
+    validated = StreamValidator()
+    sent = False
+    started = time.perf_counter()
+    chunk = None
+    try:
+        for chunk in models.generate_content_stream(
+            model=MODEL_ID,
+            contents=build_prompt(symptoms_text),
+            config=generation_config(),
+        ):
+            for event in validated(parser.feed(chunk.text or '')):
+                sent = True
+                yield event
+        GEMINI_LATENCY.observe(time.perf_counter() - started, 'stream')
+        # Usage metadata comes with the final chunk
+        record_usage(chunk)
+        result = validate_analysis(parser.close())
+    except Exception as e:
+        if isinstance(e, ValueError):
+            GEMINI_PARSE_FAILURES.inc('stream')
+        else:
+            GEMINI_FAILURES.inc('stream')
+        logging.error(f"AI Error: {e}")
+        if sent:
+            # The client drops what it has shown so far; the local answer (or the error) replaces it
+            yield 'reset', {}
+        local = local_triage(symptoms_text)[0]
+        if local is None:
+            yield 'error', ANALYSIS_ERROR
+            return
+        yield from _analysis_events(local)
+        yield 'done', local
+        return
+
+    _store(cache_key, symptoms_text, signature, result)
+    yield 'done', result
+
+
+def _analysis_events(result):
+    """Replay a finished analysis in streaming order"""
+    if 'is_emergency' in result:
+        yield 'is_emergency', result['is_emergency']
+    for condition in result.get('possible_conditions', []):
+        yield 'condition', condition
+    for key, value in result.items():
+        if key not in ('is_emergency', 'possible_conditions'):
+            yield key, value
+
+
+def build_prompt(symptoms_text):
+    # Instructions and output format live in generation_config(), the request only carries the symptoms
+    return f"Symptoms: {symptoms_text}"
+
+
+def generate_medical_analysis(symptoms_text):
     try:
         # Generate content using the new SDK method
-        response = client.models.generate_content(
-            model=model_id,
-            contents=prompt
+        with GEMINI_LATENCY.time('generate'):
+            response = models.generate_content(
+                model=MODEL_ID,
+                contents=build_prompt(symptoms_text),
+                config=generation_config(),
+            )
+    except Exception as e:
+        GEMINI_FAILURES.inc('generate')
+        logging.error(f"AI Error: {e}")
+        return dict(ANALYSIS_ERROR)
+
+    record_usage(response)
+    try:
+        # JSON mode returns the bare object; the parser still tolerates fences and stray text
+        return validate_analysis(parse_analysis(response.text))
+    except Exception as e:
+        GEMINI_PARSE_FAILURES.inc('generate')
+        logging.error(f"AI Error: unusable model output: {e}")
+        return dict(ANALYSIS_ERROR)
+
+
+# ==========================================
+# ASYNC ANALYSIS (asgi.py)
+# ==========================================
+# The same pipeline on the event loop. Cache, pre-screen and triage are quick
+# but can block (SQLite tier, catalog load), so they run on the loop's
+# executor; the model call awaits client.aio without holding a thread.
+
+# cache key -> task of the model call, so concurrent identical requests share it
+_async_flights = {}
+
+
+async def get_medical_analysis_async(symptoms_text):
+    """get_medical_analysis for the event loop"""
+    red_flags = screen_red_flags(symptoms_text)
+    if red_flags and app.config['PRESCREEN_MODE'] == 'immediate':
+        return emergency_response(red_flags)
+    return _with_red_flags(await _analyze_async(symptoms_text), red_flags)
+
+
+async def _analyze_async(symptoms_text):
+    cache_key, signature, cached = await asyncio.to_thread(_lookup_cached, symptoms_text)
+    if cached is not None:
+        return cached
+
+    if app.config['TRIAGE_MODE'] == 'fastpath':
+        local, score = await asyncio.to_thread(local_triage, symptoms_text)
+        if local is not None and score >= app.config['TRIAGE_FASTPATH_SCORE']:
+            return local
+
+    flight = _async_flights.get(cache_key)
+    if flight is None:
+        flight = asyncio.ensure_future(_generate_and_store_async(cache_key, symptoms_text, signature))
+        _async_flights[cache_key] = flight
+        flight.add_done_callback(lambda _: _async_flights.pop(cache_key, None))
+    # shield: one caller going away must not cancel the call the others wait on
+    result = dict(await asyncio.shield(flight))
+    if "error_msg" in result:
+        local, _ = await asyncio.to_thread(local_triage, symptoms_text)
+        if local is not None:
+            return local
+    return result
+
+
+async def _generate_and_store_async(cache_key, symptoms_text, signature):
+    result = await generate_medical_analysis_async(symptoms_text)
+    await asyncio.to_thread(_store, cache_key, symptoms_text, signature, result)
+    return result
+
+
+async def generate_medical_analysis_async(symptoms_text):
+    started = time.perf_counter()
+    try:
+        response = await models.generate_content_async(
+            model=MODEL_ID,
+            contents=build_prompt(symptoms_text),
+            config=generation_config(),
         )
-        # The new SDK provides a clean way to handle text
-        json_text = response.text.strip().replace('```json', '').replace('```', '')
-        
-        return json.loads(json_text)
     except Exception as e:
-        logging.info()(f"AI Error: {e}")
-        return {
-            "error_msg": "Please try again later or consult a professional.",
-        }
\ No newline at end of file
+        GEMINI_FAILURES.inc('generate')
+        logging.error(f"AI Error: {e}")
+        return dict(ANALYSIS_ERROR)
+    finally:
+        GEMINI_LATENCY.observe(time.perf_counter() - started, 'generate')
+
+    record_usage(response)
+    try:
+        return validate_analysis(parse_analysis(response.text))
+    except Exception as e:
+        GEMINI_PARSE_FAILURES.inc('generate')
+        logging.error(f"AI Error: unusable model output: {e}")
+        return dict(ANALYSIS_ERROR)
@@ -0,0 +1,213 @@
+# ==========================================
+# INCREMENTAL PARSER FOR MODEL JSON OUTPUT
+# ==========================================
+
+import re
+
+from jsonprovider import loads
+
+MAX_CONDITIONS = 5
+_CONFIDENCE = re.compile(r"^\s*(\d{1,3})(?:\.\d+)?\s*%?\s*$")
+
+
+class AnalysisStreamParser:
+    """Parses the model's JSON object as it arrives in arbitrary chunks.
+
+    Text before the opening brace (e.g. a ```json fence) and after the closing brace is
+    ignored. feed() returns (key, value) events as soon as each top-level value is
+    complete. Items of possible_conditions are emitted one at a time as ('condition', item).
+    """
+
+    def __init__(self):
+        self.result = {}
+        self.done = False
+        self._text = ''
+        self._started = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_role = None
+        self._expect = 'key'  # key -> colon -> value -> in_value -> after_value
+        self._key = None
+        self._key_start = None
+        self._value_start = None
+        self._item_start = None
+
+    def feed(self, chunk):
+        events = []
+        if self.done or not chunk:
+            return events
+        start = len(self._text)
+        self._text += chunk
+        for i in range(start, len(self._text)):
+            self._step(i, self._text[i], events)
+            if self.done:
+                break
+        return events
+
+    def close(self):
+        """The complete object; raises ValueError if the model output was cut short"""
+        if not self.done:
+            raise ValueError("Incomplete JSON object in model output")
+        return self.result
+
+    def _step(self, i, c, events):
+        if not self._started:
+            if c == '{':
+                self._started = True
+                self._depth = 1
+            return
+
+        if self._in_string:
+            if self._escape:
+                self._escape = False
+            elif c == '\\':
+                self._escape = True
+            elif c == '"':
+                self._in_string = False
+                if self._string_role == 'key':
+                    self._key = loads(self._text[self._key_start:i + 1])
+                    self._expect = 'colon'
+                elif self._string_role == 'value':
+                    self._finish_value(self._text[self._value_start:i + 1], events)
+            return
+
+        if c == '"':
+            self._in_string = True
+            self._string_role = None
+            if self._depth == 1 and self._expect == 'key':
+                self._string_role = 'key'
+                self._key_start = i
+            elif self._depth == 1 and self._expect == 'value':
+                self._string_role = 'value'
+                self._value_start = i
+                self._expect = 'in_value'
+            return
+
+        if c.isspace():
+            return
+
+        if self._depth == 1 and self._expect == 'value':
+            self._value_start = i
+            self._expect = 'in_value'
+
+        if c in '{[':
+            self._depth += 1
+            if self._depth == 3 and c == '{' and self._key == 'possible_conditions':
+                self._item_start = i
+        elif c in '}]':
+            self._depth -= 1
+            if self._depth == 2 and self._item_start is not None:
+                events.append(('condition', loads(self._text[self._item_start:i + 1])))
+                self._item_start = None
+            elif self._depth == 1 and self._expect == 'in_value':
+                self._finish_value(self._text[self._value_start:i + 1], events)
+            elif self._depth == 0:
+                if self._expect == 'in_value':
+                    self._finish_value(self._text[self._value_start:i], events)
+                self.done = True
+        elif self._depth == 1:
+            if c == ':' and self._expect == 'colon':
+                self._expect = 'value'
+            elif c == ',':
+                if self._expect == 'in_value':
+                    self._finish_value(self._text[self._value_start:i], events)
+                self._expect = 'key'
+
+    def _finish_value(self, raw, events):
+        value = loads(raw)
+        self.result[self._key] = value
+        # Conditions have already gone out one by one
+        if self._key != 'possible_conditions':
+            events.append((self._key, value))
+        self._expect = 'after_value'
+
+
+def parse_analysis(text):
+    """Parse a complete model response"""
+    # Well-formed output (the usual case) goes through the JSON library in one call;
+    # the character-level parser is only needed to salvage malformed or truncated text
+    start, end = text.find('{'), text.rfind('}')
+    if start != -1 and end > start:
+        try:
+            result = loads(text[start:end + 1])
+            if isinstance(result, dict):
+                return result
+        except ValueError:
+            pass
+    parser = AnalysisStreamParser()
+    parser.feed(text)
+    return parser.close()
+
+
+def validate_analysis(result):
+    """Check a parsed analysis against the response schema and return it normalized.
+
+    is_emergency becomes "true"/"false", confidences "NN%", at most MAX_CONDITIONS
+    conditions are kept and unknown keys are dropped. Raises ValueError otherwise.
+    """
+    if not isinstance(result, dict):
+        raise ValueError("Analysis is not a JSON object")
+    conditions = result.get('possible_conditions')
+    if not isinstance(conditions, list):
+        raise ValueError("possible_conditions must be a list")
+    return {
+        'is_emergency': validate_emergency(result.get('is_emergency')),
+        'possible_conditions': [validate_condition(item) for item in conditions[:MAX_CONDITIONS]],
+        'recommendations': validate_recommendations(result.get('recommendations')),
+    }
+
+
+def validate_emergency(emergency):
+    if isinstance(emergency, bool):
+        emergency = 'true' if emergency else 'false'
+    if emergency not in ('true', 'false'):
+        raise ValueError(f"is_emergency must be 'true' or 'false', got {emergency!r}")
+    return emergency
+
+
+def validate_condition(item):
+    """One possible_conditions item as {'name', 'confidence': "NN%"}"""
+    name = item.get('name') if isinstance(item, dict) else None
+    if not isinstance(name, str) or not name.strip():
+        raise ValueError(f"Condition without a name: {item!r}")
+    confidence = item.get('confidence')
+    if isinstance(confidence, float) and 0 <= confidence <= 1:
+        confidence = round(confidence * 100)  # a fraction, e.g. 0.7
+    match = _CONFIDENCE.match(str(confidence)) if isinstance(confidence, (str, int, float)) else None
+    if match is None or int(match.group(1)) > 100:
+        raise ValueError(f"Bad confidence for {name!r}: {confidence!r}")
+    return {'name': name.strip(), 'confidence': f"{int(match.group(1))}%"}
+
+
+def validate_recommendations(recommendations):
+    if not isinstance(recommendations, str) or not recommendations.strip():
+        raise ValueError("recommendations must be a non-empty string")
+    return recommendations.strip()
+
+
+class StreamValidator:
+    """Normalizes parser events as they go out, the same way validate_analysis normalizes the whole.
+
+    Unknown keys and conditions past MAX_CONDITIONS are dropped; a bad value raises ValueError.
+    """
+
+    _VALIDATORS = {
+        'is_emergency': validate_emergency,
+        'condition': validate_condition,
+        'recommendations': validate_recommendations,
+    }
+
+    def __init__(self):
+        self.conditions = 0
+
+    def __call__(self, events):
+        for event, value in events:
+            validate = self._VALIDATORS.get(event)
+            if validate is None:
+                continue
+            if event == 'condition':
+                if self.conditions >= MAX_CONDITIONS:
+                    continue
+                self.conditions += 1
+            yield event, validate(value)
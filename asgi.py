@@ -0,0 +1,276 @@
+# ==========================================
+# ASGI SERVER
+# ==========================================
+# python main.py serve-asgi                      - uvicorn with the SERVER_* settings
+#
+# POST /api/analyze is answered on the event loop with the asyncio Gemini
+# client, so a worker holds up to ASGI_MAX_IN_FLIGHT analyses instead of one
+# per thread. Every other route (auth, streaming, batch, jobs, ...) is the
+# Flask app, run on a thread pool through WsgiBridge.
+
+import asyncio
+import contextvars
+import io
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
+
+import ai
+from boottime import boot
+from config import app, load_shedder, rate_limiter
+from jsonprovider import loads
+from metrics import HTTP_LATENCY, HTTP_REQUESTS, registry
+from server import create_app, shutdown, start_background_tasks
+
+_DONE = object()
+
+
+async def read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            break
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            break
+    return b''.join(chunks)
+
+
+def wsgi_environ(scope, body):
+    """PEP 3333 environ for an ASGI http scope"""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope['headers']:
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            if name == 'CONTENT_TYPE':
+                environ[name] = value
+            continue
+        key = f'HTTP_{name}'
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+def _header_pairs(headers):
+    return [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers.items()]
+
+
+class WsgiBridge:
+    """Runs a WSGI app on a thread pool; streamed bodies (SSE) are sent chunk by chunk"""
+
+    def __init__(self, wsgi_app, executor):
+        self.wsgi_app = wsgi_app
+        self.executor = executor
+
+    async def __call__(self, scope, receive, send):
+        loop = asyncio.get_running_loop()
+        environ = wsgi_environ(scope, await read_body(receive))
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started['status'] = int(status.split(' ', 1)[0])
+            started['headers'] = [(name.encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+            return lambda data: None  # the write() callable; Flask never uses it
+
+        # One context for the whole response: a streamed body pushes Flask's context in one
+        # pool thread and pops it in another, and both must see the same context variables
+        context = contextvars.Context()
+        body = await loop.run_in_executor(self.executor, context.run, self.wsgi_app, environ, start_response)
+        try:
+            chunks = iter(body)
+            await send({'type': 'http.response.start', 'status': started['status'], 'headers': started['headers']})
+            while True:
+                chunk = await loop.run_in_executor(self.executor, context.run, next, chunks, _DONE)
+                if chunk is _DONE:
+                    break
+                if chunk:
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            close = getattr(body, 'close', None)
+            if close is not None:
+                await loop.run_in_executor(self.executor, context.run, close)
+
+
+def authenticate(authorization):
+    """(user id, None), or (None, Flask response) - the checks of @jwt_required, revocation included"""
+    headers = {'Authorization': authorization} if authorization else {}
+    with app.test_request_context('/api/analyze', method='POST', headers=headers):
+        try:
+            verify_jwt_in_request()
+            return get_jwt_identity(), None
+        except Exception as e:
+            return None, app.make_response(app.handle_user_exception(e))
+
+
+class MedicueASGI:
+    def __init__(self, max_in_flight=1000, threads=32, shed_capacity=32):
+        self.max_in_flight = max_in_flight
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='asgi')
+        self.flask = WsgiBridge(create_app(), self.executor)
+        self.shed_capacity = shed_capacity
+        self.slots = None
+        self.started = False
+        self.in_flight = 0
+        registry.gauge('medicue_asgi_analyses_in_flight', 'Analyses awaiting the model on the event loop',
+                       lambda: self.in_flight)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return  # no websockets
+        if not self.started:
+            self._start()  # a server that doesn't send lifespan events
+        if scope['path'] == '/api/analyze' and scope['method'] == 'POST' and not self._wants_job(scope):
+            await self.analyze(scope, receive, send)
+        else:
+            await self.flask(scope, receive, send)
+
+    @staticmethod
+    def _wants_job(scope):
+        # ?mode=async queues a background job - that is the Flask route's business
+        return parse_qs(scope.get('query_string', b'').decode('latin-1')).get('mode') == ['async']
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                try:
+                    await self.startup()
+                except Exception as e:
+                    await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                    return
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await asyncio.to_thread(shutdown)
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def _start(self):
+        """Per-process set-up, at lifespan start-up or else on the first request"""
+        self.started = True
+        # asyncio.to_thread (cache, triage) uses this pool too
+        asyncio.get_running_loop().set_default_executor(self.executor)
+        self.slots = asyncio.Semaphore(self.max_in_flight)
+        # The Flask routes share the thread pool; native analyses don't hold a thread
+        load_shedder.capacity = self.shed_capacity
+        start_background_tasks()
+
+    async def startup(self):
+        self._start()
+        # Import the SDK before taking traffic rather than on the event loop
+        await asyncio.to_thread(ai.warm_up)
+        boot.ready()
+
+    async def analyze(self, scope, receive, send):
+        """POST /api/analyze, same answers as the Flask route"""
+        started = time.perf_counter()
+        headers = {name.decode('latin-1').lower(): value.decode('latin-1') for name, value in scope['headers']}
+        body = await read_body(receive)
+
+        user_id, error = await asyncio.to_thread(authenticate, headers.get('authorization'))
+        limit = None
+        if error is None and rate_limiter.enabled:
+            if rate_limiter.buckets.blocking:
+                limit = await asyncio.to_thread(rate_limiter.check, user_id)
+            else:
+                limit = rate_limiter.check(user_id)
+        token = None
+        if error is None and (limit is None or limit.allowed) and load_shedder.enabled:
+            token = load_shedder.try_acquire('analysis', uses_thread=False)
+        if error is not None:
+            status = error.status_code
+            await self._respond(send, status, error.get_data(), error.headers.get('Content-Type', 'application/json'))
+        elif limit is not None and not limit.allowed:
+            status = 429
+            body = (app.json.dumps({"error": "Rate limit exceeded, please retry later"}) + "\n").encode('utf-8')
+            await self._respond(send, status, body, 'application/json', _header_pairs(limit.headers()))
+        elif load_shedder.enabled and token is None:
+            status = 503
+            body = (app.json.dumps({"error": "Server busy, please retry later"}) + "\n").encode('utf-8')
+            await self._respond(send, status, body, 'application/json', [(b'retry-after', b'1')])
+        else:
+            failed = True
+            try:
+                status, result = await self._analysis(user_id, body)
+                failed = False
+            finally:
+                if token is not None:
+                    load_shedder.release(token, failed=failed)
+            await self._respond(send, status, (app.json.dumps(result) + "\n").encode('utf-8'), 'application/json',
+                                _header_pairs(limit.headers()) if limit is not None else ())
+
+        HTTP_REQUESTS.inc('/api/analyze', 'POST', str(status))
+        HTTP_LATENCY.observe(time.perf_counter() - started, '/api/analyze', 'POST')
+        if boot.first_request_seconds is None:
+            boot.request_done(started)
+
+    async def _analysis(self, user_id, body):
+        from endpoints import has_symptoms, record_analysis
+
+        try:
+            data = loads(body) if body else None
+        except ValueError:
+            data = None
+        if not isinstance(data, dict):
+            return 400, {"error": "Request body must be a JSON object"}
+        symptoms_text = data.get('symptoms_text')
+        if not has_symptoms(symptoms_text):
+            return 400, {"error": "No symptoms provided"}
+
+        async with self.slots:
+            self.in_flight += 1
+            try:
+                result = await ai.get_medical_analysis_async(symptoms_text)
+            finally:
+                self.in_flight -= 1
+        # Queued in memory - the response doesn't wait for the history write
+        record_analysis(user_id, symptoms_text, result)
+        return 200, result
+
+    @staticmethod
+    async def _respond(send, status, body, content_type, extra_headers=()):
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [
+                (b'content-type', content_type.encode('latin-1')),
+                (b'content-length', str(len(body)).encode('latin-1')),
+                (b'access-control-allow-origin', b'*'),
+                *extra_headers,
+            ],
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+
+application = MedicueASGI(
+    max_in_flight=app.config['ASGI_MAX_IN_FLIGHT'],
+    threads=app.config['ASGI_THREADS'],
+    shed_capacity=app.config['ASGI_LOAD_SHED_CAPACITY'],
+)
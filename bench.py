@@ -0,0 +1,536 @@
+# ==========================================
+# MICRO-BENCHMARKS
+# ==========================================
+# python bench.py <benchmark> [options] - prints a JSON report on stdout.
+# The Gemini client is swapped for an in-process fake with a fixed latency,
+# so no API key or network is needed.
+
+import argparse
+import itertools
+import json
+import random
+import statistics
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+FAKE_REPLY = json.dumps({
+    "is_emergency": "false",
+    "possible_conditions": [{"name": "Common Cold", "confidence": "70%"}],
+    "recommendations": "Rest, fluids and over-the-counter medication. See a doctor if symptoms persist.",
+})
+
+
+class FakeModels:
+    """Stands in for ai.client.models"""
+
+    def __init__(self, latency_ms):
+        self.latency = latency_ms / 1000.0
+
+    def generate_content(self, model, contents, **kwargs):
+        time.sleep(self.latency)
+        return SimpleNamespace(text=FAKE_REPLY)
+
+    def generate_content_stream(self, model, contents, **kwargs):
+        time.sleep(self.latency)
+        yield SimpleNamespace(text=FAKE_REPLY)
+
+
+def _fake_ai(latency_ms):
+    """The ai module wired to the fake model, with the caches out of the way"""
+    import ai
+    ai.client = SimpleNamespace(models=FakeModels(latency_ms))
+    ai.semantic_cache = None
+    ai.analysis_cache.clear()
+    return ai
+
+
+def _unique_texts(count):
+    run = uuid.uuid4().hex[:8]
+    return [f"report {run} {i}" for i in range(count)]
+
+
+# ==========================================
+# BENCHMARKS
+# ==========================================
+
+def bench_batch(args):
+    """Batch fan-out vs one get_medical_analysis call after another"""
+    ai = _fake_ai(args.latency_ms)
+
+    texts = _unique_texts(args.size)
+    start = time.perf_counter()
+    for text in texts:
+        ai.get_medical_analysis(text)
+    sequential = time.perf_counter() - start
+
+    texts = _unique_texts(args.size)
+    start = time.perf_counter()
+    ai.get_medical_analyses(texts, args.concurrency)
+    batched = time.perf_counter() - start
+
+    return {
+        'size': args.size,
+        'concurrency': args.concurrency,
+        'model_latency_ms': args.latency_ms,
+        'sequential_seconds': sequential,
+        'sequential_items_per_second': args.size / sequential,
+        'batch_seconds': batched,
+        'batch_items_per_second': args.size / batched,
+        'speedup': sequential / batched,
+    }
+
+
+def bench_prescreen(args):
+    """Red-flag pre-screen latency on long inputs, while another thread keeps reloading the lexicon"""
+    from prescreen import DEFAULT_LEXICON, EmergencyPrescreen
+
+    screen = EmergencyPrescreen()
+    filler = "mild fever and a runny nose for three days, no chest pain, some coughing at night. "
+    text = (filler * (args.chars // len(filler) + 1))[:args.chars] + " now I can't breathe"
+    expected = screen.scan(text)
+
+    stop = threading.Event()
+
+    def reload_loop():
+        while not stop.wait(args.reload_interval_ms / 1000.0):
+            screen.reload(DEFAULT_LEXICON)
+
+    reloader = threading.Thread(target=reload_loop, daemon=True)
+    if args.reload_interval_ms > 0:
+        reloader.start()
+
+    timings = []
+    mismatches = 0
+    for _ in range(args.iterations):
+        start = time.perf_counter()
+        flags = screen.scan(text)
+        timings.append((time.perf_counter() - start) * 1000)
+        if flags != expected:
+            mismatches += 1
+    stop.set()
+
+    timings.sort()
+    return {
+        'chars': len(text),
+        'iterations': args.iterations,
+        'concurrent_reloads': screen.reloads - 1,
+        'flags': expected,
+        'mismatches': mismatches,
+        'p50_ms': statistics.median(timings),
+        'p99_ms': timings[int(len(timings) * 0.99) - 1],
+        'max_ms': timings[-1],
+        'p99_under_1ms': timings[int(len(timings) * 0.99) - 1] < 1.0,
+    }
+
+
+def _probe_latencies(stop, interval=0.005):
+    """How late a tiny task runs while the benchmark is busy - stands in for other endpoints"""
+    delays = []
+    while not stop.is_set():
+        start = time.perf_counter()
+        sum(range(1000))
+        time.sleep(interval)
+        delays.append((time.perf_counter() - start - interval) * 1000)
+    return delays
+
+
+def bench_login(args):
+    """Login (bcrypt check) throughput at several hashing pool sizes"""
+    from passwords import PasswordHasher, _hash_password
+
+    pw_hash = _hash_password('correct horse', args.rounds)
+    report = {'rounds': args.rounds, 'logins': args.logins, 'concurrency': args.concurrency, 'pools': []}
+    for workers in args.pool_sizes:
+        hasher = PasswordHasher(rounds=args.rounds, workers=workers, max_pending=args.concurrency, timeout=120)
+        # Warm the pool so process start-up isn't counted
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as warm:
+            list(warm.map(lambda _: hasher.check(pw_hash, 'correct horse'), range(max(1, workers))))
+
+        stop = threading.Event()
+        probe = ThreadPoolExecutor(max_workers=1)
+        probe_result = probe.submit(_probe_latencies, stop)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as clients:
+            ok = sum(clients.map(lambda _: hasher.check(pw_hash, 'correct horse'), range(args.logins)))
+        elapsed = time.perf_counter() - start
+
+        stop.set()
+        delays = sorted(probe_result.result())
+        probe.shutdown()
+        hasher.shutdown()
+        report['pools'].append({
+            'workers': workers,
+            'seconds': elapsed,
+            'logins_per_second': args.logins / elapsed,
+            'successful': ok,
+            'other_request_delay_p50_ms': statistics.median(delays) if delays else 0.0,
+            'other_request_delay_max_ms': delays[-1] if delays else 0.0,
+        })
+    return report
+
+
+def _time_per_call(fn, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def bench_json(args):
+    """Serialization time and bytes on the wire: default provider vs the fast one, identity vs gzip/brotli"""
+    from flask.json.provider import DefaultJSONProvider
+
+    import jsonprovider
+    from analysis_parser import AnalysisStreamParser, parse_analysis
+    from compression import compress, encodings
+    from config import app
+
+    sentences = [
+        "Rest and drink plenty of fluids.", "Take paracetamol for a fever above 38C.",
+        "See a doctor if symptoms last longer than a week.", "Seek urgent care if breathing becomes difficult.",
+        "Avoid strenuous exercise until the fever settles.", "Keep track of your temperature twice a day.",
+        "Salt water gargles can ease a sore throat.", "Wash your hands often to avoid spreading infection.",
+    ]
+
+    def analysis(seed):
+        rng = random.Random(seed)
+        return {
+            'is_emergency': 'false',
+            'possible_conditions': [{'name': f'Condition {seed}-{i}', 'confidence': f'{rng.randint(10, 95)}%'}
+                                    for i in range(rng.randint(2, 5))],
+            'recommendations': ' '.join(rng.choice(sentences) for _ in range(12)),
+        }
+
+    result = analysis(0)
+    payload = {'results': [{'result': analysis(i)} for i in range(args.items)]}
+    model_output = "```json\n" + json.dumps(result, indent=2) + "\n```"
+
+    default, fast = DefaultJSONProvider(app), jsonprovider.FastJSONProvider(app)
+    body = fast.dumps(payload, separators=(',', ':')).encode('utf-8')
+    report = {
+        'backend': jsonprovider.BACKEND,
+        'items': args.items,
+        'dumps_default_us': _time_per_call(lambda: default.dumps(payload, separators=(',', ':')), args.iterations),
+        'dumps_fast_us': _time_per_call(lambda: fast.dumps(payload, separators=(',', ':')), args.iterations),
+        'loads_default_us': _time_per_call(lambda: default.loads(body), args.iterations),
+        'loads_fast_us': _time_per_call(lambda: fast.loads(body), args.iterations),
+        'model_output_json_loads_us': _time_per_call(
+            lambda: json.loads(model_output[model_output.find('{'):model_output.rfind('}') + 1]), args.iterations),
+        'model_output_char_parser_us': _time_per_call(
+            lambda: (lambda p: (p.feed(model_output), p.close()))(AnalysisStreamParser()), args.iterations),
+        'model_output_parse_analysis_us': _time_per_call(lambda: parse_analysis(model_output), args.iterations),
+        'bytes_identity': len(body),
+    }
+    for encoding in encodings():
+        report[f'bytes_{encoding}'] = len(compress(body, encoding))
+        report[f'compress_{encoding}_us'] = _time_per_call(lambda: compress(body, encoding), args.iterations // 10 or 1)
+    return report
+
+
+# The free-text prompt analyses used before JSON mode, kept as the baseline
+LEGACY_PROMPT = """
+    You are a professional Medical Assistant AI. 
+    Analyze the following symptoms: "{symptoms_text}"
+    
+    You MUST return only a valid JSON object with this exact structure:
+    {{
+        "is_emergency": "true"/"false",
+        "possible_conditions": [
+            {{"name": "Condition Name", "confidence": "0-100%"}}
+        ],
+        "recommendations": "Detailed medical advice and next steps."
+    }}
+    
+    Guidelines:
+    - If symptoms include chest pain or difficulty breathing, set "is_emergency" to true.
+    - Provide recommendations based on standard clinical guidelines. 
+    - Do not include any text before or after the JSON.
+    """
+
+
+def _replay(models, texts, model_id, contents_fn, config):
+    from analysis_parser import parse_analysis, validate_analysis
+
+    latencies, prompt_tokens, output_tokens, failures, errors = [], 0, 0, 0, 0
+    for text in texts:
+        start = time.perf_counter()
+        try:
+            response = models.generate_content(model=model_id, contents=contents_fn(text), config=config)
+        except Exception:
+            errors += 1
+            continue
+        latencies.append((time.perf_counter() - start) * 1000)
+        usage = getattr(response, 'usage_metadata', None)
+        prompt_tokens += getattr(usage, 'prompt_token_count', 0) or 0
+        output_tokens += getattr(usage, 'candidates_token_count', 0) or 0
+        try:
+            validate_analysis(parse_analysis(response.text or ''))
+        except Exception:
+            failures += 1
+    answered = len(latencies) or 1
+    latencies.sort()
+    return {
+        'calls': len(texts),
+        'errors': errors,
+        'parse_failures': failures,
+        'parse_failure_rate': failures / answered,
+        'prompt_tokens_avg': prompt_tokens / answered,
+        'output_tokens_avg': output_tokens / answered,
+        'latency_p50_ms': statistics.median(latencies) if latencies else None,
+        'latency_p95_ms': latencies[int(len(latencies) * 0.95) - 1] if len(latencies) >= 20 else None,
+    }
+
+
+def bench_prompt(args):
+    """Free-text prompt vs JSON mode + schema: request size, and with --live tokens, latency and parse failures"""
+    import ai
+    from semantic_cache import read_queries
+
+    texts = list(itertools.islice(read_queries(args.corpus), args.limit))
+    legacy = lambda text: LEGACY_PROMPT.format(symptoms_text=text)
+    report = {
+        'corpus': args.corpus,
+        'queries': len(texts),
+        'legacy_request_chars_avg': statistics.mean(len(legacy(t)) for t in texts),
+        'structured_request_chars_avg': statistics.mean(
+            len(ai.build_prompt(t)) + len(ai.SYSTEM_INSTRUCTION) for t in texts),
+    }
+    if args.live:
+        # Real client (GEMINI_API_KEY, or GEMINI_BASE_URL for the fake server), without retries or hedging
+        report['legacy'] = _replay(ai.get_client().models, texts, ai.MODEL_ID, legacy, None)
+        report['structured'] = _replay(ai.get_client().models, texts, ai.MODEL_ID, ai.build_prompt, ai.generation_config())
+    return report
+
+
+def bench_inflight(args):
+    """Analyses in flight per worker: gunicorn threads (serve) vs the event loop (serve-asgi)"""
+    from loadtest import Client, Environment, Scenario, run_load, summarize
+
+    report = {'gemini_latency_ms': args.latency_ms, 'workers': 1, 'threads': args.threads, 'modes': {}}
+    for mode in args.modes:
+        settings = SimpleNamespace(
+            mode=mode, target=None, workers=1, threads=args.threads, keep=False, seed=1, users=2,
+            cache_hit_ratio=0.0, semantic_cache=False, rate_limit=False, gemini_latency_ms=args.latency_ms, gemini_sigma=0.0, gemini_error_rate=0.0,
+        )
+        levels = {}
+        with Environment(settings) as environment:
+            scenario = Scenario('analyze', settings)
+            scenario.setup(Client(environment.url))
+            for concurrency in args.concurrency:
+                results, elapsed = run_load(environment.url, scenario, concurrency, args.duration, 0, warmup=1.0)
+                summary = summarize(results.get('POST /api/analyze', []), elapsed)
+                levels[concurrency] = {
+                    'throughput_rps': summary['throughput_rps'],
+                    # Little's law: calls completing per second x seconds each spends at the model
+                    'model_calls_in_flight': round(summary['throughput_rps'] * args.latency_ms / 1000.0, 1),
+                    'latency_p50_ms': summary['latency_ms']['p50'],
+                    'latency_p99_ms': summary['latency_ms']['p99'],
+                    'error_rate': summary['error_rate'],
+                }
+        report['modes'][mode] = levels
+    return report
+
+
+def bench_ratelimit(args):
+    """Token-bucket cost: one check per backend, checks under thread contention, and per request in Flask"""
+    import os
+    import tempfile
+
+    from flask import Flask, jsonify
+    from flask_jwt_extended import JWTManager, create_access_token, jwt_required
+
+    from ratelimit import MemoryBuckets, RateLimiter, SQLiteBuckets, install_rate_limit_headers
+
+    directory = tempfile.mkdtemp(prefix='medicue-bench-')
+    backends = {'memory': MemoryBuckets(), 'sqlite': SQLiteBuckets(os.path.join(directory, 'rate_limits.db'))}
+    # Generous limits: the benchmark measures the bookkeeping, not refusals
+    limiters = {name: RateLimiter(buckets, user_burst=10 ** 9, user_per_minute=10 ** 9,
+                                  global_burst=10 ** 9, global_per_minute=10 ** 9)
+                for name, buckets in backends.items()}
+    users = [str(i) for i in range(args.users)]
+    report = {'users': args.users, 'iterations': args.iterations, 'threads': args.threads, 'backends': {}}
+
+    for name, limiter in limiters.items():
+        keys = itertools.cycle(users)
+        per_check = _time_per_call(lambda: limiter.check(next(keys)), args.iterations)
+
+        def worker(count):
+            for i in range(count):
+                limiter.check(users[i % len(users)])
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.threads) as pool:
+            list(pool.map(worker, [args.iterations // args.threads] * args.threads))
+        elapsed = time.perf_counter() - start
+        report['backends'][name] = {
+            'check_us': round(per_check, 2),
+            'checks_per_second_threaded': round(args.iterations // args.threads * args.threads / elapsed),
+        }
+
+    # A request through Flask and flask_jwt_extended, with and without the decorator and its headers
+    app = Flask('bench')
+    app.config['JWT_SECRET_KEY'] = 'bench-' + uuid.uuid4().hex
+    JWTManager(app)
+    install_rate_limit_headers(app)
+    for name, limiter in [('none', None)] + list(limiters.items()):
+        view = jwt_required()(lambda: jsonify({'ok': True}))
+        if limiter is not None:
+            view = jwt_required()(limiter.limit()(lambda: jsonify({'ok': True})))
+        app.add_url_rule(f'/{name}', name, view, methods=['POST'])
+    with app.app_context():
+        headers = {'Authorization': f"Bearer {create_access_token(identity='1')}"}
+    client = app.test_client()
+    # Test-client requests vary by more than the limiter costs: interleave the routes, keep each one's best round
+    rounds, requests = 7, max(1, args.iterations // 70)
+    per_request = {name: float('inf') for name in ['none'] + list(limiters)}
+    for _ in range(rounds):
+        for name in per_request:
+            per_request[name] = min(per_request[name],
+                                    _time_per_call(lambda: client.post(f'/{name}', headers=headers), requests))
+    report['request_us'] = {name: round(us, 1) for name, us in per_request.items()}
+    report['overhead_per_request_us'] = {name: round(per_request[name] - per_request['none'], 1) for name in limiters}
+    return report
+
+
+def bench_history(args):
+    """History write cost on the request path: insert + commit per analysis vs the write-behind buffer"""
+    import os
+    import tempfile
+
+    from sqlalchemy import Column, Float, Integer, MetaData, String, Table, Text, create_engine, func, insert, select
+
+    from writebehind import WriteBehindBuffer
+
+    directory = tempfile.mkdtemp(prefix='medicue-bench-')
+    engine = create_engine(f"sqlite:///{os.path.join(directory, 'history.db')}")
+    table = Table(
+        'history_record', MetaData(),
+        Column('history_id', Integer, primary_key=True),
+        Column('record_uuid', String(32), unique=True, nullable=False),
+        Column('user_id', Integer, nullable=False, index=True),
+        Column('symptoms_text', Text, nullable=False),
+        Column('final_confidence_score', Float),
+        Column('result', Text, nullable=False),
+    )
+    table.metadata.create_all(engine)
+    statement = insert(table).prefix_with('OR IGNORE')
+
+    def record():
+        return {'record_uuid': uuid.uuid4().hex, 'user_id': random.randint(1, 1000),
+                'symptoms_text': 'headache and a mild fever since yesterday', 'final_confidence_score': 70.0,
+                'result': FAKE_REPLY}
+
+    def write(records):
+        with engine.begin() as connection:
+            connection.execute(statement, records)
+
+    def request_times(save):
+        # What an analysis request spends on its history row, per request thread
+        times, lock = [], threading.Lock()
+
+        def worker(count):
+            local = []
+            for _ in range(count):
+                started = time.perf_counter()
+                save(record())
+                local.append((time.perf_counter() - started) * 1e6)
+            with lock:
+                times.extend(local)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.threads) as pool:
+            list(pool.map(worker, [args.records // args.threads] * args.threads))
+        return sorted(times), time.perf_counter() - start
+
+    def summary(times):
+        return {'p50_us': round(times[len(times) // 2], 1), 'p99_us': round(times[int(len(times) * 0.99)], 1),
+                'max_us': round(times[-1], 1)}
+
+    report = {'records': args.records, 'threads': args.threads, 'flush_size': args.flush_size}
+    times, elapsed = request_times(lambda row: write([row]))
+    report['inline'] = dict(summary(times), rows_per_second=round(len(times) / elapsed))
+
+    buffer = WriteBehindBuffer(write, flush_size=args.flush_size, flush_interval=0.05, max_pending=args.records)
+    buffer.start()
+    times, _ = request_times(buffer.add)
+    start = time.perf_counter()
+    buffer.shutdown(timeout=60)
+    stats = buffer.stats()
+    report['write_behind'] = dict(summary(times), drain_seconds=round(time.perf_counter() - start, 3),
+                                  batches=stats['batches'], batch_size_avg=round(stats['batch_size_avg'], 1),
+                                  flush_ms_avg=round(stats['flush_time_avg'] * 1000, 2))
+    with engine.connect() as connection:
+        # Both runs together - every accepted record written once
+        report['rows_written'] = connection.execute(select(func.count()).select_from(table)).scalar()
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Medicue micro-benchmarks")
+    commands = parser.add_subparsers(dest='benchmark', required=True)
+
+    batch = commands.add_parser('batch', help=bench_batch.__doc__)
+    batch.add_argument('--size', type=int, default=20)
+    batch.add_argument('--concurrency', type=int, default=8)
+    batch.add_argument('--latency-ms', type=float, default=500.0)
+    batch.set_defaults(run=bench_batch)
+
+    prescreen = commands.add_parser('prescreen', help=bench_prescreen.__doc__)
+    prescreen.add_argument('--chars', type=int, default=5000)
+    prescreen.add_argument('--iterations', type=int, default=2000)
+    prescreen.add_argument('--reload-interval-ms', type=float, default=20.0,
+                           help="reload the lexicon from another thread this often (0 disables)")
+    prescreen.set_defaults(run=bench_prescreen)
+
+    login = commands.add_parser('login', help=bench_login.__doc__)
+    login.add_argument('--pool-sizes', type=lambda v: [int(n) for n in v.split(',')], default=[0, 1, 2, 4],
+                       help="comma separated hashing pool sizes, 0 = inline")
+    login.add_argument('--logins', type=int, default=64)
+    login.add_argument('--concurrency', type=int, default=16)
+    login.add_argument('--rounds', type=int, default=12)
+    login.set_defaults(run=bench_login)
+
+    json_bench = commands.add_parser('json', help=bench_json.__doc__)
+    json_bench.add_argument('--items', type=int, default=20, help="analysis results in the payload (a batch response)")
+    json_bench.add_argument('--iterations', type=int, default=2000)
+    json_bench.set_defaults(run=bench_json)
+
+    prompt = commands.add_parser('prompt', help=bench_prompt.__doc__)
+    prompt.add_argument('corpus', help="past queries, one per line (plain text or JSON with symptoms_text)")
+    prompt.add_argument('--limit', type=int, default=200)
+    prompt.add_argument('--live', action='store_true', help="call the model with both prompts (uses the API quota)")
+    prompt.set_defaults(run=bench_prompt)
+
+    inflight = commands.add_parser('inflight', help=bench_inflight.__doc__)
+    inflight.add_argument('--concurrency', type=lambda v: [int(n) for n in v.split(',')], default=[8, 64, 256],
+                          help="comma separated client concurrency levels")
+    inflight.add_argument('--latency-ms', type=float, default=1000.0, help="fake model latency")
+    inflight.add_argument('--duration', type=float, default=8.0, help="measured seconds per level")
+    inflight.add_argument('--threads', type=int, default=8, help="gunicorn threads per worker")
+    inflight.add_argument('--modes', type=lambda v: v.split(','), default=['wsgi', 'asgi'])
+    inflight.set_defaults(run=bench_inflight)
+
+    ratelimit = commands.add_parser('ratelimit', help=bench_ratelimit.__doc__)
+    ratelimit.add_argument('--iterations', type=int, default=20000)
+    ratelimit.add_argument('--users', type=int, default=1000, help="distinct user buckets")
+    ratelimit.add_argument('--threads', type=int, default=8)
+    ratelimit.set_defaults(run=bench_ratelimit)
+
+    history = commands.add_parser('history', help=bench_history.__doc__)
+    history.add_argument('--records', type=int, default=4000)
+    history.add_argument('--threads', type=int, default=8, help="request threads writing history")
+    history.add_argument('--flush-size', type=int, default=200)
+    history.set_defaults(run=bench_history)
+
+    args = parser.parse_args(argv)
+    json.dump(args.run(args), sys.stdout, indent=2)
+    print()
+
+
+if __name__ == '__main__':
+    main()
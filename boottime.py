@@ -0,0 +1,177 @@
+# ==========================================
+# START-UP TIMING
+# ==========================================
+# Seconds spent in each start-up phase (config import, routes, database
+# check, ...) and the time to the first request of a process, logged once
+# and exported on /metrics so cold-start regressions show up.
+#
+#   python boottime.py                      - per-module import report of a fresh interpreter
+#   python boottime.py --max-seconds 1.5    - exit 1 when a cold start takes longer (CI)
+#
+# Import this module before config so the clock starts with the process.
+
+import time
+
+STARTED = time.perf_counter()
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+from contextlib import contextmanager
+
+from flask import g
+
+
+class BootTimer:
+    def __init__(self, started=None):
+        self.started = STARTED if started is None else started
+        self.phases = {}
+        self.ready_seconds = None
+        self.first_request_seconds = None  # from start to the end of the first response
+        self.first_request_duration = None  # of that request alone - lazy initialisation shows up here
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - started
+
+    def mark(self, name):
+        """Record the time since start-up began as phase `name` (for work done before the timer existed)"""
+        self.phases[name] = time.perf_counter() - self.started
+
+    def ready(self):
+        """The process can serve requests now"""
+        self.ready_seconds = time.perf_counter() - self.started
+        phases = ', '.join(f"{name} {seconds:.2f}s" for name, seconds in self.phases.items())
+        print(f"Ready in {self.ready_seconds:.2f}s ({phases})")
+
+    def request_done(self, request_started):
+        if self.first_request_seconds is not None:
+            return
+        with self._lock:
+            if self.first_request_seconds is not None:
+                return
+            now = time.perf_counter()
+            self.first_request_duration = now - request_started
+            self.first_request_seconds = now - self.started
+        print(f"First request answered {self.first_request_seconds:.2f}s after start "
+              f"(took {self.first_request_duration:.3f}s)")
+
+    def reset_after_fork(self):
+        """A forked worker starts its own clock; the master's phases stay for reference"""
+        self.started = time.perf_counter()
+        self.ready_seconds = None
+        self.first_request_seconds = None
+        self.first_request_duration = None
+
+    def report(self):
+        return {
+            'phases_seconds': {name: round(seconds, 4) for name, seconds in self.phases.items()},
+            'ready_seconds': self.ready_seconds,
+            'first_request_seconds': self.first_request_seconds,
+            'first_request_duration_seconds': self.first_request_duration,
+        }
+
+
+boot = BootTimer()
+
+
+def install_boot_timer(app, registry):
+    """Record the first request's timing and export the numbers on /metrics"""
+
+    @app.before_request
+    def _boot_request_started():
+        if boot.first_request_seconds is None:
+            g.boot_request_started = time.perf_counter()
+
+    @app.after_request
+    def _boot_request_done(response):
+        started = g.pop('boot_request_started', None)
+        if started is not None and boot.first_request_seconds is None:
+            boot.request_done(started)
+        return response
+
+    registry.gauge('medicue_startup_ready_seconds', 'Seconds from process start until requests could be served',
+                   lambda: boot.ready_seconds)
+    registry.gauge('medicue_startup_first_request_seconds', 'Seconds from process start to the first response',
+                   lambda: boot.first_request_seconds)
+    registry.gauge('medicue_startup_first_request_duration_seconds', 'Duration of the first request',
+                   lambda: boot.first_request_duration)
+
+
+# ==========================================
+# IMPORT REPORT
+# ==========================================
+
+# Run in a fresh interpreter: import and build the app, then answer one request
+_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import server
+server.create_app()
+imported = time.perf_counter()
+response = server.app.test_client().get('/metrics')
+print(json.dumps({'import_seconds': imported - started,
+                  'first_request_seconds': time.perf_counter() - imported,
+                  'status': response.status_code}))
+"""
+
+
+def parse_importtime(stderr):
+    """[(module, self seconds, cumulative seconds, depth)] from python -X importtime output"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((name.strip(), int(self_us) / 1e6, int(cumulative_us) / 1e6, depth))
+    return rows
+
+
+def import_report(top=15):
+    """Cold-start numbers of a fresh interpreter, with the slowest top-level packages"""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', _PROBE],
+                            cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"Start-up probe failed:\n{result.stderr[-2000:]}")
+    probe = json.loads(result.stdout.strip().splitlines()[-1])
+
+    # Self time summed per top-level package, so `sqlalchemy` covers all of its submodules
+    packages = {}
+    for name, self_seconds, _, _ in parse_importtime(result.stderr):
+        package = name.split('.')[0]
+        packages[package] = packages.get(package, 0.0) + self_seconds
+    slowest = sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]
+    return {
+        'import_seconds': round(probe['import_seconds'], 4),
+        'first_request_seconds': round(probe['first_request_seconds'], 4),
+        'total_seconds': round(probe['import_seconds'] + probe['first_request_seconds'], 4),
+        'packages_imported': len(packages),
+        'slowest_packages_seconds': {name: round(seconds, 4) for name, seconds in slowest},
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Medicue cold-start report")
+    parser.add_argument('--top', type=int, default=15, help="packages to list")
+    parser.add_argument('--max-seconds', type=float, default=None,
+                        help="fail when import plus first request takes longer")
+    args = parser.parse_args(argv)
+
+    report = import_report(args.top)
+    print(json.dumps(report, indent=2))
+    if args.max_seconds is not None and report['total_seconds'] > args.max_seconds:
+        print(f"Cold start took {report['total_seconds']:.2f}s, over the {args.max_seconds:.2f}s budget", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
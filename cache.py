@@ -0,0 +1,252 @@
+# ==========================================
+# ANALYSIS RESULT CACHE
+# ==========================================
+
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from jsonprovider import dumps, loads
+
+# Separators users put between symptoms ("fever, headache", "fever and headache", "fever + headache").
+# A period only ends a symptom before whitespace or the end, so "38.5" stays one token.
+_SYMPTOM_SPLIT = re.compile(r"\s*(?:[,;+&/!?\n]|\.(?=\s|$)|\band\b|\bwith\b|\bplus\b)\s*")
+# Punctuation dropped from a symptom, except a decimal point between digits
+_PUNCTUATION = re.compile(r"[^\w\s.]|(?<!\d)\.|\.(?!\d)")
+
+
+def normalize_symptoms(symptoms_text):
+    """Canonical form of a symptom description: lowercase, no punctuation, symptoms sorted"""
+    parts = []
+    for part in _SYMPTOM_SPLIT.split(symptoms_text.lower()):
+        part = " ".join(_PUNCTUATION.sub(" ", part).split())
+        if part:
+            parts.append(part)
+    return ", ".join(sorted(set(parts)))
+
+
+def is_cacheable(result):
+    """Only well-formed analyses are cached, never the error_msg fallback"""
+    return isinstance(result, dict) and bool(result) and "error_msg" not in result
+
+
+class MemoryCache:
+    """Thread-safe in-process LRU with a per-entry TTL"""
+
+    def __init__(self, max_entries=1024, ttl=3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at <= now:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+            }
+
+
+class DiskCache:
+    """SQLite-backed cache shared by every worker process on the host.
+
+    Expired and excess rows are pruned every prune_every writes of this process rather
+    than on each one, so the table can run past max_entries by that many rows per worker.
+    """
+
+    def __init__(self, path, max_entries=50000, ttl=86400, prune_every=100):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.prune_every = prune_every
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        conn = self._connection()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS analysis_cache ("
+            " cache_key TEXT PRIMARY KEY,"
+            " value TEXT NOT NULL,"
+            " expires_at REAL NOT NULL,"
+            " created_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_analysis_cache_created ON analysis_cache (created_at)")
+
+    def _connection(self):
+        # sqlite3 connections can't be shared across threads, so keep one per thread
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + amount)
+
+    def get(self, key):
+        try:
+            row = self._connection().execute(
+                "SELECT value, expires_at FROM analysis_cache WHERE cache_key = ?", (key,)
+            ).fetchone()
+        except sqlite3.Error:
+            self._count('misses')
+            return None
+        if row is None:
+            self._count('misses')
+            return None
+        if row[1] <= time.time():
+            self._count('expirations')
+            self._count('misses')
+            return None
+        self._count('hits')
+        return loads(row[0])
+
+    def set(self, key, value):
+        now = time.time()
+        try:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO analysis_cache (cache_key, value, expires_at, created_at) VALUES (?, ?, ?, ?)",
+                (key, dumps(value), now + self.ttl, now),
+            )
+            with self._lock:
+                self._writes += 1
+                due = self._writes % self.prune_every == 0
+            if due:
+                self._prune(conn, now)
+        except sqlite3.Error:
+            # The shared tier is best effort, a locked or full disk must not fail the request
+            pass
+
+    def _prune(self, conn, now):
+        conn.execute("DELETE FROM analysis_cache WHERE expires_at <= ?", (now,))
+        excess = conn.execute("SELECT COUNT(*) FROM analysis_cache").fetchone()[0] - self.max_entries
+        if excess > 0:
+            conn.execute(
+                "DELETE FROM analysis_cache WHERE cache_key IN "
+                "(SELECT cache_key FROM analysis_cache ORDER BY created_at LIMIT ?)",
+                (excess,),
+            )
+            self._count('evictions', excess)
+
+    def clear(self):
+        self._connection().execute("DELETE FROM analysis_cache")
+
+    def reset_after_fork(self):
+        # A SQLite connection must never be used by two processes
+        self._local = threading.local()
+
+    def stats(self):
+        try:
+            entries = self._connection().execute("SELECT COUNT(*) FROM analysis_cache").fetchone()[0]
+        except sqlite3.Error:
+            entries = None
+        with self._lock:
+            return {
+                'path': self.path,
+                'entries': entries,
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+            }
+
+
+class TieredCache:
+    """Memory tier in front of an optional disk tier; disk hits are promoted to memory"""
+
+    def __init__(self, memory, disk=None):
+        self.memory = memory
+        self.disk = disk
+
+    def get(self, key):
+        value = self.memory.get(key)
+        if value is not None or self.disk is None:
+            return value
+        value = self.disk.get(key)
+        if value is not None:
+            self.memory.set(key, value)
+        return value
+
+    def set(self, key, value):
+        if not is_cacheable(value):
+            return
+        self.memory.set(key, value)
+        if self.disk is not None:
+            self.disk.set(key, value)
+
+    def clear(self):
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+    def reset_after_fork(self):
+        if self.disk is not None:
+            self.disk.reset_after_fork()
+
+    def stats(self):
+        return {
+            'memory': self.memory.stats(),
+            'disk': self.disk.stats() if self.disk is not None else None,
+        }
+
+
+def build_cache(max_entries, ttl, disk_path, disk_max_entries, disk_ttl):
+    """Create the tiered cache from settings; an empty disk_path disables the shared tier"""
+    disk = None
+    if disk_path:
+        os.makedirs(os.path.dirname(os.path.abspath(disk_path)), exist_ok=True)
+        disk = DiskCache(disk_path, max_entries=disk_max_entries, ttl=disk_ttl)
+    return TieredCache(MemoryCache(max_entries=max_entries, ttl=ttl), disk)
@@ -0,0 +1,71 @@
+# ==========================================
+# RESPONSE COMPRESSION
+# ==========================================
+# gzip or brotli, whichever the client accepts (brotli preferred), for
+# JSON/text responses above a size threshold. Streamed responses (SSE) are
+# left alone so events still go out as soon as they're written.
+
+import gzip
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # optional - pip install brotli
+    brotli = None
+
+COMPRESSIBLE = ('application/json', 'text/plain', 'text/html', 'text/csv', 'application/x-ndjson')
+
+
+def encodings():
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def compress(data, encoding, gzip_level=6, brotli_quality=5):
+    if encoding == 'br':
+        return brotli.compress(data, quality=brotli_quality)
+    return gzip.compress(data, compresslevel=gzip_level, mtime=0)
+
+
+def choose_encoding(accept_encodings):
+    """Best encoding we support from an Accept-Encoding header, or None"""
+    best, best_quality = None, 0
+    for encoding in encodings():
+        quality = accept_encodings[encoding]
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def install_compression(app, min_size=512, gzip_level=6, brotli_quality=5):
+    """Compress eligible responses of app in an after_request hook"""
+
+    @app.after_request
+    def _compress(response):
+        if (
+            response.direct_passthrough
+            or response.is_streamed
+            or response.status_code < 200 or response.status_code in (204, 304)
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE
+        ):
+            return response
+        response.vary.add('Accept-Encoding')
+        if response.content_length is not None and response.content_length < min_size:
+            return response
+        encoding = choose_encoding(request.accept_encodings)
+        if encoding is None:
+            return response
+
+        data = response.get_data()
+        if len(data) < min_size:
+            return response
+        response.set_data(compress(data, encoding, gzip_level, brotli_quality))
+        response.headers['Content-Encoding'] = encoding
+        # The bytes differ per encoding, so a strong validator no longer identifies them
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
+
+    return _compress
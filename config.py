@@ -12,18 +12,277 @@ import os
 from flask_bcrypt import Bcrypt
 from dotenv import load_dotenv
 
+from boottime import install_boot_timer
+from compression import install_compression
+from dbpool import PoolMetrics, engine_options
+from jsonprovider import FastJSONProvider
+from loadshed import AdaptiveLimit, LoadShedder, install_load_shedding
+from ratelimit import RateLimiter, build_buckets, install_rate_limit_headers
+from metrics import install_metrics, registry
+from passwords import PasswordHasher
+from replicas import ReplicaSet, RoutingSession, watch_writes
+
 load_dotenv()
 
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
 CORS(app)
 
 # Configuration
 app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv("DB_URL")
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Connection pool, per worker process: steady connections, extra ones allowed under bursts, seconds
+# before a connection is replaced (keep below MySQL's wait_timeout), liveness check on checkout,
+# seconds to wait for a free connection before the request fails
+app.config['DB_POOL_SIZE'] = int(os.getenv('DB_POOL_SIZE', 10))
+app.config['DB_MAX_OVERFLOW'] = int(os.getenv('DB_MAX_OVERFLOW', 10))
+app.config['DB_POOL_RECYCLE'] = int(os.getenv('DB_POOL_RECYCLE', 280))
+app.config['DB_POOL_PRE_PING'] = os.getenv('DB_POOL_PRE_PING', 'true').lower() == 'true'
+app.config['DB_POOL_TIMEOUT'] = float(os.getenv('DB_POOL_TIMEOUT', 10))
+
+def _engine_options(url):
+    return engine_options(
+        url,
+        pool_size=app.config['DB_POOL_SIZE'],
+        max_overflow=app.config['DB_MAX_OVERFLOW'],
+        pool_recycle=app.config['DB_POOL_RECYCLE'],
+        pool_pre_ping=app.config['DB_POOL_PRE_PING'],
+        pool_timeout=app.config['DB_POOL_TIMEOUT'],
+    )
+
+
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = _engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
+
+# Read replicas - comma separated URLs; read-only routes use them (round_robin or least_connections).
+# After a write the user reads from the primary for DB_READ_YOUR_WRITES_SECONDS.
+app.config['DB_REPLICA_URLS'] = [url.strip() for url in os.getenv('DB_REPLICA_URLS', '').split(',') if url.strip()]
+app.config['DB_REPLICA_STRATEGY'] = os.getenv('DB_REPLICA_STRATEGY', 'round_robin')
+app.config['DB_READ_YOUR_WRITES_SECONDS'] = float(os.getenv('DB_READ_YOUR_WRITES_SECONDS', 5))
 app.config['JWT_SECRET_KEY'] = os.getenv('JWT_SECRET_KEY')  
 app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(hours=24)
 
+# Password hashing - bcrypt work factor, and the process pool it runs on (0 workers hashes inline).
+# Stored hashes with a different work factor are rehashed on the next successful login.
+app.config['BCRYPT_LOG_ROUNDS'] = int(os.getenv('BCRYPT_LOG_ROUNDS', 12))
+app.config['PASSWORD_HASH_WORKERS'] = int(os.getenv('PASSWORD_HASH_WORKERS', 2))
+app.config['PASSWORD_HASH_MAX_PENDING'] = int(os.getenv('PASSWORD_HASH_MAX_PENDING', 0))
+app.config['PASSWORD_HASH_TIMEOUT'] = float(os.getenv('PASSWORD_HASH_TIMEOUT', 10))
+
+# Token revocation - revoked JTIs are cached in memory and synced from the blocklist table every
+# JWT_REVOCATION_SYNC_INTERVAL seconds; rows for expired tokens are pruned in batches in the background
+app.config['JWT_REVOCATION_SYNC_INTERVAL'] = float(os.getenv('JWT_REVOCATION_SYNC_INTERVAL', 5))
+app.config['JWT_REVOCATION_NEGATIVE_SIZE'] = int(os.getenv('JWT_REVOCATION_NEGATIVE_SIZE', 10000))
+app.config['BLOCKLIST_PRUNE_INTERVAL'] = float(os.getenv('BLOCKLIST_PRUNE_INTERVAL', 600))
+app.config['BLOCKLIST_PRUNE_BATCH'] = int(os.getenv('BLOCKLIST_PRUNE_BATCH', 1000))
+
+# Gemini client - seconds per attempt and for the whole call (retries included), attempts with jittered
+# exponential backoff, a circuit breaker that fails fast when failure rate of the last calls is too high,
+# and an optional hedge: the same prompt to GEMINI_HEDGE_MODEL when the answer is slower than the p95.
+# GEMINI_BASE_URL points the client elsewhere, e.g. at fake_gemini.py.
+app.config['GEMINI_BASE_URL'] = os.getenv('GEMINI_BASE_URL', '')
+app.config['GEMINI_TIMEOUT'] = float(os.getenv('GEMINI_TIMEOUT', 10))
+app.config['GEMINI_DEADLINE'] = float(os.getenv('GEMINI_DEADLINE', 25))
+app.config['GEMINI_MAX_ATTEMPTS'] = int(os.getenv('GEMINI_MAX_ATTEMPTS', 3))
+app.config['GEMINI_BACKOFF_BASE'] = float(os.getenv('GEMINI_BACKOFF_BASE', 0.5))
+app.config['GEMINI_BACKOFF_MAX'] = float(os.getenv('GEMINI_BACKOFF_MAX', 4))
+app.config['GEMINI_BREAKER_FAILURE_RATE'] = float(os.getenv('GEMINI_BREAKER_FAILURE_RATE', 0.5))
+app.config['GEMINI_BREAKER_WINDOW'] = int(os.getenv('GEMINI_BREAKER_WINDOW', 20))
+app.config['GEMINI_BREAKER_MIN_CALLS'] = int(os.getenv('GEMINI_BREAKER_MIN_CALLS', 10))
+app.config['GEMINI_BREAKER_COOLDOWN'] = float(os.getenv('GEMINI_BREAKER_COOLDOWN', 30))
+app.config['GEMINI_HEDGE_MODEL'] = os.getenv('GEMINI_HEDGE_MODEL', '')
+app.config['GEMINI_HEDGE_PERCENTILE'] = float(os.getenv('GEMINI_HEDGE_PERCENTILE', 95))
+app.config['GEMINI_HEDGE_MIN_DELAY'] = float(os.getenv('GEMINI_HEDGE_MIN_DELAY', 0.5))
+app.config['GEMINI_MAX_CONCURRENCY'] = int(os.getenv('GEMINI_MAX_CONCURRENCY', 32))
+# Upper bound on the analysis answer; a cut-off answer fails validation and counts as a parse failure
+app.config['GEMINI_MAX_OUTPUT_TOKENS'] = int(os.getenv('GEMINI_MAX_OUTPUT_TOKENS', 768))
+
+# Profile cache - serialized profiles per worker; changes made by another worker show up within the TTL
+app.config['PROFILE_CACHE_SIZE'] = int(os.getenv('PROFILE_CACHE_SIZE', 2048))
+app.config['PROFILE_CACHE_TTL'] = int(os.getenv('PROFILE_CACHE_TTL', 30))
+
+# Analysis cache - in-process LRU in front of a SQLite file shared by all workers on the host.
+# Set ANALYSIS_CACHE_DB to an empty string to disable the shared tier.
+app.config['ANALYSIS_CACHE_SIZE'] = int(os.getenv('ANALYSIS_CACHE_SIZE', 1024))
+app.config['ANALYSIS_CACHE_TTL'] = int(os.getenv('ANALYSIS_CACHE_TTL', 3600))
+app.config['ANALYSIS_CACHE_DB'] = os.getenv('ANALYSIS_CACHE_DB', os.path.join(app.instance_path, 'analysis_cache.db'))
+app.config['ANALYSIS_CACHE_DB_SIZE'] = int(os.getenv('ANALYSIS_CACHE_DB_SIZE', 50000))
+app.config['ANALYSIS_CACHE_DB_TTL'] = int(os.getenv('ANALYSIS_CACHE_DB_TTL', 86400))
+
+# Near-duplicate cache - reuses an analysis when a past query is at least this similar (MinHash Jaccard).
+# Off by default: a near match can still differ in something that matters clinically; measure first.
+app.config['SEMANTIC_CACHE_ENABLED'] = os.getenv('SEMANTIC_CACHE_ENABLED', 'false').lower() == 'true'
+app.config['SEMANTIC_CACHE_SIZE'] = int(os.getenv('SEMANTIC_CACHE_SIZE', 5000))
+app.config['SEMANTIC_CACHE_THRESHOLD'] = float(os.getenv('SEMANTIC_CACHE_THRESHOLD', 0.9))
+
+# Single-flight - identical in-flight analyses share one Gemini call.
+# 'thread' coalesces inside a worker, 'file' also across workers on the host via lock files.
+app.config['SINGLEFLIGHT_BACKEND'] = os.getenv('SINGLEFLIGHT_BACKEND', 'thread')
+app.config['SINGLEFLIGHT_LOCK_DIR'] = os.getenv('SINGLEFLIGHT_LOCK_DIR', os.path.join(app.instance_path, 'locks'))
+app.config['SINGLEFLIGHT_TIMEOUT'] = float(os.getenv('SINGLEFLIGHT_TIMEOUT', 30))
+# Lock files the 'file' backend hashes keys into
+app.config['SINGLEFLIGHT_LOCK_STRIPES'] = int(os.getenv('SINGLEFLIGHT_LOCK_STRIPES', 256))
+
+# Async analysis jobs (POST /api/analyze?mode=async) - bounded worker pool and wait queue
+app.config['ANALYSIS_WORKERS'] = int(os.getenv('ANALYSIS_WORKERS', 4))
+app.config['ANALYSIS_QUEUE_SIZE'] = int(os.getenv('ANALYSIS_QUEUE_SIZE', 32))
+app.config['ANALYSIS_JOB_TTL'] = int(os.getenv('ANALYSIS_JOB_TTL', 600))
+
+# Batch analysis (POST /api/analyze/batch) - max texts per request and concurrent model calls per batch
+app.config['ANALYSIS_BATCH_MAX'] = int(os.getenv('ANALYSIS_BATCH_MAX', 50))
+app.config['ANALYSIS_BATCH_CONCURRENCY'] = int(os.getenv('ANALYSIS_BATCH_CONCURRENCY', 8))
+
+# Local triage engine over the symptom/condition catalog.
+# 'fallback' answers locally when Gemini fails, 'fastpath' also skips Gemini when the
+# local top score reaches TRIAGE_FASTPATH_SCORE, 'off' disables it.
+app.config['TRIAGE_MODE'] = os.getenv('TRIAGE_MODE', 'fallback')
+app.config['TRIAGE_FASTPATH_SCORE'] = float(os.getenv('TRIAGE_FASTPATH_SCORE', 0.85))
+# Catalog changes committed by this worker apply at once; each worker also reloads the catalog every
+# REFRESH_INTERVAL seconds to pick up changes made by the others (0 = never, those need a restart).
+app.config['TRIAGE_REFRESH_INTERVAL'] = float(os.getenv('TRIAGE_REFRESH_INTERVAL', 60))
+
+# Emergency red-flag pre-screen, runs before any model call.
+# 'immediate' answers with an emergency response right away, 'flag' marks the model result, 'off' disables it.
+# PRESCREEN_LEXICON optionally points at a JSON file of {"category": ["phrase", ...]} replacing the built-in list.
+app.config['PRESCREEN_MODE'] = os.getenv('PRESCREEN_MODE', 'immediate')
+app.config['PRESCREEN_LEXICON'] = os.getenv('PRESCREEN_LEXICON', '')
+
+# Response compression - gzip or brotli (if installed) for JSON/text bodies of at least COMPRESSION_MIN_SIZE bytes
+app.config['COMPRESSION_ENABLED'] = os.getenv('COMPRESSION_ENABLED', 'true').lower() == 'true'
+app.config['COMPRESSION_MIN_SIZE'] = int(os.getenv('COMPRESSION_MIN_SIZE', 512))
+app.config['COMPRESSION_GZIP_LEVEL'] = int(os.getenv('COMPRESSION_GZIP_LEVEL', 6))
+app.config['COMPRESSION_BROTLI_QUALITY'] = int(os.getenv('COMPRESSION_BROTLI_QUALITY', 5))
+if app.config['COMPRESSION_ENABLED']:
+    install_compression(
+        app,
+        min_size=app.config['COMPRESSION_MIN_SIZE'],
+        gzip_level=app.config['COMPRESSION_GZIP_LEVEL'],
+        brotli_quality=app.config['COMPRESSION_BROTLI_QUALITY'],
+    )
+
+# Production server (python main.py serve) - gunicorn workers x threads per worker
+app.config['SERVER_BIND'] = os.getenv('SERVER_BIND', '0.0.0.0:8080')
+app.config['SERVER_WORKERS'] = int(os.getenv('SERVER_WORKERS', (os.cpu_count() or 1) * 2 + 1))
+app.config['SERVER_THREADS'] = int(os.getenv('SERVER_THREADS', 8))
+app.config['SERVER_WORKER_CLASS'] = os.getenv('SERVER_WORKER_CLASS', 'gthread')
+app.config['SERVER_TIMEOUT'] = int(os.getenv('SERVER_TIMEOUT', 120))
+app.config['SERVER_GRACEFUL_TIMEOUT'] = int(os.getenv('SERVER_GRACEFUL_TIMEOUT', 30))
+app.config['SERVER_KEEPALIVE'] = int(os.getenv('SERVER_KEEPALIVE', 5))
+app.config['SERVER_MAX_REQUESTS'] = int(os.getenv('SERVER_MAX_REQUESTS', 2000))
+app.config['SERVER_MAX_REQUESTS_JITTER'] = int(os.getenv('SERVER_MAX_REQUESTS_JITTER', 200))
+# ASGI mode (python main.py serve-asgi) - /api/analyze runs on the event loop: analyses in flight per
+# worker, threads per worker for the other (Flask) routes and blocking cache / database work
+app.config['ASGI_MAX_IN_FLIGHT'] = int(os.getenv('ASGI_MAX_IN_FLIGHT', 1000))
+app.config['ASGI_THREADS'] = int(os.getenv('ASGI_THREADS', 32))
+
+# Load shedding - per route class concurrency limits that adapt to observed latency. CAPACITY is the
+# requests a worker serves at once (its threads); analyses leave RESERVE of them for account routes
+# and are shed (503) when their recent latency exceeds TOLERANCE x the long-run average.
+app.config['LOAD_SHED_ENABLED'] = os.getenv('LOAD_SHED_ENABLED', 'true').lower() == 'true'
+app.config['LOAD_SHED_CAPACITY'] = int(os.getenv('LOAD_SHED_CAPACITY', app.config['SERVER_THREADS']))
+app.config['LOAD_SHED_RESERVE'] = int(os.getenv('LOAD_SHED_RESERVE', max(1, app.config['LOAD_SHED_CAPACITY'] // 4)))
+app.config['LOAD_SHED_TOLERANCE'] = float(os.getenv('LOAD_SHED_TOLERANCE', 2.0))
+# Under ASGI the Flask routes share the ASGI_THREADS pool instead, applied when the app starts serving
+app.config['ASGI_LOAD_SHED_CAPACITY'] = int(os.getenv('LOAD_SHED_CAPACITY', app.config['ASGI_THREADS']))
+# Rate limits on analyses - token bucket per user (burst, refill per minute) and one global bucket sized to the
+# Gemini quota (0 per minute = that bucket is off). A batch costs one token per distinct text; one larger than a
+# burst is refused (413), so both bursts default to at least ANALYSIS_BATCH_MAX, and a smaller burst set explicitly
+# lowers ANALYSIS_BATCH_MAX to match. 'memory' limits each worker on its own, 'sqlite' shares the buckets.
+app.config['RATE_LIMIT_ENABLED'] = os.getenv('RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+app.config['RATE_LIMIT_USER_BURST'] = int(os.getenv('RATE_LIMIT_USER_BURST', max(10, app.config['ANALYSIS_BATCH_MAX'])))
+app.config['RATE_LIMIT_USER_PER_MINUTE'] = float(os.getenv('RATE_LIMIT_USER_PER_MINUTE', 20))
+app.config['RATE_LIMIT_GLOBAL_PER_MINUTE'] = float(os.getenv('RATE_LIMIT_GLOBAL_PER_MINUTE', 0))
+app.config['RATE_LIMIT_GLOBAL_BURST'] = int(os.getenv('RATE_LIMIT_GLOBAL_BURST',
+                                                      max(app.config['ANALYSIS_BATCH_MAX'],
+                                                          int(app.config['RATE_LIMIT_GLOBAL_PER_MINUTE'] // 6))))
+app.config['RATE_LIMIT_BACKEND'] = os.getenv('RATE_LIMIT_BACKEND', 'memory')
+app.config['RATE_LIMIT_DB'] = os.getenv('RATE_LIMIT_DB', os.path.join(app.instance_path, 'rate_limits.db'))
+# Analysis history - written behind the response in batches of FLUSH_SIZE rows, or FLUSH_INTERVAL seconds after
+# the oldest waiting one. Past MAX_PENDING unwritten records new ones are dropped; at shutdown a worker spends up
+# to SHUTDOWN_TIMEOUT seconds writing what is left.
+app.config['HISTORY_ENABLED'] = os.getenv('HISTORY_ENABLED', 'true').lower() == 'true'
+app.config['HISTORY_FLUSH_SIZE'] = int(os.getenv('HISTORY_FLUSH_SIZE', 200))
+app.config['HISTORY_FLUSH_INTERVAL'] = float(os.getenv('HISTORY_FLUSH_INTERVAL', 1.0))
+app.config['HISTORY_MAX_PENDING'] = int(os.getenv('HISTORY_MAX_PENDING', 10000))
+app.config['HISTORY_SHUTDOWN_TIMEOUT'] = float(os.getenv('HISTORY_SHUTDOWN_TIMEOUT', 10))
+# A batch refused for its rows (constraint, bad value) is split to find the rows that fail on their own; those are
+# logged and appended to the DEAD_LETTER JSON-lines file (empty = log only) instead of blocking the writes behind
+# them. Connection and other database errors are retried until they pass.
+app.config['HISTORY_DEAD_LETTER'] = os.getenv('HISTORY_DEAD_LETTER',
+                                              os.path.join(app.instance_path, 'history_dead_letter.jsonl'))
+# GET /api/history - records per page by default and at most; rows fetched per round trip by /api/history/export
+app.config['HISTORY_PAGE_SIZE'] = int(os.getenv('HISTORY_PAGE_SIZE', 20))
+app.config['HISTORY_PAGE_MAX'] = int(os.getenv('HISTORY_PAGE_MAX', 100))
+app.config['HISTORY_EXPORT_CHUNK'] = int(os.getenv('HISTORY_EXPORT_CHUNK', 500))
+# Readiness probe - seconds a database ping result is reused
+app.config['HEALTH_DB_PING_TTL'] = float(os.getenv('HEALTH_DB_PING_TTL', 5))
+
 # Initialize extensions
-db = SQLAlchemy(app)
+replicas = ReplicaSet(
+    app.config['DB_REPLICA_URLS'],
+    strategy=app.config['DB_REPLICA_STRATEGY'],
+    pin_seconds=app.config['DB_READ_YOUR_WRITES_SECONDS'],
+    engine_options=_engine_options,
+)
+db = SQLAlchemy(app, session_options={'class_': RoutingSession, 'replicas': replicas})
+if replicas:
+    watch_writes(replicas)
+pool_metrics = PoolMetrics()
+with app.app_context():
+    pool_metrics.attach(db.engine)
+# Request timings, SQL statements per request and the /metrics endpoint
+install_metrics(app)
+install_boot_timer(app, registry)
+registry.gauge('medicue_db_pool_in_use', 'Database connections checked out in this worker', lambda: pool_metrics.in_use)
+registry.gauge('medicue_db_pool_peak_in_use', 'Most database connections checked out at once in this worker',
+               lambda: pool_metrics.peak_in_use)
+for _name, _help in (('checkouts', 'Database connections checked out'), ('connects', 'Database connections opened'),
+                     ('invalidations', 'Database connections invalidated'),
+                     ('slow_checkouts', 'Database checkouts that waited 100 ms or more')):
+    registry.gauge(f'medicue_db_pool_{_name}_total', _help, lambda _name=_name: getattr(pool_metrics, _name), type='counter')
+registry.gauge('medicue_db_pool_checkout_wait_p99_ms', 'Recent database checkout wait, 99th percentile',
+               lambda: pool_metrics.stats()['checkout_wait_p99_ms'])
+registry.gauge('medicue_db_pool_overflow', 'Database connections opened past the pool size',
+               lambda: pool_metrics.stats().get('overflow'))
+if replicas:
+    registry.gauge('medicue_db_replica_reads_total', 'Reads sent to a replica', lambda: sum(replicas.replica_reads),
+                   type='counter')
+    registry.gauge('medicue_db_replica_pinned_reads_total', 'Reads kept on the primary after a write',
+                   lambda: replicas.pinned_reads, type='counter')
+    registry.gauge('medicue_db_replica_primary_fallbacks_total', 'Replica misses retried on the primary',
+                   lambda: replicas.primary_fallbacks, type='counter')
 bcrypt = Bcrypt(app)
-jwt = JWTManager(app)
\ No newline at end of file
+jwt = JWTManager(app)
+password_hasher = PasswordHasher(
+    rounds=app.config['BCRYPT_LOG_ROUNDS'],
+    workers=app.config['PASSWORD_HASH_WORKERS'],
+    max_pending=app.config['PASSWORD_HASH_MAX_PENDING'],
+    timeout=app.config['PASSWORD_HASH_TIMEOUT'],
+)
+# Account routes (priority 0) keep LOAD_SHED_RESERVE slots; analyses (priority 1) are shed first
+load_shedder = LoadShedder(app.config['LOAD_SHED_CAPACITY'], enabled=app.config['LOAD_SHED_ENABLED'])
+load_shedder.add_class('account', priority=0, reserve=app.config['LOAD_SHED_RESERVE'], limit=AdaptiveLimit(
+    initial=app.config['LOAD_SHED_CAPACITY'],
+    min_limit=app.config['LOAD_SHED_RESERVE'],
+    max_limit=app.config['LOAD_SHED_CAPACITY'],
+    tolerance=app.config['LOAD_SHED_TOLERANCE'],
+))
+load_shedder.add_class('analysis', priority=1, limit=AdaptiveLimit(
+    initial=app.config['LOAD_SHED_CAPACITY'],
+    min_limit=1,
+    # Under ASGI analyses wait on the event loop, not on a thread
+    max_limit=max(app.config['LOAD_SHED_CAPACITY'], app.config['ASGI_MAX_IN_FLIGHT']),
+    tolerance=app.config['LOAD_SHED_TOLERANCE'],
+))
+install_load_shedding(app, load_shedder)
+rate_limiter = RateLimiter(
+    build_buckets(app.config['RATE_LIMIT_BACKEND'], app.config['RATE_LIMIT_DB']),
+    user_burst=app.config['RATE_LIMIT_USER_BURST'],
+    user_per_minute=app.config['RATE_LIMIT_USER_PER_MINUTE'],
+    global_burst=app.config['RATE_LIMIT_GLOBAL_BURST'],
+    global_per_minute=app.config['RATE_LIMIT_GLOBAL_PER_MINUTE'],
+    enabled=app.config['RATE_LIMIT_ENABLED'],
+)
+if rate_limiter.enabled and rate_limiter.max_cost is not None:
+    # A batch the buckets can never hold would only ever get a 413
+    app.config['ANALYSIS_BATCH_MAX'] = min(app.config['ANALYSIS_BATCH_MAX'], rate_limiter.max_cost)
+install_rate_limit_headers(app)
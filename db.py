@@ -1,83 +1,178 @@
+import hashlib
+
+from sqlalchemy.exc import SQLAlchemyError
+
 from config import db, app
-# from models import Symptom , Condition, Recommendation
+from models import Condition, Recommendation, SchemaVersion, Symptom, SymptomConditionMap
 
 # ==========================================
 # DATABASE INITIALIZATION
 # ==========================================
 
+# Columns added after their table first shipped - create_all only creates missing tables
+COLUMN_UPGRADES = [
+    ('blacklisted_tokens', 'expires_at', [
+        'ALTER TABLE blacklisted_tokens ADD COLUMN expires_at DATETIME NULL',
+        'CREATE INDEX ix_blacklisted_tokens_expires_at ON blacklisted_tokens (expires_at)',
+    ]),
+    ('users', 'updated_at', [
+        'ALTER TABLE users ADD COLUMN updated_at DATETIME NULL',
+    ]),
+]
+
+
+def upgrade_schema():
+    """Add any missing columns from COLUMN_UPGRADES and any missing model indexes to existing tables"""
+    inspector = db.inspect(db.engine)
+    for table, column, statements in COLUMN_UPGRADES:
+        if column not in {c['name'] for c in inspector.get_columns(table)}:
+            for statement in statements:
+                db.session.execute(db.text(statement))
+            db.session.commit()
+            print(f"Added column {table}.{column}")
+    # Indexes added to a model after its table was created
+    tables = set(inspector.get_table_names())
+    for table in db.metadata.sorted_tables:
+        if table.name not in tables:
+            continue
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(db.engine)
+                print(f"Added index {index.name}")
+
+
+def schema_fingerprint():
+    """Hash of every table, column and index in the models plus COLUMN_UPGRADES - changes with the schema"""
+    parts = []
+    for table in db.metadata.sorted_tables:
+        parts.append(f"table {table.name}")
+        for column in table.columns:
+            parts.append(f"column {column.name} {column.type} {column.nullable} {column.primary_key}")
+        for index in sorted(table.indexes, key=lambda i: i.name or ''):
+            parts.append(f"index {index.name} {[c.name for c in index.columns]} {index.unique}")
+    for table, column, statements in COLUMN_UPGRADES:
+        parts.append(f"upgrade {table}.{column} {statements}")
+    return hashlib.sha256("\n".join(parts).encode('utf-8')).hexdigest()
+
+
+def current_schema_version():
+    """Fingerprint recorded by the last successful init_database, or None"""
+    try:
+        return db.session.execute(db.select(SchemaVersion.version)).scalars().first()
+    except SQLAlchemyError:
+        db.session.rollback()  # no schema_version table yet
+        return None
+
+
 def init_database():
-    """Initialize database with sample data"""
+    """Create tables, upgrade columns and seed sample data - skipped when the recorded schema version matches"""
     with app.app_context():
+        fingerprint = schema_fingerprint()
+        if current_schema_version() == fingerprint:
+            print("Database schema up to date")
+            return
+
         db.create_all()
+        upgrade_schema()
+        seed_sample_data()
+
+        db.session.execute(db.delete(SchemaVersion))
+        db.session.add(SchemaVersion(version=fingerprint))
+        db.session.commit()
+        print(f"Database schema version {fingerprint[:12]}")
+
+
+def seed_sample_data():
+    """Initialize database with sample data"""
+    with app.app_context():
+        # Check if data already exists
+        if Symptom.query.first():
+            print("Database already initialized")
+            return
+        
+        # Add sample symptoms
+        symptoms_data = [
+            {'name': 'Fever', 'description': 'Elevated body temperature', 'body_system': 'General', 'severity_rating': 'Medium'},
+            {'name': 'Cough', 'description': 'Persistent coughing', 'body_system': 'Respiratory', 'severity_rating': 'Low'},
+            {'name': 'Headache', 'description': 'Pain in head region', 'body_system': 'Neurological', 'severity_rating': 'Low'},
+            {'name': 'Chest Pain', 'description': 'Pain in chest area', 'body_system': 'Cardiovascular', 'severity_rating': 'High'},
+            {'name': 'Difficulty Breathing', 'description': 'Shortness of breath', 'body_system': 'Respiratory', 'severity_rating': 'High'},
+            {'name': 'Nausea', 'description': 'Feeling of sickness', 'body_system': 'Digestive', 'severity_rating': 'Low'},
+            {'name': 'Fatigue', 'description': 'Extreme tiredness', 'body_system': 'General', 'severity_rating': 'Low'},
+            {'name': 'Dizziness', 'description': 'Feeling lightheaded', 'body_system': 'Neurological', 'severity_rating': 'Medium'}
+        ]
+        
+        for symptom_data in symptoms_data:
+            symptom = Symptom(**symptom_data)
+            db.session.add(symptom)
         
-        # # Check if data already exists
-        # if Symptom.query.first():
-        #     print("Database already initialized")
-        #     return
+        # Add sample conditions
+        conditions_data = [
+            {
+                'name': 'Common Cold',
+                'icd10_code': 'J00',
+                'overview': 'Viral infection of upper respiratory tract',
+                'causes': 'Various viruses, primarily rhinoviruses',
+                'treatment': 'Rest, fluids, over-the-counter medications'
+            },
+            {
+                'name': 'Migraine',
+                'icd10_code': 'G43',
+                'overview': 'Severe recurring headaches',
+                'causes': 'Neurological disorder, triggers vary',
+                'treatment': 'Pain relievers, rest in dark room'
+            },
+            {
+                'name': 'Heart Attack',
+                'icd10_code': 'I21',
+                'overview': 'Blockage of blood flow to heart',
+                'causes': 'Coronary artery disease',
+                'treatment': 'IMMEDIATE EMERGENCY CARE REQUIRED'
+            },
+            {
+                'name': 'Influenza',
+                'icd10_code': 'J11',
+                'overview': 'Viral respiratory infection',
+                'causes': 'Influenza virus',
+                'treatment': 'Rest, fluids, antiviral medications'
+            }
+        ]
         
-        # # Add sample symptoms
-        # symptoms_data = [
-        #     {'name': 'Fever', 'description': 'Elevated body temperature', 'body_system': 'General', 'severity_rating': 'Medium'},
-        #     {'name': 'Cough', 'description': 'Persistent coughing', 'body_system': 'Respiratory', 'severity_rating': 'Low'},
-        #     {'name': 'Headache', 'description': 'Pain in head region', 'body_system': 'Neurological', 'severity_rating': 'Low'},
-        #     {'name': 'Chest Pain', 'description': 'Pain in chest area', 'body_system': 'Cardiovascular', 'severity_rating': 'High'},
-        #     {'name': 'Difficulty Breathing', 'description': 'Shortness of breath', 'body_system': 'Respiratory', 'severity_rating': 'High'},
-        #     {'name': 'Nausea', 'description': 'Feeling of sickness', 'body_system': 'Digestive', 'severity_rating': 'Low'},
-        #     {'name': 'Fatigue', 'description': 'Extreme tiredness', 'body_system': 'General', 'severity_rating': 'Low'},
-        #     {'name': 'Dizziness', 'description': 'Feeling lightheaded', 'body_system': 'Neurological', 'severity_rating': 'Medium'}
-        # ]
+        for condition_data in conditions_data:
+            condition = Condition(**condition_data)
+            db.session.add(condition)
         
-        # for symptom_data in symptoms_data:
-        #     symptom = Symptom(**symptom_data)
-        #     db.session.add(symptom)
+        db.session.flush()  # Get symptom_id / condition_id
+        symptom_ids = {s.name: s.symptom_id for s in Symptom.query.all()}
+        condition_ids = {c.name: c.condition_id for c in Condition.query.all()}
         
-        # # Add sample conditions
-        # conditions_data = [
-        #     {
-        #         'name': 'Common Cold',
-        #         'icd10_code': 'J00',
-        #         'overview': 'Viral infection of upper respiratory tract',
-        #         'causes': 'Various viruses, primarily rhinoviruses',
-        #         'treatment': 'Rest, fluids, over-the-counter medications'
-        #     },
-        #     {
-        #         'name': 'Migraine',
-        #         'icd10_code': 'G43',
-        #         'overview': 'Severe recurring headaches',
-        #         'causes': 'Neurological disorder, triggers vary',
-        #         'treatment': 'Pain relievers, rest in dark room'
-        #     },
-        #     {
-        #         'name': 'Heart Attack',
-        #         'icd10_code': 'I21',
-        #         'overview': 'Blockage of blood flow to heart',
-        #         'causes': 'Coronary artery disease',
-        #         'treatment': 'IMMEDIATE EMERGENCY CARE REQUIRED'
-        #     },
-        #     {
-        #         'name': 'Influenza',
-        #         'icd10_code': 'J11',
-        #         'overview': 'Viral respiratory infection',
-        #         'causes': 'Influenza virus',
-        #         'treatment': 'Rest, fluids, antiviral medications'
-        #     }
-        # ]
+        # Add recommendations
+        recommendations = [
+            {'condition': 'Common Cold', 'rec_type': 'Self-Care', 'guidance_text': 'Get plenty of rest and stay hydrated', 'is_emergency_alert': False},
+            {'condition': 'Migraine', 'rec_type': 'Consult', 'guidance_text': 'Consult a neurologist if migraines persist', 'is_emergency_alert': False},
+            {'condition': 'Heart Attack', 'rec_type': 'Urgent', 'guidance_text': 'CALL EMERGENCY SERVICES IMMEDIATELY', 'is_emergency_alert': True},
+            {'condition': 'Influenza', 'rec_type': 'Consult', 'guidance_text': 'See a doctor for antiviral medication', 'is_emergency_alert': False}
+        ]
         
-        # for condition_data in conditions_data:
-        #     condition = Condition(**condition_data)
-        #     db.session.add(condition)
+        for rec_data in recommendations:
+            rec = Recommendation(condition_id=condition_ids[rec_data.pop('condition')], **rec_data)
+            db.session.add(rec)
         
-        # # Add recommendations
-        # recommendations = [
-        #     {'condition_id': 1, 'rec_type': 'Self-Care', 'guidance_text': 'Get plenty of rest and stay hydrated', 'is_emergency_alert': False},
-        #     {'condition_id': 2, 'rec_type': 'Consult', 'guidance_text': 'Consult a neurologist if migraines persist', 'is_emergency_alert': False},
-        #     {'condition_id': 3, 'rec_type': 'Urgent', 'guidance_text': 'CALL EMERGENCY SERVICES IMMEDIATELY', 'is_emergency_alert': True},
-        #     {'condition_id': 4, 'rec_type': 'Consult', 'guidance_text': 'See a doctor for antiviral medication', 'is_emergency_alert': False}
-        # ]
+        # Map symptoms to conditions - weight is how strongly the symptom points at the condition
+        symptom_condition_weights = [
+            ('Common Cold', 'Cough', 0.8), ('Common Cold', 'Fever', 0.4), ('Common Cold', 'Fatigue', 0.3), ('Common Cold', 'Headache', 0.2),
+            ('Migraine', 'Headache', 1.0), ('Migraine', 'Nausea', 0.5), ('Migraine', 'Dizziness', 0.4),
+            ('Heart Attack', 'Chest Pain', 1.0), ('Heart Attack', 'Difficulty Breathing', 0.7), ('Heart Attack', 'Nausea', 0.3), ('Heart Attack', 'Dizziness', 0.3),
+            ('Influenza', 'Fever', 0.9), ('Influenza', 'Fatigue', 0.7), ('Influenza', 'Cough', 0.6), ('Influenza', 'Headache', 0.5)
+        ]
         
-        # for rec_data in recommendations:
-        #     rec = Recommendation(**rec_data)
-        #     db.session.add(rec)
+        for condition_name, symptom_name, weight in symptom_condition_weights:
+            db.session.add(SymptomConditionMap(
+                symptom_id=symptom_ids[symptom_name],
+                condition_id=condition_ids[condition_name],
+                weight=weight
+            ))
         
-        # db.session.commit()
-        # print("Database initialized with sample data")
+        db.session.commit()
+        print("Database initialized with sample data")
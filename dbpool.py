@@ -0,0 +1,126 @@
+# ==========================================
+# DATABASE CONNECTION POOL
+# ==========================================
+# Engine options from settings, and counters fed by pool event listeners so
+# the pool can be sized per worker: checkout wait, connections in use,
+# overflow, and connections dropped as stale or broken.
+
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool
+
+# Set by TimedQueuePool.connect, read by the checkout listener on the same thread
+_checkout_started = threading.local()
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that notes when a checkout was asked for, so the wait for a slot can be measured"""
+
+    def connect(self):
+        _checkout_started.at = time.perf_counter()
+        return super().connect()
+
+
+def engine_options(url, pool_size=10, max_overflow=10, pool_recycle=280, pool_pre_ping=True, pool_timeout=10):
+    """SQLALCHEMY_ENGINE_OPTIONS for the database URL"""
+    options = {
+        # Reconnect before MySQL's wait_timeout closes the connection under us
+        'pool_recycle': pool_recycle,
+        # Test each connection on checkout, a dead one is replaced instead of failing the request
+        'pool_pre_ping': pool_pre_ping,
+    }
+    if url and url.startswith('sqlite'):
+        # SQLite picks its own pool class, sizing doesn't apply
+        return options
+    options.update({
+        'poolclass': TimedQueuePool,
+        'pool_size': pool_size,
+        'max_overflow': max_overflow,
+        'pool_timeout': pool_timeout,
+    })
+    return options
+
+
+class PoolMetrics:
+    """Pool counters collected from the engine's pool events"""
+
+    def __init__(self, max_samples=1024):
+        self._lock = threading.Lock()
+        self._waits = []  # last checkout waits in ms, a ring of max_samples
+        self._next = 0
+        self.max_samples = max_samples
+        self.engine = None
+        self.in_use = 0
+        self.peak_in_use = 0
+        self.checkouts = 0
+        self.connects = 0
+        self.invalidations = 0
+        self.slow_checkouts = 0
+
+    def attach(self, engine):
+        """Listen on the engine's pool; the listeners carry over when the pool is disposed and recreated"""
+        self.engine = engine
+        event.listen(engine, 'connect', self._on_connect)
+        event.listen(engine, 'checkout', self._on_checkout)
+        event.listen(engine, 'checkin', self._on_checkin)
+        event.listen(engine, 'invalidate', self._on_invalidate)
+        event.listen(engine, 'soft_invalidate', self._on_invalidate)
+
+    def reset_after_fork(self):
+        # Connections counted here belonged to the parent
+        with self._lock:
+            self.in_use = 0
+
+    def _on_connect(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.connects += 1
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        started = getattr(_checkout_started, 'at', None)
+        _checkout_started.at = None
+        with self._lock:
+            self.checkouts += 1
+            self.in_use += 1
+            self.peak_in_use = max(self.peak_in_use, self.in_use)
+            if started is not None:
+                wait = (time.perf_counter() - started) * 1000
+                if len(self._waits) < self.max_samples:
+                    self._waits.append(wait)
+                else:
+                    self._waits[self._next] = wait
+                    self._next = (self._next + 1) % self.max_samples
+                if wait >= 100:
+                    self.slow_checkouts += 1
+
+    def _on_checkin(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.in_use = max(0, self.in_use - 1)
+
+    def _on_invalidate(self, dbapi_connection, connection_record, exception):
+        with self._lock:
+            self.invalidations += 1
+
+    def stats(self):
+        pool = self.engine.pool if self.engine is not None else None
+        with self._lock:
+            waits = sorted(self._waits)
+            report = {
+                'in_use': self.in_use,
+                'peak_in_use': self.peak_in_use,
+                'checkouts': self.checkouts,
+                'connects': self.connects,
+                'invalidations': self.invalidations,
+                'slow_checkouts': self.slow_checkouts,
+                'checkout_wait_p50_ms': waits[len(waits) // 2] if waits else None,
+                'checkout_wait_p99_ms': waits[max(0, int(len(waits) * 0.99) - 1)] if waits else None,
+                'checkout_wait_max_ms': waits[-1] if waits else None,
+            }
+        if isinstance(pool, QueuePool):
+            report.update({
+                'pool_size': pool.size(),
+                'checked_in': pool.checkedin(),
+                'overflow': max(0, pool.overflow()),
+            })
+        return report
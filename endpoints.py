@@ -1,15 +1,161 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_jwt_extended import  create_access_token, jwt_required, get_jwt_identity
-from datetime import datetime
-
-from sqlalchemy import func, or_
+import base64
+import logging
+import os
+import time
+import uuid
+from datetime import datetime, timezone
+
+from sqlalchemy import and_, func, insert, or_, text
+from sqlalchemy.exc import DataError, IntegrityError
 # from models import User, Symptom, Condition, HistoryRecord, Notification,  SymptomCheck, DiagnosisSuggestion
-from models import TokenBlocklist, User
-
-from config import app, bcrypt,db 
-
-from ai import get_medical_analysis
-
+from models import HistoryRecord, TokenBlocklist, User
+
+from config import app, db, jwt, load_shedder, password_hasher, rate_limiter, replicas
+
+from ai import models as gemini_models
+from ai import get_medical_analyses, get_medical_analysis, stream_medical_analysis
+from boottime import boot
+from cache import normalize_symptoms
+from health import CachedCheck
+from jobs import JobQueue, QueueFull
+from jsonprovider import dumps, loads
+from metrics import registry
+from passwords import PasswordHasherBusy
+from profiles import ProfileCache, watch_users
+from replicas import replica_reads
+from revocation import RevocationCache
+from writebehind import WriteBehindBuffer
+
+analysis_jobs = JobQueue(
+    max_workers=app.config['ANALYSIS_WORKERS'],
+    max_queue=app.config['ANALYSIS_QUEUE_SIZE'],
+    result_ttl=app.config['ANALYSIS_JOB_TTL'],
+)
+registry.gauge('medicue_analysis_queue_depth', 'Async analysis jobs waiting for a worker', lambda: analysis_jobs.queued)
+registry.gauge('medicue_analysis_jobs_running', 'Async analysis jobs running', lambda: analysis_jobs.running)
+for _name, _help in (('submitted', 'Async analysis jobs accepted'), ('rejected', 'Async analysis jobs turned away, queue full'),
+                     ('completed', 'Async analysis jobs finished'), ('failed', 'Async analysis jobs that raised')):
+    registry.gauge(f'medicue_analysis_jobs_{_name}_total', _help,
+                   lambda _name=_name: getattr(analysis_jobs, _name), type='counter')
+registry.gauge('medicue_analysis_jobs_wait_seconds_total', 'Time async analysis jobs spent queued',
+               lambda: analysis_jobs.wait_time_total, type='counter')
+registry.gauge('medicue_analysis_jobs_run_seconds_total', 'Time async analysis jobs spent running',
+               lambda: analysis_jobs.run_time_total, type='counter')
+registry.gauge('medicue_analysis_jobs_wait_seconds_max', 'Longest time an async analysis job waited',
+               lambda: analysis_jobs.wait_time_max)
+registry.gauge('medicue_analysis_jobs_run_seconds_max', 'Longest async analysis job run', lambda: analysis_jobs.run_time_max)
+
+
+def save_history(records):
+    """Insert a batch of history rows in one executemany; rows already written by a retried batch are skipped"""
+    # Serialized here, on the writer thread, rather than on the request path
+    rows = [dict(record, result=dumps(record['result'])) for record in records]
+    statement = insert(HistoryRecord.__table__).prefix_with('OR IGNORE', dialect='sqlite') \
+        .prefix_with('IGNORE', dialect='mysql')
+    with app.app_context():
+        try:
+            db.session.execute(statement, rows)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+
+def dead_letter_history(records, errors):
+    """Rows the database refuses on their own - appended to a JSON-lines file to replay once the cause is fixed"""
+    for record, error in zip(records, errors):
+        logging.error(f"History record {record['record_uuid']} of user {record['user_id']} not written: {error}")
+    path = app.config['HISTORY_DEAD_LETTER']
+    if not path:
+        return
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'a', encoding='utf-8') as f:
+        for record, error in zip(records, errors):
+            row = dict(record, check_timestamp=record['check_timestamp'].isoformat(), error=str(error))
+            try:
+                line = dumps(row)
+            except (TypeError, ValueError):
+                line = dumps(dict(row, result=repr(record['result'])))  # the result itself may be the bad part
+            f.write(line + "\n")
+
+
+history_buffer = WriteBehindBuffer(
+    save_history,
+    flush_size=app.config['HISTORY_FLUSH_SIZE'],
+    flush_interval=app.config['HISTORY_FLUSH_INTERVAL'],
+    max_pending=app.config['HISTORY_MAX_PENDING'],
+    # Errors caused by a row rather than the database; a result that won't serialize counts too
+    row_errors=(IntegrityError, DataError, TypeError, ValueError),
+    dead_letter_fn=dead_letter_history,
+    shutdown_timeout=app.config['HISTORY_SHUTDOWN_TIMEOUT'],
+    name='history-writer',
+)
+registry.gauge('medicue_history_pending', 'Analysis history records waiting to be written',
+               lambda: history_buffer.pending)
+registry.gauge('medicue_history_written_total', 'Analysis history records written',
+               lambda: history_buffer.written, type='counter')
+registry.gauge('medicue_history_dropped_total', 'Analysis history records dropped with the buffer full',
+               lambda: history_buffer.dropped, type='counter')
+registry.gauge('medicue_history_dead_lettered_total', 'Analysis history records the database refused on their own',
+               lambda: history_buffer.dead_lettered, type='counter')
+
+
+def _top_confidence(result):
+    """Highest condition confidence of an analysis, from "70%"-style strings"""
+    scores = []
+    for condition in result.get('possible_conditions') or []:
+        try:
+            scores.append(float(str(condition.get('confidence', '')).strip().rstrip('%')))
+        except (AttributeError, ValueError):
+            continue
+    return max(scores) if scores else None
+
+
+def record_analysis(user_id, symptoms_text, result):
+    """Queue an analysis for the user's history - never waits on the database"""
+    if not app.config['HISTORY_ENABLED'] or "error_msg" in result:
+        return
+    # Dropped (and counted) when the buffer is full - the analysis is answered regardless
+    history_buffer.add({
+        'record_uuid': uuid.uuid4().hex,
+        'user_id': int(user_id),
+        'check_timestamp': datetime.now(timezone.utc),
+        'symptoms_text': symptoms_text,
+        'is_emergency': result.get('is_emergency') in ('true', True),
+        'final_confidence_score': _top_confidence(result),
+        'source': result.get('source', 'gemini'),
+        'result': result,
+    })
+
+
+def analyze_and_record(user_id, symptoms_text):
+    """get_medical_analysis for async jobs, recorded like the synchronous route"""
+    result = get_medical_analysis(symptoms_text)
+    record_analysis(user_id, symptoms_text, result)
+    return result
+
+
+revocation_cache = RevocationCache(
+    TokenBlocklist,
+    lambda: db.session,
+    sync_interval=app.config['JWT_REVOCATION_SYNC_INTERVAL'],
+    negative_size=app.config['JWT_REVOCATION_NEGATIVE_SIZE'],
+    default_ttl=app.config['JWT_ACCESS_TOKEN_EXPIRES'].total_seconds(),
+)
+
+profile_cache = ProfileCache(
+    max_entries=app.config['PROFILE_CACHE_SIZE'],
+    ttl=app.config['PROFILE_CACHE_TTL'],
+)
+watch_users(profile_cache, User)
+
+
+@jwt.token_in_blocklist_loader
+def check_if_token_revoked(jwt_header, jwt_payload):
+    """Reject logged-out tokens - answered from memory, not a query per request"""
+    return revocation_cache.is_revoked(jwt_payload['jti'])
 
 
 # ==========================================
@@ -17,6 +163,7 @@ from ai import get_medical_analysis
 # ==========================================
 
 @app.route('/api/auth/register', methods=['POST'])
+@load_shedder.limit('account')
 def register():
     """User Registration - REQ-6, REQ-7"""
     try:
@@ -31,7 +178,7 @@ def register():
             return jsonify({'error': 'Email already registered'}), 409
         
         # Hash password - REQ-8
-        password_hash = bcrypt.generate_password_hash(data['password']).decode('utf-8')
+        password_hash = password_hasher.hash(data['password'])
         
         # Create user
         new_user = User(
@@ -45,6 +192,8 @@ def register():
         
         db.session.add(new_user)
         db.session.commit()
+        # The login that follows must see the new row even if the replicas lag
+        replicas.pin(new_user.email)
         
         
         
@@ -53,12 +202,16 @@ def register():
             'user': new_user.to_dict()
         }), 201
         
+    except PasswordHasherBusy:
+        return jsonify({'error': 'Server busy, please retry later'}), 503, {'Retry-After': '1'}
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
 
 @app.route('/api/auth/login', methods=['POST'])
+@load_shedder.limit('account')
+@replica_reads(replicas, key=lambda: (request.get_json(silent=True) or {}).get('email'))
 def login():
     """User Login - REQ-9"""
     try:
@@ -68,11 +221,22 @@ def login():
             return jsonify({'error': 'Email and password are required'}), 400
         
         user = User.query.filter_by(email=data['email']).first()
+        if not user and replicas.read_primary():
+            # Registered on another worker moments ago, not replicated yet
+            user = User.query.filter_by(email=data['email']).first()
         
-        if not user or not bcrypt.check_password_hash(user.password_hash, data['password']):
+        if not user or not password_hasher.check(user.password_hash, data['password']):
             return jsonify({'error': 'Invalid email or password'}), 401
         
-        access_token = create_access_token(identity=user.user_id)
+        # Upgrade hashes made with an older work factor while we have the plain password
+        if password_hasher.needs_rehash(user.password_hash):
+            try:
+                user.password_hash = password_hasher.rehash(data['password'])
+                db.session.commit()
+            except PasswordHasherBusy:
+                pass  # Picked up on a later login
+        
+        access_token = create_access_token(identity=str(user.user_id))
         
         return jsonify({
             'message': 'Login successful',
@@ -80,22 +244,43 @@ def login():
             'user': user.to_dict()
         }), 200
         
+    except PasswordHasherBusy:
+        return jsonify({'error': 'Server busy, please retry later'}), 503, {'Retry-After': '1'}
     except Exception as e:
+        db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
 
 @app.route('/api/auth/profile', methods=['GET'])
 @jwt_required()
+@load_shedder.limit('account')
+@replica_reads(replicas)
 def get_profile():
-    """Get User Profile - REQ-11"""
+    """Get User Profile - REQ-11
+
+    Answers 304 to If-None-Match / If-Modified-Since when the profile hasn't changed;
+    served from the per-process profile cache without a query when possible.
+    """
     try:
         user_id = get_jwt_identity()
-        user = User.query.get(user_id)
-        
-        if not user:
-            return jsonify({'error': 'User not found'}), 404
-        
-        return jsonify(user.to_dict()), 200
+        entry = profile_cache.get(user_id)
+        if entry is None:
+            user = User.query.get(user_id)
+            if not user and replicas.read_primary():
+                user = User.query.get(user_id)
+            
+            if not user:
+                return jsonify({'error': 'User not found'}), 404
+            entry = profile_cache.put(user)
+        
+        body, etag, modified = entry
+        response = jsonify(body)
+        response.set_etag(etag)
+        if modified is not None:
+            response.last_modified = modified
+        # Clients may keep the body but must revalidate it each time
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response.make_conditional(request)
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -105,15 +290,19 @@ from flask_jwt_extended import get_jwt
 
 @app.route('/api/auth/logout', methods=['DELETE'])
 @jwt_required()
+@load_shedder.limit('account')
 def logout():
     """User Logout - REQ-10"""
     try:
-        # Get the unique identifier (JTI) for the current JWT
-        jti = get_jwt()["jti"]
+        # Get the unique identifier (JTI) and expiry of the current JWT
+        token = get_jwt()
+        jti = token["jti"]
+        expires_at = datetime.fromtimestamp(token["exp"], timezone.utc)
         
         # Add the JTI to our blocklist in the database
-        db.session.add(TokenBlocklist(jti=jti))
+        db.session.add(TokenBlocklist(jti=jti, expires_at=expires_at))
         db.session.commit()
+        revocation_cache.revoke(jti, token["exp"])
         
         return jsonify({'message': 'Access token revoked successfully'}), 200
         
@@ -219,156 +408,415 @@ def logout():
 # ==========================================
 # SYMPTOM CHECK & DIAGNOSIS
 # ==========================================
+def has_symptoms(text):
+    """A symptom text worth analyzing - a string with something other than whitespace"""
+    return isinstance(text, str) and bool(text.strip())
+
+
 @app.route('/api/analyze', methods=['POST'])
 @jwt_required()
+@rate_limiter.limit()
+@load_shedder.limit('analysis')
 def symptom_check():
     current_user_id = get_jwt_identity()
-    data = request.json
-    symptoms_text = data.get('symptoms_text', "")
+    data = request.get_json(silent=True)
+    symptoms_text = data.get('symptoms_text') if isinstance(data, dict) else None
     
-    if not symptoms_text:
+    if not has_symptoms(symptoms_text):
         return jsonify({"error": "No symptoms provided"}), 400
 
+    if request.args.get('mode') == 'async':
+        # Queue the Gemini call and free this worker thread right away
+        try:
+            job = analysis_jobs.submit(current_user_id, analyze_and_record, current_user_id, symptoms_text)
+        except QueueFull as e:
+            return jsonify({"error": "Server busy, please retry later"}), 503, {'Retry-After': str(e.retry_after)}
+        return jsonify({
+            'job_id': job.job_id,
+            'status': job.status,
+            'status_url': f'/api/analyze/jobs/{job.job_id}'
+        }), 202
+
     # Call Gemini to get structured analysis
     analysis_result = get_medical_analysis(symptoms_text)
+    record_analysis(current_user_id, symptoms_text, analysis_result)
     
     # Return the structured data to the Android App [cite: 502, 506]
     return jsonify(analysis_result)
 
+
+def batch_cost():
+    """One token per distinct non-empty text of a batch - duplicates share one model call"""
+    data = request.get_json(silent=True)
+    texts = data.get('symptoms_texts') if isinstance(data, dict) else None
+    if not isinstance(texts, list):
+        return 1
+    return max(1, len({normalize_symptoms(text) for text in texts if has_symptoms(text)}))
+
+
+@app.route('/api/analyze/batch', methods=['POST'])
+@jwt_required()
+@rate_limiter.limit(cost=batch_cost)
+@load_shedder.limit('analysis')
+def symptom_check_batch():
+    """Analyze several symptom reports in one call - results come back in request order"""
+    current_user_id = get_jwt_identity()
+    data = request.get_json(silent=True)
+    symptoms_texts = data.get('symptoms_texts') if isinstance(data, dict) else None
+
+    if not isinstance(symptoms_texts, list) or not symptoms_texts:
+        return jsonify({"error": "symptoms_texts must be a non-empty list"}), 400
+    if len(symptoms_texts) > app.config['ANALYSIS_BATCH_MAX']:
+        return jsonify({"error": f"At most {app.config['ANALYSIS_BATCH_MAX']} symptom texts per batch"}), 400
+
+    valid = [text for text in symptoms_texts if has_symptoms(text)]
+    analyses = iter(get_medical_analyses(valid, app.config['ANALYSIS_BATCH_CONCURRENCY']))
+
+    results = []
+    for index, text in enumerate(symptoms_texts):
+        if not has_symptoms(text):
+            results.append({'index': index, 'error': 'No symptoms provided'})
+            continue
+        result, error = next(analyses)
+        if error is not None:
+            results.append({'index': index, 'error': error})
+        else:
+            record_analysis(current_user_id, text, result)
+            results.append({'index': index, 'result': result})
+
+    return jsonify({'results': results}), 200
+
+
+@app.route('/api/analyze/stream', methods=['POST'])
+@jwt_required()
+@rate_limiter.limit()
+@load_shedder.limit('analysis')
+def symptom_check_stream():
+    """Server-Sent Events version of /api/analyze - is_emergency, then conditions, then recommendations"""
+    current_user_id = get_jwt_identity()
+    data = request.get_json(silent=True)
+    symptoms_text = data.get('symptoms_text') if isinstance(data, dict) else None
+
+    if not has_symptoms(symptoms_text):
+        return jsonify({"error": "No symptoms provided"}), 400
+
+    def events():
+        for event, payload in stream_medical_analysis(symptoms_text):
+            if event == 'done':
+                record_analysis(current_user_id, symptoms_text, payload)
+            yield f"event: {event}\ndata: {dumps(payload)}\n\n"
+
+    return Response(
+        stream_with_context(events()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+@app.route('/api/analyze/jobs/<job_id>', methods=['GET'])
+@jwt_required()
+def analysis_job_status(job_id):
+    """Poll an async analysis job - returns its status, and the result once done"""
+    job = analysis_jobs.get(job_id, get_jwt_identity())
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job.to_dict()), 200
+
+
+# ==========================================
+# ANALYSIS HISTORY
+# ==========================================
+# Pages and exports walk ix_history_record_user_time: (user_id, check_timestamp DESC, history_id DESC).
+# A page starts after the (timestamp, id) of the previous page's last row instead of at an OFFSET,
+# so page 1000 costs what page 1 does.
+
+# API field -> column
+HISTORY_FIELDS = {
+    'history_id': HistoryRecord.history_id,
+    'timestamp': HistoryRecord.check_timestamp,
+    'symptoms_text': HistoryRecord.symptoms_text,
+    'is_emergency': HistoryRecord.is_emergency,
+    'final_confidence_score': HistoryRecord.final_confidence_score,
+    'source': HistoryRecord.source,
+    'result': HistoryRecord.result,
+}
+
+
+def history_fields():
+    """Fields named in ?fields=a,b (all of them by default), or None when one is unknown"""
+    requested = request.args.get('fields')
+    if not requested:
+        return list(HISTORY_FIELDS)
+    fields = list(dict.fromkeys(name.strip() for name in requested.split(',') if name.strip()))
+    if not fields or any(name not in HISTORY_FIELDS for name in fields):
+        return None
+    return fields
+
+
+def history_query(user_id, fields):
+    """SELECT of just the asked-for columns (plus the cursor's) for a user, in index order"""
+    names = list(dict.fromkeys(fields + ['history_id', 'timestamp']))
+    return db.select(*[HISTORY_FIELDS[name].label(name) for name in names]) \
+        .where(HistoryRecord.user_id == int(user_id)) \
+        .order_by(HistoryRecord.check_timestamp.desc(), HistoryRecord.history_id.desc())
+
+
+def encode_history_cursor(row):
+    position = f"{row.timestamp.isoformat()}|{row.history_id}"
+    return base64.urlsafe_b64encode(position.encode('utf-8')).decode('ascii')
+
+
+def decode_history_cursor(cursor):
+    """(timestamp, history_id) of the row a page starts after; ValueError when it's not a cursor of ours"""
+    timestamp, history_id = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8').split('|')
+    return datetime.fromisoformat(timestamp), int(history_id)
+
+
+def history_item(row, fields):
+    item = {}
+    for name in fields:
+        value = row._mapping[name]
+        if name == 'timestamp' and value is not None:
+            value = value.isoformat()
+        elif name == 'result':
+            value = loads(value)
+        item[name] = value
+    return item
+
+
+def history_line(row, fields):
+    """One NDJSON line - the stored result JSON is spliced in as is rather than parsed and encoded again"""
+    item = history_item(row, [name for name in fields if name != 'result'])
+    line = dumps(item)
+    if 'result' in fields:
+        line = f"{line[:-1]}{',' if item else ''}\"result\":{row._mapping['result']}}}"
+    return line + "\n"
+
+
+@app.route('/api/history', methods=['GET'])
+@jwt_required()
+@replica_reads(replicas)
+def get_history():
+    """User's analysis history, newest first - REQ-12, REQ-13
+
+    ?limit= records per page, ?fields=a,b to pick fields, ?cursor= the next_cursor of the previous page.
+    """
+    fields = history_fields()
+    if fields is None:
+        return jsonify({'error': f"fields must be among {', '.join(HISTORY_FIELDS)}"}), 400
+    try:
+        limit = int(request.args.get('limit', app.config['HISTORY_PAGE_SIZE']))
+    except ValueError:
+        return jsonify({'error': 'limit must be a number'}), 400
+    limit = max(1, min(limit, app.config['HISTORY_PAGE_MAX']))
+
+    query = history_query(get_jwt_identity(), fields)
+    cursor = request.args.get('cursor')
+    if cursor:
+        try:
+            timestamp, history_id = decode_history_cursor(cursor)
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor'}), 400
+        query = query.where(or_(
+            HistoryRecord.check_timestamp < timestamp,
+            and_(HistoryRecord.check_timestamp == timestamp, HistoryRecord.history_id < history_id),
+        ))
+
+    # One row past the page tells whether there is a next one
+    rows = db.session.execute(query.limit(limit + 1)).all()
+    next_cursor = encode_history_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return jsonify({'items': [history_item(row, fields) for row in rows[:limit]], 'next_cursor': next_cursor}), 200
+
+
+@app.route('/api/history/export', methods=['GET'])
+@jwt_required()
+@replica_reads(replicas)
+def export_history():
+    """The whole history as NDJSON, newest first (?fields= as for /api/history).
+
+    Rows come from a server-side cursor HISTORY_EXPORT_CHUNK at a time and go out as they are read,
+    so memory doesn't grow with the number of records.
+    """
+    fields = history_fields()
+    if fields is None:
+        return jsonify({'error': f"fields must be among {', '.join(HISTORY_FIELDS)}"}), 400
+    query = history_query(get_jwt_identity(), fields) \
+        .execution_options(stream_results=True, yield_per=app.config['HISTORY_EXPORT_CHUNK'])
+
+    def lines():
+        result = db.session.execute(query)
+        try:
+            for rows in result.partitions():
+                yield ''.join(history_line(row, fields) for row in rows)
+        finally:
+            result.close()
+
+    return Response(
+        stream_with_context(lines()),
+        mimetype='application/x-ndjson',
+        headers={'Content-Disposition': 'attachment; filename="history.ndjson"', 'X-Accel-Buffering': 'no'}
+    )
+
+
+# ==========================================
+# HEALTH CHECK
+# ==========================================
+
+def ping_database():
+    with db.engine.connect() as connection:
+        connection.execute(text('SELECT 1'))
+
+
+database_check = CachedCheck(ping_database, ttl=app.config['HEALTH_DB_PING_TTL'])
+
+
+@app.route('/api/health', methods=['GET'])
+def health_check():
+    """Liveness - the process answers; no database or Gemini call"""
+    return jsonify({
+        'status': 'healthy',
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'uptime_seconds': round(time.perf_counter() - boot.started, 3),
+        'version': '1.0.0'
+    }), 200
+
+
+@app.route('/api/ready', methods=['GET'])
+def readiness_check():
+    """Readiness - database reachable (cached ping); 503 otherwise. Gemini is reported, never called"""
+    database_ok, database_error, checked_ago = database_check()
+    gemini_state = gemini_models.breaker.state
+    if not database_ok:
+        status = 'unavailable'
+    elif gemini_state != 'closed':
+        status = 'degraded'  # analyses fall back to local triage while the circuit is open
+    else:
+        status = 'ready'
+    return jsonify({
+        'status': status,
+        'database': {'ok': database_ok, 'error': database_error, 'checked_seconds_ago': round(checked_ago, 3)},
+        'gemini': {'circuit': gemini_state},
+        'load': load_shedder.stats(),
+        'rate_limits': rate_limiter.stats(),
+    }), 200 if database_ok else 503
+
+
 # @app.route('/api/symptom-check', methods=['POST'])
 # @jwt_required()
 # def symptom_check():
-    """Analyze symptoms and provide diagnosis - REQ-1 to REQ-5, REQ-18 to REQ-24"""
-    try:
-        user_id = get_jwt_identity()
-        data = request.get_json()
+#     """Analyze symptoms and provide diagnosis - REQ-1 to REQ-5, REQ-18 to REQ-24"""
+#     try:
+#         user_id = get_jwt_identity()
+#         data = request.get_json()
         
-        symptom_ids = data.get('symptom_ids', [])
-        if not symptom_ids:
-            return jsonify({'error': 'Please provide at least one symptom'}), 400
+#         symptom_ids = data.get('symptom_ids', [])
+#         if not symptom_ids:
+#             return jsonify({'error': 'Please provide at least one symptom'}), 400
         
-        # Create history record
-        history_record = HistoryRecord(
-            user_id=user_id,
-            check_timestamp=datetime.utcnow()
-        )
-        db.session.add(history_record)
-        db.session.flush()  # Get history_id
-        
-        # Check for critical symptoms - REQ-18
-        has_emergency = False
-        for symptom_id in symptom_ids:
-            symptom = Symptom.query.get(symptom_id)
-            if symptom:
-                is_critical = symptom.severity_rating == 'High'
-                if is_critical:
-                    has_emergency = True
+#         # Create history record
+#         history_record = HistoryRecord(
+#             user_id=user_id,
+#             check_timestamp=datetime.utcnow()
+#         )
+#         db.session.add(history_record)
+#         db.session.flush()  # Get history_id
+        
+#         # Check for critical symptoms - REQ-18
+#         has_emergency = False
+#         for symptom_id in symptom_ids:
+#             symptom = Symptom.query.get(symptom_id)
+#             if symptom:
+#                 is_critical = symptom.severity_rating == 'High'
+#                 if is_critical:
+#                     has_emergency = True
                 
-                symptom_check = SymptomCheck(
-                    history_id=history_record.history_id,
-                    symptom_id=symptom_id,
-                    is_critical=is_critical
-                )
-                db.session.add(symptom_check)
-        
-        # Find matching conditions using simple algorithm
-        # In production, this would be more sophisticated
-        all_conditions = Condition.query.all()
-        matches = []
-        
-        for condition in all_conditions:
-            # Get symptoms associated with this condition
-            # This is simplified - in production, use proper symptom_condition_map
-            match_score = 0
-            total_symptoms = len(symptom_ids)
+#                 symptom_check = SymptomCheck(
+#                     history_id=history_record.history_id,
+#                     symptom_id=symptom_id,
+#                     is_critical=is_critical
+#                 )
+#                 db.session.add(symptom_check)
+        
+#         # Find matching conditions using simple algorithm
+#         # In production, this would be more sophisticated
+#         all_conditions = Condition.query.all()
+#         matches = []
+        
+#         for condition in all_conditions:
+#             # Get symptoms associated with this condition
+#             # This is simplified - in production, use proper symptom_condition_map
+#             match_score = 0
+#             total_symptoms = len(symptom_ids)
             
-            # Simple matching logic (you'd enhance this with actual mappings)
-            # For now, using condition name keywords matching symptom names
-            for symptom_id in symptom_ids:
-                symptom = Symptom.query.get(symptom_id)
-                if symptom and (symptom.name.lower() in condition.name.lower() or 
-                               symptom.name.lower() in condition.overview.lower()):
-                    match_score += 1
+#             # Simple matching logic (you'd enhance this with actual mappings)
+#             # For now, using condition name keywords matching symptom names
+#             for symptom_id in symptom_ids:
+#                 symptom = Symptom.query.get(symptom_id)
+#                 if symptom and (symptom.name.lower() in condition.name.lower() or 
+#                                symptom.name.lower() in condition.overview.lower()):
+#                     match_score += 1
             
-            if match_score > 0:
-                confidence = (match_score / total_symptoms) * 100
-                matches.append({
-                    'condition': condition,
-                    'confidence': confidence
-                })
-        
-        # Sort by confidence
-        matches.sort(key=lambda x: x['confidence'], reverse=True)
-        
-        # Save top diagnosis suggestions
-        top_confidence = 0
-        for match in matches[:5]:  # Top 5 matches
-            suggestion = DiagnosisSuggestion(
-                history_id=history_record.history_id,
-                condition_id=match['condition'].condition_id,
-                confidence_level=match['confidence']
-            )
-            db.session.add(suggestion)
-            if match['confidence'] > top_confidence:
-                top_confidence = match['confidence']
-        
-        history_record.final_confidence_score = top_confidence
-        
-        # Create emergency alert notification if needed - REQ-19
-        if has_emergency:
-            notification = Notification(
-                user_id=user_id,
-                notif_type='Alert',
-                message_body='EMERGENCY: Your symptoms may require immediate medical attention. Please consult a healthcare professional or visit the emergency room.',
-                scheduled_time=datetime.utcnow()
-            )
-            db.session.add(notification)
+#             if match_score > 0:
+#                 confidence = (match_score / total_symptoms) * 100
+#                 matches.append({
+#                     'condition': condition,
+#                     'confidence': confidence
+#                 })
+        
+#         # Sort by confidence
+#         matches.sort(key=lambda x: x['confidence'], reverse=True)
+        
+#         # Save top diagnosis suggestions
+#         top_confidence = 0
+#         for match in matches[:5]:  # Top 5 matches
+#             suggestion = DiagnosisSuggestion(
+#                 history_id=history_record.history_id,
+#                 condition_id=match['condition'].condition_id,
+#                 confidence_level=match['confidence']
+#             )
+#             db.session.add(suggestion)
+#             if match['confidence'] > top_confidence:
+#                 top_confidence = match['confidence']
+        
+#         history_record.final_confidence_score = top_confidence
+        
+#         # Create emergency alert notification if needed - REQ-19
+#         if has_emergency:
+#             notification = Notification(
+#                 user_id=user_id,
+#                 notif_type='Alert',
+#                 message_body='EMERGENCY: Your symptoms may require immediate medical attention. Please consult a healthcare professional or visit the emergency room.',
+#                 scheduled_time=datetime.utcnow()
+#             )
+#             db.session.add(notification)
         
-        db.session.commit()
+#         db.session.commit()
         
-        # Prepare response
-        result = {
-            'history_id': history_record.history_id,
-            'timestamp': history_record.check_timestamp.isoformat(),
-            'has_emergency': has_emergency,
-            'final_confidence_score': float(top_confidence),
-            'diagnoses': [
-                {
-                    'condition': m['condition'].to_dict(),
-                    'confidence': m['confidence']
-                } for m in matches[:5]
-            ]
-        }
-        
-        return jsonify(result), 200
+#         # Prepare response
+#         result = {
+#             'history_id': history_record.history_id,
+#             'timestamp': history_record.check_timestamp.isoformat(),
+#             'has_emergency': has_emergency,
+#             'final_confidence_score': float(top_confidence),
+#             'diagnoses': [
+#                 {
+#                     'condition': m['condition'].to_dict(),
+#                     'confidence': m['confidence']
+#                 } for m in matches[:5]
+#             ]
+#         }
         
-    except Exception as e:
-        db.session.rollback()
-        return jsonify({'error': str(e)}), 500
+#         return jsonify(result), 200
+        
+#     except Exception as e:
+#         db.session.rollback()
+#         return jsonify({'error': str(e)}), 500
 
 
 # # ==========================================
 # # HISTORY ENDPOINTS
 # # ==========================================
 
-# @app.route('/api/history', methods=['GET'])
-# @jwt_required()
-# def get_history():
-#     """Get user's symptom check history - REQ-12, REQ-13"""
-#     try:
-#         user_id = get_jwt_identity()
-        
-#         # Get history in reverse chronological order - REQ-13
-#         history = HistoryRecord.query.filter_by(user_id=user_id)\
-#             .order_by(HistoryRecord.check_timestamp.desc())\
-#             .all()
-        
-#         return jsonify([h.to_dict() for h in history]), 200
-        
-#     except Exception as e:
-#         return jsonify({'error': str(e)}), 500
-
-
 # @app.route('/api/history/<int:history_id>', methods=['GET'])
 # @jwt_required()
 # def get_history_detail(history_id):
@@ -530,18 +978,3 @@ def symptom_check():
 #     except Exception as e:
 #         db.session.rollback()
 #         return jsonify({'error': str(e)}), 500
-
-
-# # ==========================================
-# # HEALTH CHECK
-# # ==========================================
-
-# @app.route('/api/health', methods=['GET'])
-# def health_check():
-#     """API Health Check"""
-#     return jsonify({
-#         'status': 'healthy',
-#         'timestamp': datetime.utcnow().isoformat(),
-#         'version': '1.0.0'
-#     }), 200
-
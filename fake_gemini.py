@@ -0,0 +1,210 @@
+# ==========================================
+# FAKE GEMINI SERVER
+# ==========================================
+# A local stand-in for the Gemini REST API (generateContent and
+# streamGenerateContent), for exercising the real client - timeouts,
+# retries, the circuit breaker, hedging - without a key or network.
+#
+#   python fake_gemini.py --port 8765 --latency-ms 300 --error-rate 0.1
+#   GEMINI_BASE_URL=http://127.0.0.1:8765 python main.py
+
+import argparse
+import json
+import math
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+REPLY = {
+    "is_emergency": "false",
+    "possible_conditions": [{"name": "Common Cold", "confidence": "70%"}],
+    "recommendations": "Rest, fluids and over-the-counter medication. See a doctor if symptoms persist.",
+}
+
+_PATH = re.compile(r"^/[^/]+/models/(?P<model>[^:/]+):(?P<method>generateContent|streamGenerateContent)")
+
+
+class _HTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Hundreds of concurrent calls (ASGI mode) must not be refused at connect
+    request_queue_size = 1024
+
+
+class FakeGeminiServer:
+    """Threaded HTTP server answering like Gemini with configurable latency and failures.
+
+    latency_ms / jitter_ms: base response time plus uniform jitter
+    latency_sigma:          when > 0 the base time is log-normal with median latency_ms
+                            (a long right tail, like real model latency)
+    slow_rate / slow_ms:    fraction of calls that take slow_ms instead (tail latency)
+    error_rate / error_status: fraction of calls answered with that HTTP error
+    model_latency_ms:       {model: latency_ms} overrides, e.g. a faster secondary model
+    stream_stall_ms:        pause after the first streamed chunk (a stream that stalls mid-way)
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency_ms=100.0, jitter_ms=0.0, slow_rate=0.0, slow_ms=5000.0,
+                 error_rate=0.0, error_status=503, model_latency_ms=None, reply=None, seed=None, latency_sigma=0.0,
+                 stream_stall_ms=0.0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.latency_sigma = latency_sigma
+        self.slow_rate = slow_rate
+        self.slow_ms = slow_ms
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.model_latency_ms = dict(model_latency_ms or {})
+        self.stream_stall_ms = stream_stall_ms
+        self.reply = json.dumps(reply or REPLY)
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = {}
+        self.errors = 0
+        self.httpd = _HTTPServer((host, port), self._handler())
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name='fake-gemini', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def _plan(self, model):
+        """(seconds to wait, error status or None) for the next call"""
+        with self._lock:
+            self.calls[model] = self.calls.get(model, 0) + 1
+            latency = self.model_latency_ms.get(model, self.latency_ms)
+            if self.latency_sigma > 0 and latency > 0:
+                latency = self._random.lognormvariate(math.log(latency), self.latency_sigma)
+            if self._random.random() < self.slow_rate:
+                latency = self.slow_ms
+            latency += self._random.uniform(0, self.jitter_ms)
+            failed = self._random.random() < self.error_rate
+            if failed:
+                self.errors += 1
+        return latency / 1000.0, (self.error_status if failed else None)
+
+    def _body(self, text, reply, prompt_tokens, done=True):
+        body = {"candidates": [{"content": {"parts": [{"text": text}], "role": "model"}, "index": 0}]}
+        if done:
+            body["candidates"][0]["finishReason"] = "STOP"
+            # Rough token counts (4 characters a token), enough to compare prompts
+            body["usageMetadata"] = {
+                "promptTokenCount": prompt_tokens,
+                "candidatesTokenCount": len(reply) // 4,
+                "totalTokenCount": prompt_tokens + len(reply) // 4,
+            }
+        return body
+
+    def _reply_for(self, request):
+        """(reply text, prompt tokens) - without JSON mode the reply comes fenced like a chat answer"""
+        generation = request.get('generationConfig') or {}
+        prompt_chars = len(json.dumps(request.get('contents', ''))) + len(json.dumps(request.get('systemInstruction', '')))
+        reply = self.reply
+        if generation.get('responseMimeType') != 'application/json':
+            reply = f"```json\n{json.dumps(json.loads(reply), indent=4)}\n```"
+        return reply, prompt_chars // 4
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, status, body):
+                data = json.dumps(body).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                raw = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                try:
+                    payload = json.loads(raw or b'{}')
+                except ValueError:
+                    payload = {}
+                match = _PATH.match(self.path)
+                if match is None:
+                    self._send_json(404, {"error": {"code": 404, "message": "Not found", "status": "NOT_FOUND"}})
+                    return
+                delay, error = server._plan(match['model'])
+                if error is not None:
+                    time.sleep(delay / 10)
+                    self._send_json(error, {"error": {"code": error, "message": "Fake failure", "status": "UNAVAILABLE"}})
+                    return
+                reply, prompt_tokens = server._reply_for(payload)
+                if match['method'] == 'generateContent':
+                    time.sleep(delay)
+                    self._send_json(200, server._body(reply, reply, prompt_tokens))
+                    return
+
+                # Streaming: the reply in a few SSE chunks spread over the latency
+                pieces = [reply[i:i + 40] for i in range(0, len(reply), 40)]
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.end_headers()
+                try:
+                    for i, piece in enumerate(pieces):
+                        time.sleep(delay / len(pieces))
+                        event = f"data: {json.dumps(server._body(piece, reply, prompt_tokens, done=i == len(pieces) - 1))}\r\n\r\n".encode('utf-8')
+                        self.wfile.write(f"{len(event):x}\r\n".encode('ascii') + event + b"\r\n")
+                        self.wfile.flush()
+                        if i == 0 and server.stream_stall_ms:
+                            time.sleep(server.stream_stall_ms / 1000.0)
+                    self.wfile.write(b"0\r\n\r\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # the client closed the stream
+
+        return Handler
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local fake of the Gemini generateContent API")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency-ms', type=float, default=300.0)
+    parser.add_argument('--jitter-ms', type=float, default=100.0)
+    parser.add_argument('--latency-sigma', type=float, default=0.0,
+                        help="log-normal spread of the latency around --latency-ms (0 = fixed plus jitter)")
+    parser.add_argument('--slow-rate', type=float, default=0.0, help="fraction of calls that take --slow-ms")
+    parser.add_argument('--slow-ms', type=float, default=5000.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--error-status', type=int, default=503)
+    parser.add_argument('--model-latency', action='append', default=[], metavar='MODEL=MS',
+                        help="latency override for one model, e.g. gemini-2.0-flash-lite=80")
+    parser.add_argument('--stream-stall-ms', type=float, default=0.0, help="pause after the first streamed chunk")
+    parser.add_argument('--seed', type=int, default=None, help="repeatable latencies and failures")
+    args = parser.parse_args(argv)
+
+    server = FakeGeminiServer(
+        args.host, args.port,
+        latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, latency_sigma=args.latency_sigma,
+        slow_rate=args.slow_rate, slow_ms=args.slow_ms,
+        error_rate=args.error_rate, error_status=args.error_status,
+        model_latency_ms={model: float(ms) for model, ms in (item.split('=', 1) for item in args.model_latency)},
+        seed=args.seed, stream_stall_ms=args.stream_stall_ms,
+    )
+    print(f"Fake Gemini listening on {server.url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
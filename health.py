@@ -0,0 +1,48 @@
+# ==========================================
+# HEALTH CHECKS
+# ==========================================
+# GET /api/health (liveness) answers from memory. GET /api/ready (readiness)
+# adds a database ping that is cached, so probes from any number of load
+# balancers cost at most one query per ttl per worker. Neither calls Gemini;
+# readiness reports the circuit breaker state instead.
+
+import threading
+import time
+
+
+class CachedCheck:
+    """Runs `check` at most once per `ttl` seconds.
+
+    Callers arriving while a check runs get the previous result instead of
+    waiting on it (only the very first caller waits). `check` returns nothing
+    or raises; the result is (ok, error message or None, seconds since it ran).
+    """
+
+    def __init__(self, check, ttl=5.0):
+        self.check = check
+        self.ttl = ttl
+        self._result = None  # (ok, error, monotonic time of the check)
+        self._lock = threading.Lock()
+        self.runs = 0
+
+    def __call__(self):
+        result = self._result
+        if result is None or time.monotonic() - result[2] >= self.ttl:
+            if self._lock.acquire(blocking=result is None):
+                try:
+                    result = self._result
+                    if result is None or time.monotonic() - result[2] >= self.ttl:
+                        result = self._run()
+                finally:
+                    self._lock.release()
+        ok, error, checked_at = result
+        return ok, error, time.monotonic() - checked_at
+
+    def _run(self):
+        self.runs += 1
+        try:
+            self.check()
+            self._result = (True, None, time.monotonic())
+        except Exception as e:
+            self._result = (False, str(e), time.monotonic())
+        return self._result
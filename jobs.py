@@ -0,0 +1,152 @@
+# ==========================================
+# BACKGROUND ANALYSIS JOBS
+# ==========================================
+
+import math
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+
+class QueueFull(Exception):
+    """Raised when every worker is busy and the wait queue is at capacity"""
+
+    def __init__(self, retry_after):
+        super().__init__("Analysis queue is full")
+        self.retry_after = retry_after
+
+
+class Job:
+    def __init__(self, owner):
+        self.job_id = uuid.uuid4().hex
+        self.owner = owner
+        self.status = 'queued'
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.result = None
+        self.error = None
+
+    def to_dict(self):
+        data = {
+            'job_id': self.job_id,
+            'status': self.status,
+            'submitted_at': self.submitted_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+        }
+        if self.status == 'done':
+            data['result'] = self.result
+        elif self.status == 'failed':
+            data['error'] = self.error
+        return data
+
+
+class JobQueue:
+    """Bounded executor: at most max_workers running and max_queue waiting, never more"""
+
+    def __init__(self, max_workers=4, max_queue=32, result_ttl=600):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.result_ttl = result_ttl
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='analysis-job')
+        self._slots = threading.BoundedSemaphore(max_workers + max_queue)
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.running = 0
+        self.submitted = 0
+        self.rejected = 0
+        self.completed = 0
+        self.failed = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+        self.run_time_total = 0.0
+        self.run_time_max = 0.0
+
+    def submit(self, owner, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise QueueFull(self.retry_after())
+        job = Job(owner)
+        with self._lock:
+            self._prune(time.time())
+            self._jobs[job.job_id] = job
+            self.submitted += 1
+            self.queued += 1
+        self._executor.submit(self._run, job, fn, args)
+        return job
+
+    def _run(self, job, fn, args):
+        job.started_at = time.time()
+        job.status = 'running'
+        waited = job.started_at - job.submitted_at
+        with self._lock:
+            self.queued -= 1
+            self.running += 1
+            self.wait_time_total += waited
+            self.wait_time_max = max(self.wait_time_max, waited)
+        try:
+            job.result = fn(*args)
+            job.status = 'done'
+        except Exception as e:
+            job.error = str(e)
+            job.status = 'failed'
+        finally:
+            job.finished_at = time.time()
+            ran = job.finished_at - job.started_at
+            with self._lock:
+                self.running -= 1
+                self.run_time_total += ran
+                self.run_time_max = max(self.run_time_max, ran)
+                if job.status == 'done':
+                    self.completed += 1
+                else:
+                    self.failed += 1
+            self._slots.release()
+
+    def _prune(self, now):
+        # Finished jobs are kept for result_ttl seconds so clients can poll them
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.finished_at is not None and now - job.finished_at > self.result_ttl]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def get(self, job_id, owner):
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None or job.owner != owner:
+            return None
+        return job
+
+    def retry_after(self):
+        """Seconds until a slot is likely to free up, from the mean run time so far"""
+        with self._lock:
+            finished = self.completed + self.failed
+            mean_run = self.run_time_total / finished if finished else 1.0
+            backlog = self.queued + self.running
+        return max(1, math.ceil(mean_run * backlog / self.max_workers))
+
+    def stats(self):
+        with self._lock:
+            finished = self.completed + self.failed
+            started = finished + self.running
+            return {
+                'max_workers': self.max_workers,
+                'max_queue': self.max_queue,
+                'queue_depth': self.queued,
+                'running': self.running,
+                'submitted': self.submitted,
+                'rejected': self.rejected,
+                'completed': self.completed,
+                'failed': self.failed,
+                'wait_time_avg': self.wait_time_total / started if started else 0.0,
+                'wait_time_max': self.wait_time_max,
+                'run_time_avg': self.run_time_total / finished if finished else 0.0,
+                'run_time_max': self.run_time_max,
+            }
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
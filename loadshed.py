@@ -0,0 +1,186 @@
+# ==========================================
+# LOAD SHEDDING
+# ==========================================
+# Every limited route belongs to a class with its own concurrency limit,
+# adapted to the latency the class observes. A request over its class limit
+# is answered 503 with Retry-After at once instead of waiting for a thread
+# until the client gives up.
+#
+# Classes have priorities: a class leaves the `reserve` request slots of the
+# classes above it free (those already in use by them count toward it), so a
+# burst of analyses is shed while login and profile still find a thread.
+
+import math
+import threading
+import time
+from functools import wraps
+
+from flask import g, jsonify
+
+from metrics import LOAD_SHED
+
+
+class AdaptiveLimit:
+    """Concurrency limit following the latency gradient (long-run over recent average latency).
+
+    While recent requests are no slower than `tolerance` x the long-run average the limit grows
+    by about sqrt(limit) per sample (only when it is actually used); past that it shrinks in
+    proportion to the slowdown, at most by half. Failed requests count as a halving.
+    """
+
+    def __init__(self, initial=10, min_limit=1, max_limit=100, tolerance=2.0, smoothing=0.2,
+                 short_window=10, long_window=500):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.tolerance = tolerance
+        self.smoothing = smoothing
+        self.limit = float(min(max(initial, min_limit), max_limit))
+        self._short_alpha = 2.0 / (short_window + 1)
+        self._long_alpha = 2.0 / (long_window + 1)
+        self.short_latency = None
+        self.long_latency = None
+        self._lock = threading.Lock()
+
+    def sample(self, seconds, in_flight, failed=False):
+        """Record one finished request; returns the gradient (1.0 = not congested)"""
+        with self._lock:
+            if self.short_latency is None:
+                self.short_latency = self.long_latency = seconds
+            else:
+                # One stalled request must not look like congestion: cap what it adds to the recent average
+                capped = min(seconds, 2 * self.tolerance * self.long_latency)
+                self.short_latency += (capped - self.short_latency) * self._short_alpha
+                self.long_latency += (seconds - self.long_latency) * self._long_alpha
+            # Latency dropped for good (cache warmed, model got faster): let the baseline follow
+            if self.long_latency > 2 * self.short_latency:
+                self.long_latency *= 0.95
+
+            if failed:
+                gradient = 0.5
+            elif self.short_latency > 0:
+                gradient = max(0.5, min(1.0, self.tolerance * self.long_latency / self.short_latency))
+            else:
+                gradient = 1.0
+
+            if gradient < 1.0:
+                target = self.limit * gradient
+            elif in_flight >= self.limit / 2:
+                target = self.limit + math.sqrt(self.limit)
+            else:
+                return gradient  # a limit nobody is close to using says nothing about capacity
+            self._move(target)
+            return gradient
+
+    def _move(self, target):
+        limit = (1 - self.smoothing) * self.limit + self.smoothing * target
+        self.limit = min(max(limit, self.min_limit), self.max_limit)
+
+
+class RouteClass:
+    def __init__(self, name, priority, limit, reserve=0):
+        self.name = name
+        self.priority = priority  # 0 is the most important
+        self.limit = limit
+        self.reserve = reserve  # request slots lower-priority classes must leave free
+        self.in_flight = 0
+        self.admitted = 0
+        self.shed = 0
+
+
+class LoadShedder:
+    """Per-class adaptive limits inside a worker of `capacity` concurrent requests (its threads)"""
+
+    def __init__(self, capacity, enabled=True):
+        self.capacity = capacity
+        self.enabled = enabled
+        self.classes = {}
+        self.in_flight = 0  # requests holding a thread, all classes
+        self._lock = threading.Lock()
+
+    def add_class(self, name, priority, limit, reserve=0):
+        self.classes[name] = RouteClass(name, priority, limit, reserve)
+
+    def _reserved_above(self, route_class):
+        """Slots still held back for higher-priority classes - their own requests in flight use up their reserve"""
+        return sum(max(0, other.reserve - other.in_flight)
+                   for other in self.classes.values() if other.priority < route_class.priority)
+
+    def try_acquire(self, name, uses_thread=True):
+        """A token to pass to release(), or None when the request should be shed"""
+        route_class = self.classes[name]
+        with self._lock:
+            if route_class.in_flight >= int(route_class.limit.limit):
+                reason = 'limit'
+            elif uses_thread and self.in_flight + self._reserved_above(route_class) >= self.capacity:
+                reason = 'reserved'
+            else:
+                route_class.in_flight += 1
+                route_class.admitted += 1
+                if uses_thread:
+                    self.in_flight += 1
+                return route_class, uses_thread, time.perf_counter()
+            route_class.shed += 1
+        LOAD_SHED.inc(name, reason)
+        return None
+
+    def release(self, token, failed=False):
+        route_class, uses_thread, started = token
+        with self._lock:
+            in_flight = route_class.in_flight
+            route_class.in_flight -= 1
+            if uses_thread:
+                self.in_flight -= 1
+        route_class.limit.sample(time.perf_counter() - started, in_flight, failed)
+
+    def limit(self, name):
+        """Route decorator - admit into class `name` or answer 503; the slot is released at teardown"""
+
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return view(*args, **kwargs)
+                token = self.try_acquire(name)
+                if token is None:
+                    return jsonify({'error': 'Server busy, please retry later'}), 503, {'Retry-After': '1'}
+                g.load_shed_token = token
+                return view(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def stats(self):
+        with self._lock:
+            return {
+                'capacity': self.capacity,
+                'in_flight': self.in_flight,
+                'classes': {
+                    route_class.name: {
+                        'priority': route_class.priority,
+                        'limit': round(route_class.limit.limit, 2),
+                        'in_flight': route_class.in_flight,
+                        'admitted': route_class.admitted,
+                        'shed': route_class.shed,
+                        'latency_recent_seconds': route_class.limit.short_latency,
+                        'latency_baseline_seconds': route_class.limit.long_latency,
+                    }
+                    for route_class in self.classes.values()
+                },
+            }
+
+
+def install_load_shedding(app, shedder):
+    """Release the slot of a limited request once its response is done (streams included)"""
+
+    @app.after_request
+    def _load_shed_status(response):
+        if 'load_shed_token' in g:
+            g.load_shed_failed = response.status_code >= 500
+        return response
+
+    @app.teardown_request
+    def _load_shed_release(exc):
+        token = g.pop('load_shed_token', None)
+        if token is not None:
+            shedder.release(token, failed=exc is not None or g.pop('load_shed_failed', False))
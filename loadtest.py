@@ -0,0 +1,495 @@
+# ==========================================
+# LOAD TEST
+# ==========================================
+# Starts the real server (gunicorn, as `python main.py serve` does) on a
+# throwaway SQLite database with fake_gemini.py standing in for the model,
+# drives it with a scripted scenario and writes a JSON report: throughput,
+# latency percentiles and error rates per endpoint. No MySQL, API key or
+# network needed.
+#
+#   python loadtest.py run mixed --duration 30 --concurrency 16 --out before.json
+#   python loadtest.py run analyze --gemini-latency-ms 800 --gemini-sigma 0.5 --gemini-error-rate 0.05
+#   python loadtest.py run login --target http://127.0.0.1:8080   # an already running server
+#   python loadtest.py run analyze --mode asgi                     # python main.py serve-asgi instead
+#   python loadtest.py compare before.json after.json
+#
+# Scenarios: register (storm of sign-ups), login (storm of logins),
+# analyze (burst of /api/analyze calls), mixed (weighted traffic, see MIX).
+
+import argparse
+import http.client
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+from datetime import datetime, timezone
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+PASSWORD = 'load-test-password'
+
+# Benign symptoms only - red flags are answered by the pre-screen without a model call
+SYMPTOMS = (
+    'mild headache', 'runny nose', 'sore throat', 'dry cough', 'low fever', 'tiredness', 'sneezing',
+    'itchy eyes', 'back ache', 'stomach ache', 'nausea after meals', 'muscle aches', 'ear ache', 'rash on arm',
+)
+
+# mixed scenario: (weight, request name)
+MIX = (
+    (40, 'profile'),
+    (25, 'analyze'),
+    (10, 'analyze_stream'),
+    (15, 'login'),
+    (10, 'register'),
+)
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _git_version():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=HERE, capture_output=True,
+                              text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def percentile(ordered, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not ordered:
+        return None
+    return ordered[max(0, min(len(ordered) - 1, int(round(len(ordered) * pct / 100.0)) - 1))]
+
+
+# ==========================================
+# ENVIRONMENT
+# ==========================================
+
+class Environment:
+    """fake_gemini.py and the gunicorn server as child processes, on a temp directory"""
+
+    def __init__(self, args):
+        self.args = args
+        self.dir = tempfile.mkdtemp(prefix='medicue-load-')
+        self.processes = []
+        self.url = args.target
+
+    def __enter__(self):
+        if self.url:
+            return self
+        try:
+            self._start()
+        except BaseException:
+            self.close()
+            raise
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def _spawn(self, command, env, name):
+        log = open(os.path.join(self.dir, f'{name}.log'), 'wb')
+        process = subprocess.Popen(command, cwd=HERE, env=env, stdout=log, stderr=subprocess.STDOUT)
+        self.processes.append((process, log))
+        return process
+
+    def _start(self):
+        args = self.args
+        gemini_port, server_port = _free_port(), _free_port()
+        self._spawn([
+            sys.executable, 'fake_gemini.py', '--port', str(gemini_port),
+            '--latency-ms', str(args.gemini_latency_ms), '--jitter-ms', '0',
+            '--latency-sigma', str(args.gemini_sigma), '--error-rate', str(args.gemini_error_rate),
+            '--seed', str(args.seed),
+        ], dict(os.environ), 'fake_gemini')
+
+        env = dict(os.environ)
+        env.update({
+            'DB_URL': f"sqlite:///{os.path.join(self.dir, 'medicue.db')}",
+            'DB_REPLICA_URLS': '',
+            'JWT_SECRET_KEY': 'load-test-' + os.urandom(16).hex(),
+            'GEMINI_API_KEY': 'load-test',
+            'GEMINI_BASE_URL': f'http://127.0.0.1:{gemini_port}',
+            'ANALYSIS_CACHE_DB': os.path.join(self.dir, 'analysis_cache.db'),
+            # The generated texts are near-duplicates of each other; hits come from --cache-hit-ratio only
+            'SEMANTIC_CACHE_ENABLED': 'true' if args.semantic_cache else 'false',
+            # A few accounts send all the traffic; per-user limits would turn most of it into 429s
+            'RATE_LIMIT_ENABLED': 'true' if args.rate_limit else 'false',
+            'SERVER_BIND': f'127.0.0.1:{server_port}',
+            'SERVER_WORKERS': str(args.workers),
+            'SERVER_THREADS': str(args.threads),
+        })
+        command = 'serve-asgi' if args.mode == 'asgi' else 'serve'
+        server = self._spawn([sys.executable, 'main.py', command], env, 'server')
+        self.url = f'http://127.0.0.1:{server_port}'
+        self._wait_ready(server)
+
+    def _wait_ready(self, server, timeout=60.0):
+        ends_at = time.monotonic() + timeout
+        while time.monotonic() < ends_at:
+            if server.poll() is not None:
+                raise RuntimeError(f"Server exited with {server.returncode}, see {self.dir}/server.log")
+            try:
+                if Client(self.url).request('GET', '/api/ready')[0] == 200:
+                    return
+            except OSError:
+                pass
+            time.sleep(0.2)
+        raise RuntimeError(f"Server not ready after {timeout:.0f}s, see {self.dir}/server.log")
+
+    def close(self):
+        for process, log in reversed(self.processes):
+            if process.poll() is None:
+                process.terminate()
+                try:
+                    process.wait(timeout=30)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+            log.close()
+        self.processes = []
+        if self.args.keep:
+            print(f"Logs and database kept in {self.dir}", file=sys.stderr)
+        else:
+            shutil.rmtree(self.dir, ignore_errors=True)
+
+
+# ==========================================
+# CLIENT
+# ==========================================
+
+class Client:
+    """One keep-alive connection, reopened after errors (one per load thread)"""
+
+    def __init__(self, url, timeout=60.0):
+        parts = urllib.parse.urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.timeout = timeout
+        self.conn = None
+
+    def request(self, method, path, body=None, token=None):
+        """(status, parsed JSON body or None)"""
+        headers = {'Accept-Encoding': 'identity'}
+        data = None
+        if body is not None:
+            data = json.dumps(body).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+        if token:
+            headers['Authorization'] = f'Bearer {token}'
+        if self.conn is None:
+            self.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        try:
+            self.conn.request(method, path, body=data, headers=headers)
+            response = self.conn.getresponse()
+            raw = response.read()
+        except (OSError, http.client.HTTPException):
+            self.conn.close()
+            self.conn = None
+            raise
+        if response.getheader('Connection', '').lower() == 'close':
+            self.conn.close()
+            self.conn = None
+        try:
+            return response.status, json.loads(raw) if raw and response.getheader('Content-Type', '').startswith('application/json') else None
+        except ValueError:
+            return response.status, None
+
+
+# ==========================================
+# SCENARIOS
+# ==========================================
+
+class Scenario:
+    """The requests of a run; each request name maps to a method returning (endpoint, status)"""
+
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+        self.random = random.Random(args.seed)
+        self._lock = threading.Lock()
+        self._counter = 0
+        self.accounts = []  # (email, token)
+        self.repeated_texts = [self._new_text() for _ in range(20)]
+
+    def _next(self):
+        with self._lock:
+            self._counter += 1
+            return self._counter
+
+    def _new_text(self):
+        picked = self.random.sample(SYMPTOMS, 2)
+        return f"{picked[0]} and {picked[1]} for {self.random.randint(1, 9)} days"
+
+    def setup(self, client):
+        """Accounts for the logins and authenticated calls, created before timing starts"""
+        if self.name == 'register':
+            return
+        for _ in range(self.args.users):
+            _, status, email = self._register(client)
+            if status != 201:
+                raise RuntimeError(f"Setup registration failed with {status}")
+            status, body = client.request('POST', '/api/auth/login', {'email': email, 'password': PASSWORD})
+            if status != 200:
+                raise RuntimeError(f"Setup login failed with {status}: {body}")
+            self.accounts.append((email, body['access_token']))
+
+    def pick(self, rng):
+        if self.name != 'mixed':
+            return self.name
+        roll = rng.uniform(0, sum(weight for weight, _ in MIX))
+        for weight, name in MIX:
+            roll -= weight
+            if roll <= 0:
+                return name
+        return MIX[-1][1]
+
+    def _register(self, client):
+        email = f"load-{os.getpid()}-{self._next()}-{random.getrandbits(32):x}@example.com"
+        status, _ = client.request('POST', '/api/auth/register', {
+            'email': email, 'password': PASSWORD, 'first_name': 'Load', 'last_name': 'Test',
+            'gender': 'Female', 'birth_date': '1990-01-01',
+        })
+        return 'POST /api/auth/register', status, email
+
+    def register(self, client, rng):
+        return self._register(client)[:2]
+
+    def login(self, client, rng):
+        email, _ = rng.choice(self.accounts)
+        status, _ = client.request('POST', '/api/auth/login', {'email': email, 'password': PASSWORD})
+        return 'POST /api/auth/login', status
+
+    def profile(self, client, rng):
+        status, _ = client.request('GET', '/api/auth/profile', token=rng.choice(self.accounts)[1])
+        return 'GET /api/auth/profile', status
+
+    def _symptoms(self, rng):
+        # Fresh text means a model call; --cache-hit-ratio of the requests reuse a few texts instead
+        if rng.random() < self.args.cache_hit_ratio:
+            return rng.choice(self.repeated_texts)
+        return f"{self._new_text()} (case {self._next()})"
+
+    def analyze(self, client, rng):
+        status, _ = client.request('POST', '/api/analyze', {'symptoms_text': self._symptoms(rng)},
+                                   token=rng.choice(self.accounts)[1])
+        return 'POST /api/analyze', status
+
+    def analyze_stream(self, client, rng):
+        status, _ = client.request('POST', '/api/analyze/stream', {'symptoms_text': self._symptoms(rng)},
+                                   token=rng.choice(self.accounts)[1])
+        return 'POST /api/analyze/stream', status
+
+
+SCENARIOS = ('register', 'login', 'analyze', 'mixed')
+
+
+# ==========================================
+# RUNNER
+# ==========================================
+
+def run_load(url, scenario, concurrency, duration, max_requests, warmup=0.0):
+    """Closed loop: `concurrency` threads each send their next request as soon as the last one ends.
+
+    Returns {endpoint: [(latency seconds, status or None on a connection error), ...]}
+    and the measured seconds. Only requests finishing inside the measured window (after the
+    warm-up, before the end) are recorded.
+    """
+    results = {}
+    lock = threading.Lock()
+    sent = [0]
+    started = time.monotonic()
+    record_from = started + warmup
+    ends_at = record_from + duration
+
+    def worker(index):
+        client = Client(url)
+        rng = random.Random(f"{scenario.args.seed}-{index}")
+        samples = []
+        while time.monotonic() < ends_at:
+            if max_requests:
+                with lock:
+                    if sent[0] >= max_requests:
+                        break
+                    sent[0] += 1
+            name = scenario.pick(rng)
+            request_started = time.monotonic()
+            try:
+                endpoint, status = getattr(scenario, name)(client, rng)
+            except (OSError, http.client.HTTPException):
+                endpoint, status = name, None
+            finished = time.monotonic()
+            if record_from <= finished <= ends_at:
+                samples.append((endpoint, finished - request_started, status))
+        with lock:
+            for endpoint, latency, status in samples:
+                results.setdefault(endpoint, []).append((latency, status))
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, max(1e-9, min(time.monotonic(), ends_at) - record_from)
+
+
+def summarize(samples, elapsed):
+    latencies = sorted(latency for latency, _ in samples)
+    statuses = {}
+    errors = 0
+    for _, status in samples:
+        key = str(status) if status is not None else 'connection_error'
+        statuses[key] = statuses.get(key, 0) + 1
+        if status is None or status >= 400:
+            errors += 1
+    ms = lambda seconds: round(seconds * 1000, 2) if seconds is not None else None
+    return {
+        'requests': len(samples),
+        'errors': errors,
+        'error_rate': round(errors / len(samples), 4) if samples else 0.0,
+        'throughput_rps': round(len(samples) / elapsed, 2),
+        'latency_ms': {
+            'mean': ms(sum(latencies) / len(latencies)) if latencies else None,
+            'p50': ms(percentile(latencies, 50)),
+            'p95': ms(percentile(latencies, 95)),
+            'p99': ms(percentile(latencies, 99)),
+            'max': ms(latencies[-1]) if latencies else None,
+        },
+        'status': statuses,
+    }
+
+
+def run(args):
+    """Run one scenario against a fresh server and return the report"""
+    scenario = Scenario(args.scenario, args)
+    with Environment(args) as environment:
+        setup_started = time.monotonic()
+        scenario.setup(Client(environment.url))
+        setup_seconds = time.monotonic() - setup_started
+        results, elapsed = run_load(environment.url, scenario, args.concurrency, args.duration, args.requests,
+                                    args.warmup)
+
+    everything = [sample for samples in results.values() for sample in samples]
+    return {
+        'scenario': args.scenario,
+        'version': _git_version(),
+        'started_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'settings': {
+            'target': args.target,
+            'mode': None if args.target else args.mode,
+            'concurrency': args.concurrency,
+            'duration_seconds': args.duration,
+            'max_requests': args.requests,
+            'warmup_seconds': args.warmup,
+            'users': args.users,
+            'workers': None if args.target else args.workers,
+            'threads': None if args.target else args.threads,
+            'gemini_latency_ms': args.gemini_latency_ms,
+            'gemini_sigma': args.gemini_sigma,
+            'gemini_error_rate': args.gemini_error_rate,
+            'cache_hit_ratio': args.cache_hit_ratio,
+            'semantic_cache': args.semantic_cache,
+            'rate_limit': args.rate_limit,
+            'seed': args.seed,
+        },
+        'setup_seconds': round(setup_seconds, 2),
+        'elapsed_seconds': round(elapsed, 2),
+        'total': summarize(everything, elapsed),
+        'endpoints': {endpoint: summarize(samples, elapsed) for endpoint, samples in sorted(results.items())},
+    }
+
+
+def _change(before, after):
+    if before is None or after is None:
+        return None
+    if before == 0:
+        return None if after == 0 else float('inf')
+    return round((after - before) / before * 100, 1)
+
+
+def compare(args):
+    """Per-endpoint change from one report to another, in percent"""
+    with open(args.before, encoding='utf-8') as f:
+        before = json.load(f)
+    with open(args.after, encoding='utf-8') as f:
+        after = json.load(f)
+
+    def delta(old, new):
+        return {
+            'throughput_rps': [old['throughput_rps'], new['throughput_rps'],
+                               _change(old['throughput_rps'], new['throughput_rps'])],
+            'error_rate': [old['error_rate'], new['error_rate']],
+            **{f'latency_{key}_ms': [old['latency_ms'][key], new['latency_ms'][key],
+                                     _change(old['latency_ms'][key], new['latency_ms'][key])]
+               for key in ('p50', 'p95', 'p99')},
+        }
+
+    endpoints = sorted(set(before['endpoints']) & set(after['endpoints']))
+    return {
+        'before': {'version': before.get('version'), 'scenario': before.get('scenario')},
+        'after': {'version': after.get('version'), 'scenario': after.get('scenario')},
+        'columns': ['before', 'after', 'change_percent'],
+        'total': delta(before['total'], after['total']),
+        'endpoints': {endpoint: delta(before['endpoints'][endpoint], after['endpoints'][endpoint])
+                      for endpoint in endpoints},
+        'only_before': sorted(set(before['endpoints']) - set(after['endpoints'])),
+        'only_after': sorted(set(after['endpoints']) - set(before['endpoints'])),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Medicue offline load test")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help=run.__doc__)
+    run_parser.add_argument('scenario', choices=SCENARIOS)
+    run_parser.add_argument('--duration', type=float, default=20.0, help="measured seconds")
+    run_parser.add_argument('--requests', type=int, default=0, help="stop after this many requests (0 = no limit)")
+    run_parser.add_argument('--warmup', type=float, default=2.0, help="seconds of load before measuring")
+    run_parser.add_argument('--concurrency', type=int, default=16)
+    run_parser.add_argument('--users', type=int, default=20, help="accounts created for login / authenticated calls")
+    run_parser.add_argument('--cache-hit-ratio', type=float, default=0.0,
+                            help="fraction of analyze calls reusing a few texts (cache hits)")
+    run_parser.add_argument('--semantic-cache', action='store_true',
+                            help="leave the near-duplicate cache on (most generated texts then hit it)")
+    run_parser.add_argument('--rate-limit', action='store_true',
+                            help="leave the per-user and global rate limits on (RATE_LIMIT_* settings)")
+    run_parser.add_argument('--target', help="URL of a running server instead of starting one")
+    run_parser.add_argument('--mode', choices=('wsgi', 'asgi'), default='wsgi',
+                            help="gunicorn (python main.py serve) or uvicorn (python main.py serve-asgi)")
+    run_parser.add_argument('--workers', type=int, default=2)
+    run_parser.add_argument('--threads', type=int, default=8)
+    run_parser.add_argument('--gemini-latency-ms', type=float, default=500.0, help="median fake model latency")
+    run_parser.add_argument('--gemini-sigma', type=float, default=0.4, help="log-normal spread of the model latency")
+    run_parser.add_argument('--gemini-error-rate', type=float, default=0.0)
+    run_parser.add_argument('--seed', type=int, default=1)
+    run_parser.add_argument('--keep', action='store_true', help="keep the temp directory with the logs and database")
+    run_parser.add_argument('--out', help="also write the report to this file")
+    run_parser.set_defaults(run=run)
+
+    compare_parser = commands.add_parser('compare', help=compare.__doc__)
+    compare_parser.add_argument('before')
+    compare_parser.add_argument('after')
+    compare_parser.set_defaults(run=compare)
+
+    args = parser.parse_args(argv)
+    report = args.run(args)
+    text = json.dumps(report, indent=2)
+    if getattr(args, 'out', None):
+        with open(args.out, 'w', encoding='utf-8') as f:
+            f.write(text + "\n")
+    print(text)
+
+
+if __name__ == '__main__':
+    main()
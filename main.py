@@ -3,12 +3,11 @@
 # Complete REST API Implementation
 # ==========================================
 
-from dotenv import load_dotenv
-from db import init_database
-from config import app
-import os
+import sys
 
-import endpoints  
+from boottime import boot
+from config import app
+from server import create_app, serve, serve_asgi, start_background_tasks, startup
 
 
 
@@ -19,14 +18,16 @@ import endpoints
 # ==========================================
 
 if __name__ == '__main__':
-    # LOAD ENV
-    load_dotenv()
-    if os.getenv("DB_URL") =="" or os.getenv("DB_URL") is None:
-        print("No DB_URL in env")
-        os._exit(1)
-    if os.getenv("JWT_SECRET_KEY") =="" or os.getenv("JWT_SECRET_KEY") is None:
-        print("No JWT_SECRET_KEY in env")
-        os._exit(1)
-
-    init_database()
-    app.run(debug=True, host='0.0.0.0', port=8080)
\ No newline at end of file
+    if sys.argv[1:2] == ['serve']:
+        # Production: gunicorn, multi-process and multi-threaded (see server.py)
+        serve()
+    elif sys.argv[1:2] == ['serve-asgi']:
+        # Production, async analyze path: uvicorn workers (see asgi.py)
+        serve_asgi()
+    else:
+        # Development server
+        startup()
+        start_background_tasks()
+        create_app()
+        boot.ready()
+        app.run(debug=True, host='0.0.0.0', port=8080)
\ No newline at end of file
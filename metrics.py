@@ -0,0 +1,274 @@
+# ==========================================
+# METRICS
+# ==========================================
+# Counters and histograms in the Prometheus text format, served at /metrics.
+# Every thread records into its own shard, so the hot path takes no lock;
+# a scrape sums the shards. Numbers are per worker process.
+#
+# registry.render() returns the exposition text, so the numbers can be
+# checked without running a collector.
+
+import bisect
+import threading
+import time
+
+from flask import Response, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+
+class _Shard:
+    """One thread's values: (metric, label values) -> float, or -> [bucket counts..., sum, count]"""
+
+    def __init__(self, thread):
+        self.thread = thread
+        self.values = {}
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._gauges = []
+        self._local = threading.local()
+        self._shards = []
+        self._retired = {}  # values of threads that have exited
+        self._lock = threading.Lock()
+
+    def _shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = _Shard(threading.current_thread())
+            self._local.shard = shard
+            with self._lock:
+                self._shards.append(shard)
+        return shard.values
+
+    def counter(self, name, help, labelnames=()):
+        return self._register(Counter(self, name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(self, name, help, labelnames, buckets))
+
+    def gauge(self, name, help, fn, type='gauge'):
+        """Value read at scrape time; fn returns a number. type='counter' for totals kept elsewhere"""
+        self._gauges.append((name, help, fn, type))
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def _collect(self):
+        """Sum of all shards; shards of exited threads are folded into _retired"""
+        with self._lock:
+            live = []
+            for shard in self._shards:
+                if shard.thread.is_alive():
+                    live.append(shard)
+                else:
+                    _merge(self._retired, _snapshot(shard.values))
+            self._shards = live
+            totals = {}
+            _merge(totals, self._retired)
+            for shard in live:
+                _merge(totals, _snapshot(shard.values))
+        return totals
+
+    def render(self):
+        """The Prometheus text exposition of every metric"""
+        totals = self._collect()
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            series = sorted((key[1], value) for key, value in totals.items() if key[0] is metric)
+            for label_values, value in series:
+                lines.extend(metric.lines(label_values, value))
+        for name, help, fn, type in self._gauges:
+            try:
+                value = fn()
+            except Exception:
+                continue
+            if value is None:
+                continue
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {type}")
+            lines.append(f"{name} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def _snapshot(values):
+    # The owning thread may insert a key while we copy; retry until the copy is clean
+    while True:
+        try:
+            return {key: (list(value) if isinstance(value, list) else value) for key, value in list(values.items())}
+        except RuntimeError:
+            continue
+
+
+def _merge(into, values):
+    for key, value in values.items():
+        if isinstance(value, list):
+            current = into.setdefault(key, [0] * len(value))
+            for i, v in enumerate(value):
+                current[i] += v
+        else:
+            into[key] = into.get(key, 0) + value
+
+
+def _number(value):
+    if value == int(value):
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+class Counter:
+    type = 'counter'
+
+    def __init__(self, registry, name, help, labelnames):
+        self.registry = registry
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+
+    def inc(self, *label_values, amount=1):
+        values = self.registry._shard()
+        key = (self, label_values)
+        values[key] = values.get(key, 0) + amount
+
+    def lines(self, label_values, value):
+        return [f"{self.name}{_labels(self.labelnames, label_values)} {_number(value)}"]
+
+
+class Histogram:
+    type = 'histogram'
+
+    def __init__(self, registry, name, help, labelnames, buckets):
+        self.registry = registry
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *label_values):
+        values = self.registry._shard()
+        key = (self, label_values)
+        counts = values.get(key)
+        if counts is None:
+            # one slot per bucket, then +Inf, sum and count
+            counts = values[key] = [0] * (len(self.buckets) + 3)
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        counts[-2] += value
+        counts[-1] += 1
+
+    def time(self, *label_values):
+        return _Timer(self, label_values)
+
+    def lines(self, label_values, counts):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + ('+Inf',), counts):
+            cumulative += count
+            le = bound if bound == '+Inf' else _number(bound)
+            lines.append(f"{self.name}_bucket{_labels(self.labelnames, label_values, [('le', le)])} {cumulative}")
+        lines.append(f"{self.name}_sum{_labels(self.labelnames, label_values)} {_number(counts[-2])}")
+        lines.append(f"{self.name}_count{_labels(self.labelnames, label_values)} {counts[-1]}")
+        return lines
+
+
+class _Timer:
+    def __init__(self, histogram, label_values):
+        self.histogram = histogram
+        self.label_values = label_values
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.observe(time.perf_counter() - self.start, *self.label_values)
+        return False
+
+
+# ==========================================
+# APPLICATION METRICS
+# ==========================================
+
+registry = Registry()
+
+HTTP_REQUESTS = registry.counter(
+    'medicue_http_requests_total', 'HTTP requests by route, method and status', ('route', 'method', 'status'))
+HTTP_LATENCY = registry.histogram(
+    'medicue_http_request_duration_seconds', 'Time to produce the response (headers, for streams)', ('route', 'method'))
+DB_QUERIES = registry.histogram(
+    'medicue_db_queries_per_request', 'SQL statements executed per request', ('route',), buckets=COUNT_BUCKETS)
+GEMINI_LATENCY = registry.histogram(
+    'medicue_gemini_request_duration_seconds', 'Gemini call latency, to the last streamed chunk', ('call',))
+GEMINI_FAILURES = registry.counter(
+    'medicue_gemini_failures_total', 'Gemini calls that raised', ('call',))
+GEMINI_PARSE_FAILURES = registry.counter(
+    'medicue_gemini_parse_failures_total', 'Gemini responses that were not a usable JSON object', ('call',))
+GEMINI_TOKENS = registry.counter(
+    'medicue_gemini_tokens_total', 'Tokens reported by Gemini usage metadata', ('kind',))
+LOAD_SHED = registry.counter(
+    'medicue_load_shed_total', 'Requests answered 503 by the load shedder', ('class', 'reason'))
+RATE_LIMITED = registry.counter(
+    'medicue_rate_limited_total', 'Requests refused by the rate limiter: 429 by the bucket that was empty, 413 (too_large) when over the burst',
+    ('scope',))
+
+# Statements run by the current thread since its request started
+_queries = threading.local()
+
+
+def record_usage(response):
+    """Add a Gemini response's (or final stream chunk's) token counts"""
+    usage = getattr(response, 'usage_metadata', None)
+    if usage is None:
+        return
+    for kind, attr in (('prompt', 'prompt_token_count'), ('response', 'candidates_token_count')):
+        count = getattr(usage, attr, None)
+        if count:
+            GEMINI_TOKENS.inc(kind, amount=count)
+
+
+def install_metrics(app):
+    """Time every request, count its SQL statements and serve /metrics"""
+
+    @event.listens_for(Engine, 'before_cursor_execute')
+    def _count_query(conn, cursor, statement, parameters, context, executemany):
+        _queries.count = getattr(_queries, 'count', 0) + 1
+
+    @app.before_request
+    def _start_timer():
+        _queries.count = 0
+        _queries.started = time.perf_counter()
+
+    @app.after_request
+    def _record(response):
+        started = getattr(_queries, 'started', None)
+        if started is None:
+            return response
+        _queries.started = None
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        HTTP_REQUESTS.inc(route, request.method, str(response.status_code))
+        HTTP_LATENCY.observe(time.perf_counter() - started, route, request.method)
+        DB_QUERIES.observe(_queries.count, route)
+        return response
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        """Prometheus scrape endpoint"""
+        return Response(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
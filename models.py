@@ -1,13 +1,6 @@
 import datetime
 from config import db
-
-# # ==========================================
-# # SYMPTOM-CONDITION MAPPING TABLE (Many-to-Many)
-# # ==========================================
-# symptom_condition_map = db.Table('symptom_condition_map',
-#     db.Column('symptom_id', db.Integer, db.ForeignKey('symptom.symptom_id'), primary_key=True),
-#     db.Column('condition_id', db.Integer, db.ForeignKey('condition.condition_id'), primary_key=True)
-# )
+from jsonprovider import loads
 
 # ==========================================
 # DATABASE MODELS
@@ -24,6 +17,12 @@ class User(db.Model):
     gender = db.Column(db.Enum('Male', 'Female', 'Other'), nullable=False)
     birth_date = db.Column(db.Date, nullable=False)
     created_at = db.Column(db.DateTime, default=lambda: datetime.datetime.now(datetime.timezone.utc))
+    # Bumped on every change - the profile's ETag and Last-Modified come from it
+    updated_at = db.Column(
+        db.DateTime,
+        default=lambda: datetime.datetime.now(datetime.timezone.utc),
+        onupdate=lambda: datetime.datetime.now(datetime.timezone.utc),
+    )
     
     # # Relationships
     # # Note: ForeignKey in child tables must point to 'users.user_id'
@@ -49,4 +48,136 @@ class TokenBlocklist(db.Model):
 
     id = db.Column(db.Integer, primary_key=True)
     jti = db.Column(db.String(36), nullable=False, index=True)
-    created_at = db.Column(db.DateTime, default=lambda: datetime.datetime.now(datetime.timezone.utc))
\ No newline at end of file
+    created_at = db.Column(db.DateTime, default=lambda: datetime.datetime.now(datetime.timezone.utc))
+    # When the revoked token would have expired anyway - rows past this are pruned
+    expires_at = db.Column(db.DateTime, index=True)
+
+
+
+# ==========================================
+# SYMPTOM / CONDITION CATALOG
+# ==========================================
+
+class Symptom(db.Model):
+    __tablename__ = 'symptom'
+
+    symptom_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    name = db.Column(db.String(100), unique=True, nullable=False)
+    description = db.Column(db.String(255))
+    body_system = db.Column(db.String(50))
+    severity_rating = db.Column(db.Enum('Low', 'Medium', 'High'), nullable=False, default='Low')
+
+    def to_dict(self):
+        return {
+            'symptom_id': self.symptom_id,
+            'name': self.name,
+            'description': self.description,
+            'body_system': self.body_system,
+            'severity_rating': self.severity_rating
+        }
+
+
+class Condition(db.Model):
+    __tablename__ = 'condition'
+
+    condition_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    name = db.Column(db.String(150), unique=True, nullable=False)
+    icd10_code = db.Column(db.String(10))
+    overview = db.Column(db.Text)
+    causes = db.Column(db.Text)
+    treatment = db.Column(db.Text)
+
+    recommendations = db.relationship('Recommendation', backref='condition', lazy=True, cascade='all, delete-orphan')
+
+    def to_dict(self):
+        return {
+            'condition_id': self.condition_id,
+            'name': self.name,
+            'icd10_code': self.icd10_code,
+            'overview': self.overview,
+            'causes': self.causes,
+            'treatment': self.treatment
+        }
+
+
+class Recommendation(db.Model):
+    __tablename__ = 'recommendation'
+
+    rec_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    condition_id = db.Column(db.Integer, db.ForeignKey('condition.condition_id'), nullable=False, index=True)
+    rec_type = db.Column(db.Enum('Self-Care', 'Consult', 'Urgent'), nullable=False)
+    guidance_text = db.Column(db.Text, nullable=False)
+    is_emergency_alert = db.Column(db.Boolean, default=False)
+
+    def to_dict(self):
+        return {
+            'rec_id': self.rec_id,
+            'condition_id': self.condition_id,
+            'rec_type': self.rec_type,
+            'guidance_text': self.guidance_text,
+            'is_emergency_alert': self.is_emergency_alert
+        }
+
+
+# ==========================================
+# SYMPTOM-CONDITION MAPPING TABLE (Many-to-Many)
+# ==========================================
+
+class SymptomConditionMap(db.Model):
+    __tablename__ = 'symptom_condition_map'
+
+    symptom_id = db.Column(db.Integer, db.ForeignKey('symptom.symptom_id'), primary_key=True)
+    condition_id = db.Column(db.Integer, db.ForeignKey('condition.condition_id'), primary_key=True, index=True)
+    # How strongly the symptom points at the condition, 0-1
+    weight = db.Column(db.Float, nullable=False, default=1.0)
+
+
+# ==========================================
+# SCHEMA VERSION
+# ==========================================
+
+class SchemaVersion(db.Model):
+    """Fingerprint of the schema the database was last set up for - lets start-up skip create_all"""
+    __tablename__ = 'schema_version'
+
+    version = db.Column(db.String(64), primary_key=True)
+    applied_at = db.Column(db.DateTime, default=lambda: datetime.datetime.now(datetime.timezone.utc))
+
+
+# ==========================================
+# ANALYSIS HISTORY
+# ==========================================
+
+class HistoryRecord(db.Model):
+    """One analysis a user ran - written in batches behind the response (see writebehind.py)"""
+    __tablename__ = 'history_record'
+
+    history_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    # Made when the analysis finished; a batch written twice after a retry adds no duplicates
+    record_uuid = db.Column(db.String(32), unique=True, nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.user_id'), nullable=False)
+    check_timestamp = db.Column(db.DateTime, default=lambda: datetime.datetime.now(datetime.timezone.utc))
+    symptoms_text = db.Column(db.Text, nullable=False)
+    is_emergency = db.Column(db.Boolean, default=False)
+    # Highest condition confidence, 0-100
+    final_confidence_score = db.Column(db.Float)
+    # gemini, local_triage or emergency_prescreen
+    source = db.Column(db.String(32))
+    # The analysis as returned to the client, JSON
+    result = db.Column(db.Text, nullable=False)
+
+    def to_dict(self):
+        return {
+            'history_id': self.history_id,
+            'timestamp': self.check_timestamp.isoformat() if self.check_timestamp else None,
+            'symptoms_text': self.symptoms_text,
+            'is_emergency': self.is_emergency,
+            'final_confidence_score': self.final_confidence_score,
+            'source': self.source,
+            'result': loads(self.result),
+        }
+
+
+# A user's history newest first, history_id breaking ties - the order (and cursor) of GET /api/history
+db.Index('ix_history_record_user_time',
+         HistoryRecord.user_id, HistoryRecord.check_timestamp.desc(), HistoryRecord.history_id.desc())
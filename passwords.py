@@ -0,0 +1,143 @@
+# ==========================================
+# PASSWORD HASHING
+# ==========================================
+# bcrypt runs in a small process pool so a login storm burns CPU there
+# instead of in the request threads. Hashes are the same format
+# flask_bcrypt produces ($2b$<cost>$...), so existing rows keep working.
+#
+# This module is imported by the pool's worker processes; keep it free of
+# app imports.
+
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+import bcrypt
+
+
+class PasswordHasherBusy(Exception):
+    """Raised when no hashing slot frees up within the timeout"""
+
+
+def _hash_password(password, rounds):
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+def _check_password(pw_hash, password):
+    try:
+        return bcrypt.checkpw(password.encode('utf-8'), pw_hash.encode('utf-8'))
+    except ValueError:
+        # Malformed stored hash
+        return False
+
+
+def hash_cost(pw_hash):
+    """Work factor of a bcrypt hash, e.g. 12 for $2b$12$..."""
+    try:
+        return int(pw_hash.split('$')[2])
+    except (IndexError, ValueError):
+        return None
+
+
+class PasswordHasher:
+    """bcrypt on a process pool; workers=0 hashes inline in the calling thread"""
+
+    def __init__(self, rounds=12, workers=2, max_pending=None, timeout=10.0):
+        self.rounds = rounds
+        self.workers = workers
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_pending or max(1, workers) * 4)
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.hashed = 0
+        self.checked = 0
+        self.rehashed = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    def _executor(self):
+        # Created on first use, so importing the app (or forking a preloaded one) starts no processes
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                )
+            return self._pool
+
+    def _run(self, fn, *args):
+        if not self.workers:
+            return fn(*args)
+        if not self._slots.acquire(timeout=self.timeout):
+            with self._stats_lock:
+                self.rejected += 1
+            raise PasswordHasherBusy("Password hashing is at capacity")
+        future = None
+        try:
+            try:
+                future = self._executor().submit(fn, *args)
+                return self._result(future)
+            except BrokenProcessPool:
+                # A worker died; start a fresh pool and retry once
+                with self._pool_lock:
+                    self._pool = None
+                future = self._executor().submit(fn, *args)
+                return self._result(future)
+        finally:
+            if future is None or future.done():
+                self._slots.release()
+            else:
+                # Still hashing after a timeout: the slot stays taken until the worker is done with it
+                future.add_done_callback(lambda _: self._slots.release())
+
+    def _result(self, future):
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            with self._stats_lock:
+                self.timed_out += 1
+            raise PasswordHasherBusy("Password hashing timed out")
+
+    def hash(self, password):
+        pw_hash = self._run(_hash_password, password, self.rounds)
+        with self._stats_lock:
+            self.hashed += 1
+        return pw_hash
+
+    def check(self, pw_hash, password):
+        ok = self._run(_check_password, pw_hash, password)
+        with self._stats_lock:
+            self.checked += 1
+        return ok
+
+    def needs_rehash(self, pw_hash):
+        """True when the stored hash was made with a different work factor than the current one"""
+        return hash_cost(pw_hash) != self.rounds
+
+    def rehash(self, password):
+        pw_hash = self.hash(password)
+        with self._stats_lock:
+            self.rehashed += 1
+        return pw_hash
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                'rounds': self.rounds,
+                'workers': self.workers,
+                'hashed': self.hashed,
+                'checked': self.checked,
+                'rehashed': self.rehashed,
+                'rejected': self.rejected,
+                'timed_out': self.timed_out,
+            }
+
+    def shutdown(self):
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=True)
+                self._pool = None
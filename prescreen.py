@@ -0,0 +1,214 @@
+# ==========================================
+# EMERGENCY RED-FLAG PRE-SCREEN
+# ==========================================
+# Deterministic check that runs before any model call. A word-level
+# Aho-Corasick automaton finds every red-flag phrase in one pass over the
+# text. A match is ignored when a negation cue comes right before it ("no
+# chest pain"), or when its clause is about someone else or the past ("my
+# father died of a heart attack") - anything less certain is flagged.
+
+import json
+import string
+import threading
+
+# Red-flag category -> phrases (synonyms) that indicate it
+DEFAULT_LEXICON = {
+    'chest_pain': [
+        'chest pain', 'chest pains', 'pain in my chest', 'pain in chest', 'chest tightness', 'tight chest',
+        'chest pressure', 'pressure in my chest', 'crushing chest', 'heart attack',
+    ],
+    'breathing': [
+        'difficulty breathing', 'shortness of breath', 'short of breath', "can't breathe", 'cannot breathe',
+        'trouble breathing', 'struggling to breathe', 'gasping for air', 'breathless', 'choking', 'blue lips',
+    ],
+    'stroke': [
+        'face drooping', 'facial droop', 'slurred speech', 'sudden numbness', 'sudden weakness', 'stroke',
+    ],
+    'consciousness': [
+        'unconscious', 'passed out', 'fainted', 'fainting', 'unresponsive', 'seizure', 'seizures', 'convulsions',
+    ],
+    'bleeding': [
+        'severe bleeding', 'heavy bleeding', 'bleeding heavily', "won't stop bleeding", 'coughing up blood',
+        'vomiting blood', 'blood in vomit',
+    ],
+    'allergic_reaction': [
+        'anaphylaxis', 'throat swelling', 'swollen throat', 'throat closing', 'tongue swelling', 'swollen tongue',
+    ],
+    'self_harm': [
+        'suicidal', 'suicide', 'kill myself', 'overdose', 'overdosed',
+    ],
+    'severe_headache': [
+        'worst headache of my life', 'thunderclap headache',
+    ],
+}
+
+# Words that negate the symptom right after them ("no chest pain", "denies shortness of breath").
+# Only the next term: "no fever and chest pain" and "never had chest pain this bad" are red flags.
+_NEGATIONS = frozenset("""
+no not without denies deny denied none nor negative
+""".split())
+# May sit between the cue and the symptom ("without any chest pain")
+_NEGATION_FILLERS = frozenset("any a an".split())
+# Tokens that end a clause; '|' stands for sentence punctuation and commas
+_CLAUSE_BREAKS = frozenset("| and or plus with but however although though".split())
+# A clause with one of these is about another person or an earlier episode, not what is happening now
+_FAMILY = frozenset("""
+father mother dad mom mum parent parents brother sister grandfather grandmother grandpa grandma grandparent
+grandparents uncle aunt cousin family son daughter husband wife
+""".split())
+_HISTORY = frozenset("""
+died history ago previously previous formerly
+""".split())
+_HISTORY_PHRASES = (('last', 'year'), ('last', 'month'), ('years', 'back'), ('in', 'the', 'past'), ('used', 'to'))
+
+# One-to-one translation keeps str.translate on its fast path: sentence punctuation
+# becomes a '|' clause marker, every other punctuation character a space
+_PUNCTUATION = string.punctuation.replace("'", "")
+_TOKEN_TABLE = str.maketrans(_PUNCTUATION, ''.join('|' if c in '.,;:!?' else ' ' for c in _PUNCTUATION))
+
+
+def tokenize(text):
+    # Apostrophes are dropped so "can't" and "cant" are the same token
+    text = text.lower().replace("'", "").replace("\u2019", "").translate(_TOKEN_TABLE)
+    return text.replace('|', ' | ').split()
+
+
+class _Automaton:
+    """Aho-Corasick over word tokens; built once, then only read"""
+
+    def __init__(self, lexicon):
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [()]
+        for flag, phrases in lexicon.items():
+            for phrase in phrases:
+                words = tokenize(phrase)
+                if not words:
+                    continue
+                node = 0
+                for word in words:
+                    nxt = self.goto[node].get(word)
+                    if nxt is None:
+                        nxt = len(self.goto)
+                        self.goto[node][word] = nxt
+                        self.goto.append({})
+                        self.fail.append(0)
+                        self.out.append(())
+                    node = nxt
+                self.out[node] += ((len(words), flag),)
+
+        # Breadth-first failure links, merging the outputs of each node's suffix
+        queue = list(self.goto[0].values())
+        for node in queue:
+            for word, child in self.goto[node].items():
+                queue.append(child)
+                state = self.fail[node]
+                while state and word not in self.goto[state]:
+                    state = self.fail[state]
+                fallback = self.goto[state].get(word, 0)
+                self.fail[child] = fallback if fallback != child else 0
+                self.out[child] += self.out[self.fail[child]]
+
+    def search(self, tokens):
+        """(start token index, length in tokens, flag) for every phrase occurrence"""
+        goto, fail, out = self.goto, self.fail, self.out
+        root = goto[0]
+        node = 0
+        for i, token in enumerate(tokens):
+            if not node:
+                # Fast path - almost every token is not the start of a red-flag phrase
+                node = root.get(token, 0)
+            else:
+                while node and token not in goto[node]:
+                    node = fail[node]
+                node = goto[node].get(token, 0)
+            if out[node]:
+                for length, flag in out[node]:
+                    yield i - length + 1, length, flag
+
+
+def _negated(tokens, start):
+    """A negation cue right before the term, fillers aside"""
+    i = start - 1
+    while i >= 0 and tokens[i] in _NEGATION_FILLERS:
+        i -= 1
+    return i >= 0 and tokens[i] in _NEGATIONS
+
+
+def _clause(tokens, start, end):
+    """Tokens of the clause around tokens[start:end]"""
+    first = start
+    while first > 0 and tokens[first - 1] not in _CLAUSE_BREAKS:
+        first -= 1
+    last = end
+    while last < len(tokens) and tokens[last] not in _CLAUSE_BREAKS:
+        last += 1
+    return tokens[first:last]
+
+
+def _not_current(tokens, start, end):
+    """The clause is about a relative or a past episode ("my father died of a heart attack")"""
+    clause = _clause(tokens, start, end)
+    if not _FAMILY.isdisjoint(clause) or not _HISTORY.isdisjoint(clause):
+        return True
+    return any(tuple(clause[i:i + len(phrase)]) == phrase
+               for phrase in _HISTORY_PHRASES for i in range(len(clause) - len(phrase) + 1))
+
+
+class EmergencyPrescreen:
+    """Thread-safe red-flag matcher; reload() swaps in a new automaton atomically"""
+
+    def __init__(self, lexicon=None):
+        self._reload_lock = threading.Lock()
+        self.lexicon = None
+        self._automaton = None
+        self.reloads = 0
+        self.screened = 0
+        self.flagged = 0
+        self.reload(lexicon or DEFAULT_LEXICON)
+
+    def reload(self, lexicon):
+        automaton = _Automaton(lexicon)
+        with self._reload_lock:
+            # Readers grab self._automaton once per scan, so swapping the reference is safe
+            self.lexicon = lexicon
+            self._automaton = automaton
+            self.reloads += 1
+
+    def reload_file(self, path):
+        with open(path, encoding='utf-8') as f:
+            self.reload(json.load(f))
+
+    def scan(self, symptoms_text):
+        """Red-flag categories present now (not negated, not a relative's or past one), in order of first appearance"""
+        automaton = self._automaton
+        tokens = tokenize(symptoms_text)
+        flags = []
+        for start, length, flag in automaton.search(tokens):
+            if flag not in flags and not _negated(tokens, start) and not _not_current(tokens, start, start + length):
+                flags.append(flag)
+        # Plain counters; an occasional lost increment under contention is acceptable here
+        self.screened += 1
+        if flags:
+            self.flagged += 1
+        return flags
+
+    def stats(self):
+        return {
+            'phrases': sum(len(p) for p in self.lexicon.values()),
+            'reloads': self.reloads,
+            'screened': self.screened,
+            'flagged': self.flagged,
+        }
+
+
+def emergency_response(flags):
+    """Immediate answer sent without waiting for the model"""
+    return {
+        'is_emergency': 'true',
+        'possible_conditions': [],
+        'recommendations': 'EMERGENCY: Your symptoms may require immediate medical attention. '
+                           'Please call your local emergency number or go to the nearest emergency room now.',
+        'red_flags': flags,
+        'source': 'emergency_prescreen',
+    }
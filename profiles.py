@@ -0,0 +1,67 @@
+# ==========================================
+# PROFILE CACHE
+# ==========================================
+# Serialized profiles keyed by user id, with the ETag and Last-Modified
+# derived from users.updated_at. Commits that touch a User drop its entry in
+# this process; other workers catch up when their entry's TTL runs out.
+
+import datetime
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from cache import MemoryCache
+
+
+def profile_version(user):
+    """(etag, last_modified) for a user row; rows from before updated_at existed use created_at"""
+    modified = user.updated_at or user.created_at
+    if modified is None:
+        return f'{user.user_id}-0', None
+    if modified.tzinfo is None:
+        # DATETIME columns hold naive UTC
+        modified = modified.replace(tzinfo=datetime.timezone.utc)
+    return f'{user.user_id}-{int(modified.timestamp() * 1000000)}', modified
+
+
+class ProfileCache:
+    """Per-process LRU of profile payloads"""
+
+    def __init__(self, max_entries=2048, ttl=30):
+        self._entries = MemoryCache(max_entries=max_entries, ttl=ttl)
+
+    def get(self, user_id):
+        """(body, etag, last_modified) or None"""
+        return self._entries.get(str(user_id))
+
+    def put(self, user):
+        etag, modified = profile_version(user)
+        entry = (user.to_dict(), etag, modified)
+        self._entries.set(str(user.user_id), entry)
+        return entry
+
+    def invalidate(self, user_id):
+        self._entries.delete(str(user_id))
+
+    def stats(self):
+        return self._entries.stats()
+
+
+def watch_users(cache, model):
+    """Drop cached profiles of users changed or deleted by a commit in this process"""
+
+    @event.listens_for(Session, 'after_flush')
+    def _capture(session, flush_context):
+        changed = session.info.setdefault('profile_changes', set())
+        for obj in list(session.dirty) + list(session.deleted):
+            if isinstance(obj, model):
+                changed.add(obj.user_id)
+
+    @event.listens_for(Session, 'after_commit')
+    def _invalidate(session):
+        for user_id in session.info.pop('profile_changes', ()):
+            cache.invalidate(user_id)
+
+    @event.listens_for(Session, 'after_soft_rollback')
+    def _discard(session, previous_transaction):
+        session.info.pop('profile_changes', None)
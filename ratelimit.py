@@ -0,0 +1,308 @@
+# ==========================================
+# RATE LIMITING
+# ==========================================
+# Token buckets in front of the model calls: one per user (keyed by the JWT
+# identity) and one global bucket sized to the upstream Gemini quota. A bucket
+# holds at most `burst` tokens and refills at `rate` tokens a second; the
+# refill is computed lazily when the bucket is next used, so an update is a
+# dict lookup and a little arithmetic.
+#
+# The 'memory' backend keeps buckets per worker process. The 'sqlite' backend
+# keeps them in a SQLite file on the host (one UPSERT per check), so the limits
+# hold across gunicorn workers.
+
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import g, jsonify
+from flask_jwt_extended import get_jwt_identity
+
+from metrics import RATE_LIMITED
+
+
+class MemoryBuckets:
+    """Buckets of this process, least recently used evicted beyond max_keys (an evicted bucket starts full)"""
+
+    blocking = False
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()  # key -> [tokens, updated]
+        self._lock = threading.Lock()
+
+    def take(self, key, burst, rate, cost=1):
+        """(allowed, tokens left) - takes `cost` tokens only when that many are there"""
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [float(burst), now]
+                if len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+                bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+                bucket[1] = now
+            if bucket[0] < cost:
+                return False, bucket[0]
+            bucket[0] -= cost
+            return True, bucket[0]
+
+    def give_back(self, key, burst, cost=1):
+        """Return tokens taken for a request that was refused further on"""
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket[0] = min(burst, bucket[0] + cost)
+
+    def reset_after_fork(self):
+        pass
+
+    def stats(self):
+        with self._lock:
+            return {'backend': 'memory', 'buckets': len(self._buckets)}
+
+
+class SQLiteBuckets:
+    """Buckets in a SQLite file shared by every worker process on the host"""
+
+    blocking = True  # file I/O - keep it off an event loop
+
+    # Refill and take in one statement; no row comes back when there aren't enough tokens
+    _TAKE = (
+        "INSERT INTO rate_buckets (bucket_key, tokens, updated_at) VALUES (:key, :burst - :cost, :now)"
+        " ON CONFLICT (bucket_key) DO UPDATE SET"
+        "  tokens = min(:burst, tokens + (:now - updated_at) * :rate) - :cost, updated_at = :now"
+        " WHERE min(:burst, tokens + (:now - updated_at) * :rate) >= :cost"
+        " RETURNING tokens"
+    )
+
+    def __init__(self, path, max_idle=3600, prune_every=1000):
+        self.path = path
+        self.max_idle = max_idle  # a bucket unused this long is full again and its row can go
+        self.prune_every = prune_every
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._takes = 0
+        self.errors = 0
+        self._connection().execute(
+            "CREATE TABLE IF NOT EXISTS rate_buckets ("
+            " bucket_key TEXT PRIMARY KEY,"
+            " tokens REAL NOT NULL,"
+            " updated_at REAL NOT NULL)"
+        )
+
+    def _connection(self):
+        # One connection per thread, as in the shared analysis cache
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def take(self, key, burst, rate, cost=1):
+        # Wall clock: the processes sharing the file must agree on the time
+        now = time.time()
+        params = {'key': key, 'burst': burst, 'rate': rate, 'cost': cost, 'now': now}
+        with self._lock:
+            self._takes += 1
+            prune = self._takes % self.prune_every == 0
+        try:
+            conn = self._connection()
+            if prune:
+                conn.execute("DELETE FROM rate_buckets WHERE updated_at < ?", (now - self.max_idle,))
+            row = conn.execute(self._TAKE, params).fetchone()
+            if row is not None:
+                return True, row[0]
+            row = conn.execute("SELECT tokens, updated_at FROM rate_buckets WHERE bucket_key = ?", (key,)).fetchone()
+        except sqlite3.Error:
+            # Fail open - a locked or broken file must not take the API down
+            with self._lock:
+                self.errors += 1
+            return True, float(burst)
+        return False, min(burst, row[0] + (now - row[1]) * rate) if row else 0.0
+
+    def give_back(self, key, burst, cost=1):
+        try:
+            self._connection().execute(
+                "UPDATE rate_buckets SET tokens = min(?, tokens + ?) WHERE bucket_key = ?", (burst, cost, key))
+        except sqlite3.Error:
+            with self._lock:
+                self.errors += 1
+
+    def reset_after_fork(self):
+        # A SQLite connection must never be used by two processes
+        self._local = threading.local()
+
+    def stats(self):
+        try:
+            buckets = self._connection().execute("SELECT count(*) FROM rate_buckets").fetchone()[0]
+        except sqlite3.Error:
+            buckets = None
+        with self._lock:
+            return {'backend': 'sqlite', 'buckets': buckets, 'errors': self.errors}
+
+
+class RateLimit:
+    """Outcome of one check, for the 429 and the RateLimit-* headers"""
+
+    def __init__(self, allowed, scope, burst, rate, remaining, cost):
+        self.allowed = allowed
+        self.scope = scope  # the bucket reported: 'user', or 'global' when that one refused
+        self.burst = burst
+        self.rate = rate
+        self.remaining = remaining
+        self.cost = cost
+
+    @property
+    def reset_seconds(self):
+        """Until the bucket is full again"""
+        return math.ceil((self.burst - self.remaining) / self.rate)
+
+    @property
+    def retry_after(self):
+        """Until `cost` tokens are there"""
+        return max(1, math.ceil((self.cost - self.remaining) / self.rate))
+
+    def headers(self):
+        # IETF RateLimit header fields draft: the policy window is the time a drained bucket takes to refill
+        headers = {
+            'RateLimit-Limit': str(self.burst),
+            'RateLimit-Remaining': str(max(0, int(self.remaining))),
+            'RateLimit-Reset': str(self.reset_seconds),
+            'RateLimit-Policy': f"{self.burst};w={math.ceil(self.burst / self.rate)}",
+        }
+        if not self.allowed:
+            headers['Retry-After'] = str(self.retry_after)
+        return headers
+
+
+class RateLimiter:
+    """Per-user bucket, then the global one; a request refused globally gets its user token back.
+
+    A rate of 0 (or less) per minute turns that bucket off.
+    """
+
+    def __init__(self, buckets, user_burst=10, user_per_minute=20, global_burst=0, global_per_minute=0, enabled=True):
+        self.buckets = buckets
+        self.user_burst = user_burst
+        self.user_rate = user_per_minute / 60.0
+        self.global_burst = global_burst
+        self.global_rate = global_per_minute / 60.0
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self.allowed = 0
+        self.limited = {'user': 0, 'global': 0, 'too_large': 0}
+
+    @property
+    def max_cost(self):
+        """Largest request that can ever pass - no bucket holds more than its burst; None when no bucket is on"""
+        bursts = [burst for burst, rate in ((self.user_burst, self.user_rate), (self.global_burst, self.global_rate))
+                  if rate > 0]
+        return min(bursts) if bursts else None
+
+    def too_large(self, cost):
+        """True (and counted) for a request costing more than any bucket can hold"""
+        max_cost = self.max_cost
+        if max_cost is None or cost <= max_cost:
+            return False
+        with self._lock:
+            self.limited['too_large'] += 1
+        RATE_LIMITED.inc('too_large')
+        return True
+
+    def check(self, user_id, cost=1):
+        """Take `cost` tokens from the user's bucket and the global one - all of them or none.
+
+        None when both buckets are off. A cost above max_cost is always refused; turn it away
+        with too_large() first.
+        """
+        key = f"user:{user_id}"
+        decision = None
+        if self.user_rate > 0:
+            allowed, remaining = self.buckets.take(key, self.user_burst, self.user_rate, cost)
+            decision = RateLimit(allowed, 'user', self.user_burst, self.user_rate, remaining, cost)
+        if self.global_rate > 0 and (decision is None or decision.allowed):
+            global_allowed, global_remaining = self.buckets.take('global', self.global_burst, self.global_rate, cost)
+            if not global_allowed:
+                if decision is not None:
+                    self.buckets.give_back(key, self.user_burst, cost)
+                decision = RateLimit(False, 'global', self.global_burst, self.global_rate, global_remaining, cost)
+            elif decision is None:
+                decision = RateLimit(True, 'global', self.global_burst, self.global_rate, global_remaining, cost)
+        if decision is None:
+            return None
+        with self._lock:
+            if decision.allowed:
+                self.allowed += 1
+            else:
+                self.limited[decision.scope] += 1
+        if not decision.allowed:
+            RATE_LIMITED.inc(decision.scope)
+        return decision
+
+    def limit(self, cost=None):
+        """Route decorator (under @jwt_required) - 429 when the user's or the global bucket is empty.
+
+        cost: function of the request returning the tokens it needs (default 1), e.g. texts in a batch.
+        A request costing more than a bucket's burst could never pass and is answered 413.
+        """
+
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return view(*args, **kwargs)
+                tokens = cost() if cost is not None else 1
+                if self.too_large(tokens):
+                    return jsonify({'error': f"Request too large for the rate limit, send at most {self.max_cost} "
+                                             f"symptom texts at a time"}), 413
+                decision = self.check(get_jwt_identity(), tokens)
+                if decision is not None and not decision.allowed:
+                    return jsonify({'error': 'Rate limit exceeded, please retry later'}), 429, decision.headers()
+                g.rate_limit = decision
+                return view(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def stats(self):
+        with self._lock:
+            stats = {
+                'user_burst': self.user_burst,
+                'user_per_minute': self.user_rate * 60,
+                'global_burst': self.global_burst,
+                'global_per_minute': self.global_rate * 60,
+                'allowed': self.allowed,
+                'max_cost': self.max_cost,
+                'limited': dict(self.limited),
+            }
+        stats.update(self.buckets.stats())
+        return stats
+
+
+def build_buckets(backend, path):
+    """'memory' limits each worker process on its own, 'sqlite' shares the buckets across them"""
+    if backend == 'sqlite':
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        return SQLiteBuckets(path)
+    return MemoryBuckets()
+
+
+def install_rate_limit_headers(app):
+    """RateLimit-* headers on the responses of limited routes"""
+
+    @app.after_request
+    def _rate_limit_headers(response):
+        decision = g.pop('rate_limit', None)
+        if decision is not None:
+            response.headers.extend(decision.headers())
+        return response
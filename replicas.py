@@ -0,0 +1,181 @@
+# ==========================================
+# READ REPLICA ROUTING
+# ==========================================
+# With DB_REPLICA_URLS set, routes marked @replica_reads send their SELECTs
+# to a replica; everything else, and every write, stays on the primary.
+# A user who just wrote is pinned to the primary for a few seconds so they
+# read their own writes despite replication lag.
+
+import functools
+import itertools
+import threading
+import time
+
+from flask import g, has_app_context
+from flask_jwt_extended import get_jwt_identity
+from flask_sqlalchemy.session import Session as FlaskSession
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.sql.dml import UpdateBase
+
+
+class ReplicaSet:
+    """Replica engines plus the read-your-writes pins"""
+
+    def __init__(self, urls, strategy='round_robin', pin_seconds=5.0, engine_options=None):
+        if strategy not in ('round_robin', 'least_connections'):
+            raise ValueError(f"Unknown replica strategy: {strategy}")
+        self.strategy = strategy
+        self.pin_seconds = pin_seconds
+        self.engines = [create_engine(url, **(engine_options(url) if engine_options else {})) for url in urls]
+        self._cycle = itertools.cycle(range(len(self.engines)))
+        self._pins = {}  # key -> monotonic time the pin ends
+        self._lock = threading.Lock()
+        self.replica_reads = [0] * len(self.engines)
+        self.pinned_reads = 0
+        self.primary_fallbacks = 0
+
+    def __bool__(self):
+        return bool(self.engines)
+
+    def choose(self):
+        """Index of the replica the next request should read from"""
+        with self._lock:
+            if self.strategy == 'least_connections':
+                index = min(range(len(self.engines)), key=self._in_use)
+            else:
+                index = next(self._cycle)
+            self.replica_reads[index] += 1
+            return index
+
+    def _in_use(self, index):
+        pool = self.engines[index].pool
+        return pool.checkedout() if isinstance(pool, QueuePool) else 0
+
+    def pin(self, key):
+        """Send key's reads to the primary for the next pin_seconds"""
+        if key is None or not self.engines:
+            return
+        now = time.monotonic()
+        with self._lock:
+            self._pins[str(key)] = now + self.pin_seconds
+            if len(self._pins) > 10000:
+                self._pins = {k: until for k, until in self._pins.items() if until > now}
+
+    def is_pinned(self, key):
+        if key is None:
+            return False
+        with self._lock:
+            until = self._pins.get(str(key))
+            if until is None:
+                return False
+            if until <= time.monotonic():
+                del self._pins[str(key)]
+                return False
+            self.pinned_reads += 1
+            return True
+
+    def read_primary(self):
+        """Send the rest of this request's reads to the primary, e.g. to retry a lookup the replica missed.
+
+        Returns False when the request wasn't reading from a replica, so there is nothing to retry.
+        """
+        if not has_app_context() or g.get('db_replica') is None:
+            return False
+        g.db_replica = None
+        with self._lock:
+            self.primary_fallbacks += 1
+        return True
+
+    def dispose(self):
+        # Called after fork: the children must open their own connections
+        for engine in self.engines:
+            engine.dispose(close=False)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'strategy': self.strategy,
+                'replicas': [
+                    {'url': engine.url.render_as_string(hide_password=True), 'reads': reads, 'in_use': self._in_use(i)}
+                    for i, (engine, reads) in enumerate(zip(self.engines, self.replica_reads))
+                ],
+                'pinned': len(self._pins),
+                'pinned_reads': self.pinned_reads,
+                'primary_fallbacks': self.primary_fallbacks,
+            }
+
+
+class RoutingSession(FlaskSession):
+    """db.session class that sends reads to the replica chosen for the current request"""
+
+    def __init__(self, db, replicas=None, **kwargs):
+        super().__init__(db, **kwargs)
+        self.replicas = replicas
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self.replicas and not self._flushing and _is_plain_read(clause):
+            index = _current_replica()
+            if index is not None:
+                return self.replicas.engines[index]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def _is_plain_read(clause):
+    if clause is None or isinstance(clause, UpdateBase):
+        return False
+    # SELECT ... FOR UPDATE takes locks, it has to run on the primary
+    return getattr(clause, '_for_update_arg', None) is None
+
+
+def _current_replica():
+    if not has_app_context():
+        return None
+    return g.get('db_replica')
+
+
+def _identity():
+    try:
+        return get_jwt_identity()
+    except RuntimeError:
+        return None  # no JWT checked in this request
+
+
+def replica_reads(replicas, key=None):
+    """Route decorator: the view's reads go to a replica unless the user is pinned to the primary.
+
+    key returns the pin key for requests without a JWT identity (e.g. the email on login).
+    Put it below @jwt_required so the token and blocklist checks still read the primary.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if replicas:
+                pin_key = _identity()
+                if pin_key is None and key is not None:
+                    pin_key = key()
+                g.db_pin_key = pin_key
+                if not replicas.is_pinned(pin_key):
+                    g.db_replica = replicas.choose()
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def watch_writes(replicas):
+    """Pin the current user to the primary after any commit that wrote rows"""
+
+    @event.listens_for(Session, 'after_flush')
+    def _mark(session, flush_context):
+        session.info['replica_wrote'] = True
+
+    @event.listens_for(Session, 'after_commit')
+    def _pin(session):
+        if session.info.pop('replica_wrote', False) and has_app_context():
+            key = g.get('db_pin_key')
+            replicas.pin(key if key is not None else _identity())
+
+    @event.listens_for(Session, 'after_soft_rollback')
+    def _discard(session, previous_transaction):
+        session.info.pop('replica_wrote', None)
@@ -0,0 +1,403 @@
+# ==========================================
+# RESILIENT MODEL CLIENT
+# ==========================================
+# Wraps client.models so a slow or failing Gemini can't hold request
+# threads: every call has a deadline, retryable errors are retried with
+# jittered exponential backoff, a circuit breaker fails fast while the
+# error rate is high, and an optional hedge sends the same prompt to a
+# secondary model when the first answer is slower than usual (p95).
+#
+# Calls run on a private thread pool so the caller can stop waiting at the
+# deadline; the HTTP client's own timeout ends the abandoned request. The
+# *_async variants do the same on the event loop with the asyncio client,
+# sharing the breaker, latency samples and counters.
+
+import asyncio
+import logging
+import random
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeout
+
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+
+class CircuitOpen(Exception):
+    """The breaker is open - the call was not attempted"""
+
+
+class DeadlineExceeded(TimeoutError):
+    """No answer within the call's deadline"""
+
+
+def is_retryable(error):
+    """Transient failures worth another attempt: timeouts, dropped connections, 429 and 5xx"""
+    if isinstance(error, (DeadlineExceeded, TimeoutError, ConnectionError)):
+        return True
+    # httpx is only loaded along with the Gemini client; nothing can have raised its errors before that
+    httpx = sys.modules.get('httpx')
+    if httpx is not None and isinstance(error, httpx.TransportError):
+        return True
+    code = getattr(error, 'code', None)
+    return isinstance(code, int) and code in RETRYABLE_STATUS
+
+
+class CircuitBreaker:
+    """Opens when at least failure_rate of the last `window` calls failed (after min_calls).
+
+    While open every call is refused for `cooldown` seconds; then one trial call is let
+    through (half-open) and its outcome closes or re-opens the breaker.
+    """
+
+    def __init__(self, failure_rate=0.5, window=20, min_calls=10, cooldown=30.0):
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.cooldown = cooldown
+        self._outcomes = deque(maxlen=window)
+        self._opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+        self.opened = 0
+        self.rejected = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+        if self._opened_at is None:
+            return 'closed'
+        if time.monotonic() - self._opened_at < self.cooldown:
+            return 'open'
+        return 'half_open'
+
+    def allow(self):
+        with self._lock:
+            state = self._state()
+            if state == 'closed':
+                return True
+            if state == 'half_open' and not self._trial_running:
+                self._trial_running = True
+                return True
+            self.rejected += 1
+            return False
+
+    def release(self):
+        """An allowed call ended without an outcome (cancelled); a half-open breaker may try again"""
+        with self._lock:
+            if self._opened_at is not None:
+                self._trial_running = False
+
+    def record(self, success):
+        with self._lock:
+            if self._opened_at is not None:
+                if not self._trial_running:
+                    return  # a call that started before the breaker opened
+                self._trial_running = False
+                if success:
+                    self._opened_at = None
+                    self._outcomes.clear()
+                else:
+                    self._opened_at = time.monotonic()
+                return
+            self._outcomes.append(success)
+            failures = self._outcomes.count(False)
+            if len(self._outcomes) >= self.min_calls and failures / len(self._outcomes) >= self.failure_rate:
+                self._opened_at = time.monotonic()
+                self.opened += 1
+                logging.warning(f"Gemini circuit opened: {failures}/{len(self._outcomes)} recent calls failed")
+
+
+class LatencyTracker:
+    """Recent successful call latencies, for the hedging delay"""
+
+    def __init__(self, size=200):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, pct, min_samples=20):
+        with self._lock:
+            if len(self._samples) < min_samples:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100.0))]
+
+
+class ResilientModels:
+    """Drop-in for client.models (generate_content / generate_content_stream).
+
+    get_models returns the models object to call, looked up on every call so the
+    client behind it can be swapped (tests, benchmarks).
+    """
+
+    def __init__(self, get_models, timeout=20.0, deadline=45.0, max_attempts=3, backoff_base=0.5, backoff_max=4.0,
+                 breaker=None, hedge_model=None, hedge_percentile=95, hedge_min_delay=0.5, max_concurrency=32,
+                 get_async_models=None):
+        self.get_models = get_models
+        self.get_async_models = get_async_models  # client.aio.models, for generate_content_async
+        self.timeout = timeout  # per attempt
+        self.deadline = deadline  # whole call, retries included
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker or CircuitBreaker()
+        self.hedge_model = hedge_model
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_delay = hedge_min_delay
+        self.latency = LatencyTracker()
+        self._pool = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix='gemini')
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.retries = 0
+        self.timeouts = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def _backoff_seconds(self, attempt, ends_at):
+        # Full jitter: a random wait up to the exponential step, never past the deadline
+        step = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        return max(0.0, min(random.uniform(0, step), ends_at - time.monotonic()))
+
+    def _backoff(self, attempt, ends_at):
+        time.sleep(self._backoff_seconds(attempt, ends_at))
+
+    def _failed(self, error, attempt, ends_at):
+        """Record a failed attempt; True when it is worth another one"""
+        retryable = is_retryable(error)
+        # A rejected request (400, 403, ...) still shows the upstream is up
+        self.breaker.record(not retryable)
+        if isinstance(error, DeadlineExceeded):
+            self._count('timeouts')
+        last_try = attempt == self.max_attempts - 1 or ends_at - time.monotonic() <= 0
+        if last_try or not retryable:
+            return False
+        self._count('retries')
+        logging.warning(f"Gemini call failed ({error!r}), retrying")
+        return True
+
+    def _hedge_delay(self, timeout):
+        """Seconds to wait for the primary before hedging, or None for no hedge"""
+        if not self.hedge_model:
+            return None
+        p = self.latency.percentile(self.hedge_percentile)
+        if p is None:
+            return None
+        delay = max(self.hedge_min_delay, p)
+        return delay if delay < timeout else None
+
+    def _with_retries(self, attempt_fn, ends_at=None):
+        self._count('calls')
+        if ends_at is None:
+            ends_at = time.monotonic() + self.deadline
+        for attempt in range(self.max_attempts):
+            remaining = ends_at - time.monotonic()
+            if remaining <= 0:
+                break
+            if not self.breaker.allow():
+                raise CircuitOpen("Gemini circuit breaker is open")
+            try:
+                result = attempt_fn(min(self.timeout, remaining))
+            except Exception as e:
+                if not self._failed(e, attempt, ends_at):
+                    raise
+                self._backoff(attempt, ends_at)
+                continue
+            self.breaker.record(True)
+            return result
+        raise DeadlineExceeded("Gemini call deadline exceeded")
+
+    def generate_content(self, model, contents, **kwargs):
+        return self._with_retries(lambda timeout: self._hedged_call(model, contents, kwargs, timeout))
+
+    def _timed_call(self, model, contents, kwargs):
+        started = time.monotonic()
+        response = self.get_models().generate_content(model=model, contents=contents, **kwargs)
+        return response, time.monotonic() - started
+
+    def _hedged_call(self, model, contents, kwargs, timeout):
+        ends_at = time.monotonic() + timeout
+        primary = self._pool.submit(self._timed_call, model, contents, kwargs)
+        pending = {primary}
+
+        hedge_delay = self._hedge_delay(timeout)
+        if hedge_delay is not None:
+            done, _ = wait(pending, timeout=hedge_delay)
+            if not done:
+                self._count('hedges')
+                pending.add(self._pool.submit(self._timed_call, self.hedge_model, contents, kwargs))
+
+        error = None
+        while pending:
+            done, pending = wait(pending, timeout=max(0.0, ends_at - time.monotonic()), return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                try:
+                    response, elapsed = future.result()
+                except Exception as e:
+                    error = e
+                    continue
+                if future is primary:
+                    self.latency.add(elapsed)
+                else:
+                    self._count('hedge_wins')
+                return response
+        if error is not None and not pending:
+            raise error
+        raise DeadlineExceeded(f"No Gemini response within {timeout:.1f}s")
+
+    def generate_content_stream(self, model, contents, **kwargs):
+        """Stream with the same protection; retries only happen before the first chunk has been yielded.
+
+        The deadline covers the whole stream. A stall or an error after the first chunk counts as a
+        failed call for the breaker; the SDK stream is closed however the stream ends.
+        """
+        ends_at = time.monotonic() + self.deadline
+        stream, first = self._with_retries(lambda timeout: self._open_stream(model, contents, kwargs, timeout), ends_at)
+        if first is None:
+            return
+        future = None
+        try:
+            yield first
+            while True:
+                remaining = ends_at - time.monotonic()
+                future = self._pool.submit(next, stream, None)
+                try:
+                    chunk = future.result(timeout=max(0.0, min(self.timeout, remaining)))
+                except FutureTimeout:
+                    self._count('timeouts')
+                    self.breaker.record(False)
+                    if remaining <= self.timeout:
+                        raise DeadlineExceeded("Gemini stream deadline exceeded")
+                    raise DeadlineExceeded("Gemini stream stalled")
+                except Exception:
+                    self.breaker.record(False)
+                    raise
+                if chunk is None:
+                    return
+                yield chunk
+        finally:
+            self._close_stream(stream, future)
+
+    @staticmethod
+    def _close_stream(stream, pending=None):
+        """Close the SDK stream to release its connection - once a read still running returns, if there is one.
+
+        The HTTP client's read timeout bounds how long that read can hold its pool thread.
+        """
+        close = getattr(stream, 'close', None)
+        if close is None:
+            return
+
+        def close_quietly(_=None):
+            try:
+                close()
+            except Exception as e:
+                logging.debug(f"Closing a Gemini stream failed: {e!r}")
+
+        if pending is not None and not pending.done():
+            pending.add_done_callback(close_quietly)
+        else:
+            close_quietly()
+
+    def _open_stream(self, model, contents, kwargs, timeout):
+        def first_chunk():
+            stream = iter(self.get_models().generate_content_stream(model=model, contents=contents, **kwargs))
+            return stream, next(stream, None)
+
+        future = self._pool.submit(first_chunk)
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeout:
+            raise DeadlineExceeded(f"No Gemini stream within {timeout:.1f}s")
+
+    async def generate_content_async(self, model, contents, **kwargs):
+        """generate_content on the asyncio client - waiting holds no thread, losing hedges are cancelled"""
+        self._count('calls')
+        ends_at = time.monotonic() + self.deadline
+        for attempt in range(self.max_attempts):
+            remaining = ends_at - time.monotonic()
+            if remaining <= 0:
+                break
+            if not self.breaker.allow():
+                raise CircuitOpen("Gemini circuit breaker is open")
+            try:
+                result = await self._hedged_call_async(model, contents, kwargs, min(self.timeout, remaining))
+            except asyncio.CancelledError:
+                self.breaker.release()
+                raise
+            except Exception as e:
+                if not self._failed(e, attempt, ends_at):
+                    raise
+                await asyncio.sleep(self._backoff_seconds(attempt, ends_at))
+                continue
+            self.breaker.record(True)
+            return result
+        raise DeadlineExceeded("Gemini call deadline exceeded")
+
+    async def _timed_call_async(self, model, contents, kwargs):
+        started = time.monotonic()
+        response = await self.get_async_models().generate_content(model=model, contents=contents, **kwargs)
+        return response, time.monotonic() - started
+
+    async def _hedged_call_async(self, model, contents, kwargs, timeout):
+        ends_at = time.monotonic() + timeout
+        primary = asyncio.ensure_future(self._timed_call_async(model, contents, kwargs))
+        pending = {primary}
+        try:
+            hedge_delay = self._hedge_delay(timeout)
+            if hedge_delay is not None:
+                done, _ = await asyncio.wait(pending, timeout=hedge_delay)
+                if not done:
+                    self._count('hedges')
+                    pending.add(asyncio.ensure_future(self._timed_call_async(self.hedge_model, contents, kwargs)))
+
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, timeout=max(0.0, ends_at - time.monotonic()),
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    break
+                for future in done:
+                    try:
+                        response, elapsed = future.result()
+                    except Exception as e:
+                        error = e
+                        continue
+                    if future is primary:
+                        self.latency.add(elapsed)
+                    else:
+                        self._count('hedge_wins')
+                    return response
+            if error is not None and not pending:
+                raise error
+            raise DeadlineExceeded(f"No Gemini response within {timeout:.1f}s")
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'state': self.breaker.state,
+                'calls': self.calls,
+                'retries': self.retries,
+                'timeouts': self.timeouts,
+                'hedges': self.hedges,
+                'hedge_wins': self.hedge_wins,
+                'circuit_opened': self.breaker.opened,
+                'circuit_rejected': self.breaker.rejected,
+                'p95_seconds': self.latency.percentile(95),
+            }
@@ -0,0 +1,172 @@
+# ==========================================
+# JWT REVOCATION CACHE
+# ==========================================
+# Keeps @jwt_required from querying blacklisted_tokens on every request.
+# Revoked JTIs are mirrored in memory and pulled incrementally (by id) from
+# the table; JTIs recently confirmed as not revoked sit in a small LRU.
+
+import datetime
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+
+def _epoch(value):
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=datetime.timezone.utc)
+    return value.timestamp()
+
+
+class RevocationCache:
+    """Answers "is this JTI revoked?" from memory, querying the table only for unseen JTIs"""
+
+    def __init__(self, model, session_factory, sync_interval=5.0, negative_size=10000, default_ttl=86400):
+        self.model = model
+        self.session_factory = session_factory
+        self.sync_interval = sync_interval
+        self.negative_size = negative_size
+        # Lifetime assumed for legacy rows stored without expires_at
+        self.default_ttl = default_ttl
+        self._revoked = {}  # jti -> expiry epoch
+        self._negative = OrderedDict()  # jti -> time it was confirmed not revoked
+        self._watermark = 0  # highest TokenBlocklist.id seen
+        self._last_sync = 0.0
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self.hits = 0
+        self.negative_hits = 0
+        self.db_lookups = 0
+        self.syncs = 0
+
+    def revoke(self, jti, expires_at):
+        """Record a revocation made by this process so it takes effect immediately"""
+        with self._lock:
+            self._revoked[jti] = expires_at
+            self._negative.pop(jti, None)
+
+    def is_revoked(self, jti):
+        self._maybe_sync()
+        now = time.time()
+        with self._lock:
+            if jti in self._revoked:
+                self.hits += 1
+                return True
+            checked_at = self._negative.get(jti)
+            if checked_at is not None and now - checked_at < self.sync_interval:
+                self._negative.move_to_end(jti)
+                self.negative_hits += 1
+                return False
+
+        # Not seen yet - another worker may have revoked it since our last sync
+        session = self.session_factory()
+        row = session.query(self.model.expires_at, self.model.created_at).filter_by(jti=jti).first()
+        with self._lock:
+            self.db_lookups += 1
+            if row is not None:
+                self._revoked[jti] = self._expiry(row.expires_at, row.created_at)
+                return True
+            self._negative[jti] = now
+            self._negative.move_to_end(jti)
+            while len(self._negative) > self.negative_size:
+                self._negative.popitem(last=False)
+        return False
+
+    def _expiry(self, expires_at, created_at):
+        if expires_at is not None:
+            return _epoch(expires_at)
+        return (_epoch(created_at) or time.time()) + self.default_ttl
+
+    def _maybe_sync(self):
+        if time.monotonic() - self._last_sync < self.sync_interval:
+            return
+        # One thread syncs, the rest carry on with what is cached
+        if not self._sync_lock.acquire(blocking=False):
+            return
+        try:
+            self.sync()
+        except Exception as e:
+            logging.warning(f"Token blocklist sync failed: {e}")
+        finally:
+            self._last_sync = time.monotonic()
+            self._sync_lock.release()
+
+    def sync(self):
+        """Pull rows added since the last sync and drop entries whose tokens have expired"""
+        model = self.model
+        rows = self.session_factory().query(model.id, model.jti, model.expires_at, model.created_at) \
+            .filter(model.id > self._watermark) \
+            .order_by(model.id) \
+            .all()
+        now = time.time()
+        with self._lock:
+            for row in rows:
+                self._revoked[row.jti] = self._expiry(row.expires_at, row.created_at)
+                self._negative.pop(row.jti, None)
+                self._watermark = max(self._watermark, row.id)
+            for jti in [jti for jti, expiry in self._revoked.items() if expiry <= now]:
+                del self._revoked[jti]
+            self.syncs += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'revoked': len(self._revoked),
+                'negative_entries': len(self._negative),
+                'watermark': self._watermark,
+                'hits': self.hits,
+                'negative_hits': self.negative_hits,
+                'db_lookups': self.db_lookups,
+                'syncs': self.syncs,
+            }
+
+
+class BlocklistPruner(threading.Thread):
+    """Background thread that deletes rows for tokens that have expired anyway"""
+
+    def __init__(self, app, db, model, interval=600.0, batch_size=1000, default_ttl=86400):
+        super().__init__(name='blocklist-pruner', daemon=True)
+        self.app = app
+        self.db = db
+        self.model = model
+        self.interval = interval
+        self.batch_size = batch_size
+        self.default_ttl = default_ttl
+        self._stop_event = threading.Event()
+        self.deleted = 0
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.prune()
+            except Exception as e:
+                logging.warning(f"Token blocklist prune failed: {e}")
+
+    def stop(self):
+        self._stop_event.set()
+
+    def prune(self):
+        """Delete dead rows in batches so no single statement holds locks for long"""
+        model = self.model
+        # DATETIME columns hold naive UTC
+        now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+        legacy_cutoff = now - datetime.timedelta(seconds=self.default_ttl)
+        deleted = 0
+        with self.app.app_context():
+            session = self.db.session
+            while True:
+                ids = [row.id for row in session.query(model.id).filter(
+                    self.db.or_(
+                        model.expires_at < now,
+                        self.db.and_(model.expires_at.is_(None), model.created_at < legacy_cutoff),
+                    )
+                ).limit(self.batch_size).all()]
+                if not ids:
+                    break
+                session.query(model).filter(model.id.in_(ids)).delete(synchronize_session=False)
+                session.commit()
+                deleted += len(ids)
+        self.deleted += deleted
+        return deleted
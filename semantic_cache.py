@@ -0,0 +1,241 @@
+# ==========================================
+# NEAR-DUPLICATE SYMPTOM CACHE (MinHash + LSH)
+# ==========================================
+
+import argparse
+import hashlib
+import json
+import random
+import re
+import statistics
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from cache import is_cacheable, normalize_symptoms
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+# Words that change how a complaint is phrased but not what it is. Severity and intensity
+# words (severe, mild, very, a lot...) are kept: "mild headache" and "severe headache" may
+# triage differently.
+_STOPWORDS = frozenset("""
+a an the i im i'm ive i've my me have has having had am is are was were be been feel feeling
+felt got get getting some of in on at since for from to it its this that and or with plus also
+""".split())
+
+# Common paraphrases folded onto one term before shingling
+_SYNONYMS = [
+    (re.compile(r"\bhead\s*(?:pain|ache)s?\b"), "headache"),
+    (re.compile(r"\bstomach\s*(?:pain|ache)s?\b|\bbelly\s*(?:pain|ache)s?\b|\babdominal pain\b"), "stomachache"),
+    (re.compile(r"\b(?:high )?temperature\b|\bfeverish\b|\bpyrexia\b"), "fever"),
+    (re.compile(r"\bshort(?:ness)? of breath\b|\bbreathless(?:ness)?\b|\btrouble breathing\b"), "difficulty breathing"),
+    (re.compile(r"\bthrowing up\b|\bvomit(?:ing|ed)?\b"), "vomiting"),
+    (re.compile(r"\btired(?:ness)?\b|\bexhaust(?:ed|ion)\b"), "fatigue"),
+    (re.compile(r"\blight\s*headed(?:ness)?\b|\bdizzy\b"), "dizziness"),
+]
+
+
+def fold_synonyms(text):
+    """Rewrite common paraphrases of a symptom to one term ("head pain" -> "headache")"""
+    for pattern, replacement in _SYNONYMS:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+def shingles(symptoms_text, k=4):
+    """Character k-grams of the content words, so word order and filler don't matter"""
+    text = fold_synonyms(normalize_symptoms(symptoms_text).replace(",", " "))
+    words = sorted({w for w in text.split() if w not in _STOPWORDS})
+    result = set()
+    for word in words:
+        padded = f" {word} "
+        if len(padded) <= k:
+            result.add(padded)
+        for i in range(len(padded) - k + 1):
+            result.add(padded[i:i + k])
+    return result
+
+
+def _hash_shingle(shingle):
+    return int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=4).digest(), 'little')
+
+
+class MinHasher:
+    """Fixed family of universal hash permutations; seeded so every worker builds the same one"""
+
+    def __init__(self, num_perm=64, seed=1):
+        rng = random.Random(seed)
+        self.num_perm = num_perm
+        self._params = [(rng.randrange(1, _MERSENNE_PRIME), rng.randrange(0, _MERSENNE_PRIME))
+                        for _ in range(num_perm)]
+
+    def signature(self, shingle_set):
+        if not shingle_set:
+            return None
+        hashes = [_hash_shingle(s) for s in shingle_set]
+        return tuple(
+            min(((a * h + b) % _MERSENNE_PRIME) & _MAX_HASH for h in hashes)
+            for a, b in self._params
+        )
+
+
+def estimated_similarity(sig_a, sig_b):
+    """Fraction of matching MinHash slots - an unbiased estimate of Jaccard similarity"""
+    return sum(1 for x, y in zip(sig_a, sig_b) if x == y) / len(sig_a)
+
+
+class SemanticCache:
+    """Bounded LSH index of past analyses; returns a stored result for near-duplicate queries"""
+
+    def __init__(self, max_entries=5000, threshold=0.9, num_perm=64, bands=16):
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.hasher = MinHasher(num_perm)
+        self._entries = OrderedDict()  # entry_id -> (signature, value)
+        self._buckets = [{} for _ in range(bands)]  # band -> {band_key: set(entry_id)}
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _band_keys(self, signature):
+        r = self.rows
+        return [signature[i * r:(i + 1) * r] for i in range(self.bands)]
+
+    def signature(self, symptoms_text):
+        return self.hasher.signature(shingles(symptoms_text))
+
+    def lookup(self, symptoms_text, signature=None):
+        """Best stored value above the similarity threshold, or None"""
+        signature = signature or self.signature(symptoms_text)
+        if signature is None:
+            return None
+        with self._lock:
+            candidates = set()
+            for band, key in enumerate(self._band_keys(signature)):
+                candidates.update(self._buckets[band].get(key, ()))
+            best_id, best_score = None, self.threshold
+            for entry_id in candidates:
+                score = estimated_similarity(signature, self._entries[entry_id][0])
+                if score >= best_score:
+                    best_id, best_score = entry_id, score
+            if best_id is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(best_id)
+            self.hits += 1
+            return self._entries[best_id][1]
+
+    def add(self, symptoms_text, value, signature=None):
+        if not is_cacheable(value):
+            return
+        signature = signature or self.signature(symptoms_text)
+        if signature is None:
+            return
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = (signature, value)
+            for band, key in enumerate(self._band_keys(signature)):
+                self._buckets[band].setdefault(key, set()).add(entry_id)
+            while len(self._entries) > self.max_entries:
+                self._evict_oldest()
+
+    def _evict_oldest(self):
+        entry_id, (signature, _) = self._entries.popitem(last=False)
+        for band, key in enumerate(self._band_keys(signature)):
+            bucket = self._buckets[band].get(key)
+            if bucket is not None:
+                bucket.discard(entry_id)
+                if not bucket:
+                    del self._buckets[band][key]
+        self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._buckets = [{} for _ in range(self.bands)]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'threshold': self.threshold,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+# ==========================================
+# OFFLINE REPLAY
+# ==========================================
+
+def read_queries(path):
+    """One query per line, either plain text or a JSON object with symptoms_text"""
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith('{'):
+                line = json.loads(line).get('symptoms_text', '')
+            if line:
+                yield line
+
+
+def replay(queries, cache, model_latency_ms=2500.0, cost_per_call=0.0):
+    """Run a query log through the cache and estimate the Gemini calls and latency it saves"""
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        signature = cache.signature(query)
+        hit = cache.lookup(query, signature) is not None
+        lookup_ms = (time.perf_counter() - start) * 1000
+        if hit:
+            latencies.append(lookup_ms)
+        else:
+            latencies.append(lookup_ms + model_latency_ms)
+            cache.add(query, {'replayed': True}, signature)
+
+    total = len(latencies)
+    stats = cache.stats()
+    hits = stats['hits']
+    return {
+        'queries': total,
+        'hits': hits,
+        'hit_rate': hits / total if total else 0.0,
+        'model_calls_saved': hits,
+        'cost_saved': hits * cost_per_call,
+        'p50_latency_ms_without_cache': model_latency_ms if total else 0.0,
+        'p50_latency_ms_with_cache': statistics.median(latencies) if total else 0.0,
+        'evictions': stats['evictions'],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a symptom query log against the near-duplicate cache")
+    parser.add_argument('log', help="file with one query per line (plain text or JSON with symptoms_text)")
+    parser.add_argument('--threshold', type=float, default=0.9)
+    parser.add_argument('--max-entries', type=int, default=5000)
+    parser.add_argument('--model-latency-ms', type=float, default=2500.0)
+    parser.add_argument('--cost-per-call', type=float, default=0.0)
+    args = parser.parse_args(argv)
+
+    cache = SemanticCache(max_entries=args.max_entries, threshold=args.threshold)
+    report = replay(read_queries(args.log), cache, args.model_latency_ms, args.cost_per_call)
+    json.dump(report, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == '__main__':
+    main()
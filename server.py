@@ -0,0 +1,179 @@
+# ==========================================
+# PRODUCTION SERVER
+# ==========================================
+# python main.py serve                                  - run gunicorn with the settings below
+# gunicorn -c server.py 'server:create_app()'           - same thing from the gunicorn CLI
+# python main.py serve-asgi                             - uvicorn running asgi.py (async /api/analyze)
+#
+# The app is loaded once in the master (preload_app) and forked into the
+# workers, so imports and start-up work are shared copy-on-write.
+
+import gc
+import logging
+import os
+import threading
+
+from boottime import boot
+from dotenv import load_dotenv
+
+from config import app, db, pool_metrics, rate_limiter, replicas
+
+# Seconds spent importing Flask, SQLAlchemy and the settings
+boot.mark('config')
+
+# Worker processes each running a pool of threads; the model calls are I/O bound
+bind = app.config['SERVER_BIND']
+workers = app.config['SERVER_WORKERS']
+threads = app.config['SERVER_THREADS']
+worker_class = app.config['SERVER_WORKER_CLASS']
+preload_app = True
+# Gemini calls can take several seconds; don't kill workers that are just waiting on them
+timeout = app.config['SERVER_TIMEOUT']
+graceful_timeout = app.config['SERVER_GRACEFUL_TIMEOUT']
+keepalive = app.config['SERVER_KEEPALIVE']
+# Recycle workers now and then so slow leaks can't build up; jitter stops them restarting together
+max_requests = app.config['SERVER_MAX_REQUESTS']
+max_requests_jitter = app.config['SERVER_MAX_REQUESTS_JITTER']
+
+
+def check_env():
+    """Exit early when required settings are missing"""
+    load_dotenv()
+    if os.getenv("DB_URL") =="" or os.getenv("DB_URL") is None:
+        print("No DB_URL in env")
+        os._exit(1)
+    if os.getenv("JWT_SECRET_KEY") =="" or os.getenv("JWT_SECRET_KEY") is None:
+        print("No JWT_SECRET_KEY in env")
+        os._exit(1)
+
+
+def startup():
+    """One-time start-up work, done before any worker accepts requests"""
+    from db import init_database
+
+    check_env()
+    with boot.phase('database'):
+        init_database()
+
+
+def start_background_tasks():
+    """Per-process background threads - threads don't survive fork, so workers start their own"""
+    import ai
+    from endpoints import history_buffer
+    from models import TokenBlocklist
+    from revocation import BlocklistPruner
+
+    BlocklistPruner(
+        app, db, TokenBlocklist,
+        interval=app.config['BLOCKLIST_PRUNE_INTERVAL'],
+        batch_size=app.config['BLOCKLIST_PRUNE_BATCH'],
+        default_ttl=app.config['JWT_ACCESS_TOKEN_EXPIRES'].total_seconds(),
+    ).start()
+    history_buffer.start()
+    # The Gemini SDK is imported lazily; load it now, off the request path
+    threading.Thread(target=ai.warm_up, name='gemini-warm-up', daemon=True).start()
+
+
+def create_app():
+    """WSGI factory - registers every route and returns the Flask app"""
+    with boot.phase('routes'):
+        import endpoints  # noqa: F401
+
+    return app
+
+
+def shutdown():
+    """Let queued work finish and stop helper pools"""
+    from config import password_hasher
+    from endpoints import analysis_jobs, history_buffer
+
+    analysis_jobs.shutdown(wait=True)
+    password_hasher.shutdown()
+    # After the jobs, which may still be adding records
+    history_buffer.shutdown()
+
+
+# ==========================================
+# GUNICORN HOOKS
+# ==========================================
+
+def on_starting(server):
+    startup()
+
+
+def when_ready(server):
+    boot.ready()
+    # Move everything loaded so far out of the GC's reach, so collections in the
+    # workers don't write to (and un-share) the master's pages
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    import ai
+
+    # Connections opened by the master must not be shared with the children
+    with app.app_context():
+        db.engine.dispose(close=False)
+    replicas.dispose()
+    pool_metrics.reset_after_fork()
+    ai.analysis_cache.reset_after_fork()
+    rate_limiter.buckets.reset_after_fork()
+    boot.reset_after_fork()
+    start_background_tasks()
+
+
+def worker_exit(server, worker):
+    try:
+        shutdown()
+    except Exception as e:
+        logging.warning(f"Worker shutdown failed: {e}")
+
+
+def serve():
+    """Run the app under gunicorn with the settings of this module"""
+    from gunicorn.app.base import BaseApplication
+
+    settings = {
+        'bind': bind,
+        'workers': workers,
+        'threads': threads,
+        'worker_class': worker_class,
+        'preload_app': preload_app,
+        'timeout': timeout,
+        'graceful_timeout': graceful_timeout,
+        'keepalive': keepalive,
+        'max_requests': max_requests,
+        'max_requests_jitter': max_requests_jitter,
+        'on_starting': on_starting,
+        'when_ready': when_ready,
+        'post_fork': post_fork,
+        'worker_exit': worker_exit,
+    }
+
+    class MedicueServer(BaseApplication):
+        def load_config(self):
+            for key, value in settings.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return create_app()
+
+    MedicueServer().run()
+
+
+def serve_asgi():
+    """Run asgi.py under uvicorn: /api/analyze on the event loop, the other routes on threads"""
+    import uvicorn
+
+    startup()
+    host, _, port = bind.rpartition(':')
+    uvicorn.run(
+        'asgi:application',
+        host=host or '0.0.0.0',
+        port=int(port),
+        workers=workers,
+        lifespan='on',
+        timeout_keep_alive=keepalive,
+        timeout_graceful_shutdown=graceful_timeout,
+        log_level='warning',
+    )
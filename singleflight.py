@@ -0,0 +1,155 @@
+# ==========================================
+# SINGLE-FLIGHT REQUEST COALESCING
+# ==========================================
+
+import hashlib
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows - only the in-process backend is available
+    fcntl = None
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class ThreadBackend:
+    """Coalesces within one process only; the leader simply runs the call"""
+
+    def run(self, key, fn):
+        return fn()
+
+    def stats(self):
+        return {'backend': 'thread'}
+
+
+class FileLockBackend:
+    """Rendezvous across processes on one host through striped lock files.
+
+    The leader in each process takes an exclusive flock on its key's stripe before
+    calling upstream. Leaders in other processes block on the same lock, then check
+    the shared store (e.g. the SQLite cache tier) that the winner filled in. Keys are
+    hashed into a fixed number of stripes, so the lock directory never grows past
+    that many files; unrelated keys that share a stripe just take turns.
+    """
+
+    def __init__(self, lock_dir, lookup, timeout=30.0, poll_interval=0.05, stripes=256):
+        if fcntl is None:
+            raise RuntimeError("FileLockBackend requires fcntl (POSIX only)")
+        os.makedirs(lock_dir, exist_ok=True)
+        self.lock_dir = lock_dir
+        self.lookup = lookup
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.stripes = stripes
+        self._lock = threading.Lock()
+        self.collapsed_remote = 0
+        self.lock_timeouts = 0
+
+    def _lock_path(self, key):
+        # A stable digest, not hash(): every process has to pick the same stripe
+        digest = hashlib.sha1(key.encode('utf-8')).digest()
+        stripe = int.from_bytes(digest[:8], 'big') % self.stripes
+        return os.path.join(self.lock_dir, f"stripe-{stripe:04d}.lock")
+
+    def _acquire(self, fd):
+        deadline = time.monotonic() + self.timeout
+        while True:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return True
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    return False
+                time.sleep(self.poll_interval)
+
+    def run(self, key, fn):
+        fd = os.open(self._lock_path(key), os.O_CREAT | os.O_RDWR, 0o644)
+        try:
+            if not self._acquire(fd):
+                # Fail open - a stuck peer must not block this request forever
+                with self._lock:
+                    self.lock_timeouts += 1
+                return fn()
+            try:
+                shared = self.lookup(key)
+                if shared is not None:
+                    with self._lock:
+                        self.collapsed_remote += 1
+                    return shared
+                return fn()
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'backend': 'file',
+                'collapsed_remote': self.collapsed_remote,
+                'lock_timeouts': self.lock_timeouts,
+            }
+
+
+class SingleFlight:
+    """Concurrent callers with the same key share the first caller's result"""
+
+    def __init__(self, backend=None):
+        self.backend = backend or ThreadBackend()
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.collapsed = 0
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.collapsed += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self.backend.run(key, fn)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stats(self):
+        with self._lock:
+            stats = {
+                'in_flight': len(self._calls),
+                'leaders': self.leaders,
+                'collapsed': self.collapsed,
+            }
+        stats.update(self.backend.stats())
+        return stats
+
+
+def build_singleflight(backend, lock_dir, lookup, timeout, stripes=256):
+    """'thread' coalesces within the process, 'file' also across processes on the host"""
+    if backend == 'file':
+        return SingleFlight(FileLockBackend(lock_dir, lookup, timeout=timeout, stripes=stripes))
+    return SingleFlight()
@@ -0,0 +1,13 @@
+import os
+import sys
+import tempfile
+
+# The modules live at the top of the repository, not in a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Tests that import the app (config) get a throwaway SQLite database and no shared cache file
+_TMP = tempfile.mkdtemp(prefix='medicue-tests-')
+os.environ.setdefault('DB_URL', f"sqlite:///{_TMP}/medicue.db")
+os.environ.setdefault('JWT_SECRET_KEY', 'test-secret-key-' * 2)
+os.environ.setdefault('ANALYSIS_CACHE_DB', '')
+os.environ.setdefault('PASSWORD_HASH_WORKERS', '0')
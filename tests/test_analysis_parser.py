@@ -0,0 +1,74 @@
+import json
+
+import pytest
+
+from analysis_parser import (MAX_CONDITIONS, AnalysisStreamParser, StreamValidator, parse_analysis,
+                             validate_analysis)
+
+ANALYSIS = {
+    'is_emergency': 'false',
+    'possible_conditions': [
+        {'name': 'Common Cold', 'confidence': '70%'},
+        {'name': 'Flu {seasonal}', 'confidence': '20%'},
+    ],
+    'recommendations': 'Rest and fluids. Say "hi" to a doctor if it lasts.',
+}
+TEXT = json.dumps(ANALYSIS, indent=2)
+
+
+def feed_in(chunks):
+    parser = AnalysisStreamParser()
+    events = []
+    for chunk in chunks:
+        events.extend(parser.feed(chunk))
+    return parser, events
+
+
+@pytest.mark.parametrize('size', [1, 3, 7, 40, len(TEXT)])
+def test_split_chunks_give_the_same_events(size):
+    parser, events = feed_in(TEXT[i:i + size] for i in range(0, len(TEXT), size))
+    assert parser.close() == ANALYSIS
+    assert events == [
+        ('is_emergency', 'false'),
+        ('condition', ANALYSIS['possible_conditions'][0]),
+        ('condition', ANALYSIS['possible_conditions'][1]),
+        ('recommendations', ANALYSIS['recommendations']),
+    ]
+
+
+def test_fenced_output():
+    fenced = f"Here you go:\n```json\n{TEXT}\n```\nAnything else?"
+    parser, _ = feed_in(fenced[i:i + 5] for i in range(0, len(fenced), 5))
+    assert parser.close() == ANALYSIS
+    assert parse_analysis(fenced) == ANALYSIS
+
+
+def test_truncated_output_keeps_what_was_complete():
+    cut = TEXT[:TEXT.index('Flu')]
+    parser, events = feed_in([cut])
+    assert events == [('is_emergency', 'false'), ('condition', ANALYSIS['possible_conditions'][0])]
+    with pytest.raises(ValueError):
+        parser.close()
+    with pytest.raises(ValueError):
+        parse_analysis(cut)
+
+
+def test_validator_normalizes_streamed_events_like_the_final_result():
+    raw = {
+        'is_emergency': False,
+        'possible_conditions': [{'name': f' C{i} ', 'confidence': 0.7} for i in range(MAX_CONDITIONS + 2)],
+        'recommendations': ' Rest. ',
+        'extra': 'dropped',
+    }
+    _, events = feed_in([json.dumps(raw)])
+    streamed = list(StreamValidator()(events))
+    final = validate_analysis(raw)
+    assert streamed == ([('is_emergency', final['is_emergency'])]
+                        + [('condition', item) for item in final['possible_conditions']]
+                        + [('recommendations', final['recommendations'])])
+    assert final['possible_conditions'][0] == {'name': 'C0', 'confidence': '70%'}
+
+
+def test_validator_rejects_a_bad_condition():
+    with pytest.raises(ValueError):
+        list(StreamValidator()([('condition', {'name': 'Cold', 'confidence': 'very'})]))
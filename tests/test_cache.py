@@ -0,0 +1,41 @@
+import pytest
+
+from cache import DiskCache, normalize_symptoms
+
+ANALYSIS = {'conditions': [{'name': 'Influenza', 'confidence': 0.7}]}
+
+
+@pytest.mark.parametrize('a, b', [
+    ('Fever, Headache', 'headache and fever'),
+    ('fever + headache!', 'Headache; fever.'),
+    ('  sore   throat with cough ', 'cough, sore throat'),
+    ('fever 38.5. headache', 'headache, fever 38.5'),
+])
+def test_same_complaint_same_key(a, b):
+    assert normalize_symptoms(a) == normalize_symptoms(b)
+
+
+def test_decimal_reading_is_one_symptom():
+    assert normalize_symptoms('fever 38.5') == 'fever 38.5'
+    assert normalize_symptoms('fever 38.5, cough') == 'cough, fever 38.5'
+
+
+@pytest.mark.parametrize('a, b', [
+    ('fever 38.5', 'fever 39.5'),
+    ('fever 38.5', 'fever 38, 5'),
+    ('headache', 'severe headache'),
+])
+def test_different_complaint_different_key(a, b):
+    assert normalize_symptoms(a) != normalize_symptoms(b)
+
+
+def test_disk_cache_prunes_every_n_writes(tmp_path):
+    cache = DiskCache(str(tmp_path / 'cache.db'), max_entries=5, prune_every=10)
+    for i in range(9):
+        cache.set(f'k{i}', ANALYSIS)
+    assert cache.stats()['entries'] == 9
+    cache.set('k9', ANALYSIS)
+    assert cache.stats()['entries'] == 5
+    assert cache.evictions == 5
+    assert cache.get('k9') == ANALYSIS
+    assert cache.get('k0') is None
@@ -0,0 +1,32 @@
+import time
+
+import pytest
+
+from passwords import PasswordHasher, PasswordHasherBusy
+
+
+def test_timeout_raises_busy_and_keeps_the_slot_until_the_worker_is_done():
+    hasher = PasswordHasher(rounds=4, workers=1, max_pending=1, timeout=0.5)
+    try:
+        hasher._executor().submit(time.sleep, 0).result()  # spawn the worker outside the timeout
+        with pytest.raises(PasswordHasherBusy):
+            hasher._run(time.sleep, 1.5)
+        assert hasher.stats()['timed_out'] == 1
+        # The worker is still sleeping, so the only slot is still taken
+        with pytest.raises(PasswordHasherBusy):
+            hasher._run(time.sleep, 0)
+        assert hasher.stats()['rejected'] == 1
+        time.sleep(1.2)
+        assert hasher._run(time.sleep, 0) is None
+    finally:
+        hasher.shutdown()
+
+
+def test_hash_and_check_round_trip():
+    hasher = PasswordHasher(rounds=4, workers=1, timeout=30)
+    try:
+        pw_hash = hasher.hash('s3cret')
+        assert hasher.check(pw_hash, 's3cret')
+        assert not hasher.check(pw_hash, 'wrong')
+    finally:
+        hasher.shutdown()
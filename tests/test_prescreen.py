@@ -0,0 +1,53 @@
+import pytest
+
+from prescreen import EmergencyPrescreen
+
+
+@pytest.fixture(scope='module')
+def prescreen():
+    return EmergencyPrescreen()
+
+
+@pytest.mark.parametrize('text, flags', [
+    ("I have chest pain", ['chest_pain']),
+    ("I can't breathe", ['breathing']),
+    ("I passed out this morning", ['consciousness']),
+    ("I think I'm having a heart attack", ['chest_pain']),
+])
+def test_red_flags_found(prescreen, text, flags):
+    assert prescreen.scan(text) == flags
+
+
+@pytest.mark.parametrize('text', [
+    "no chest pain",
+    "denies shortness of breath",
+    "without any chest pain",
+])
+def test_negated_term_ignored(prescreen, text):
+    assert prescreen.scan(text) == []
+
+
+@pytest.mark.parametrize('text', [
+    "I have no fever and chest pain",
+    "no appetite and crushing chest pain",
+    "never had chest pain this bad before",
+    "not feeling well chest pain since morning",
+    "no fever, but chest pain",
+    "no cough or shortness of breath",
+])
+def test_negation_covers_only_the_next_term(prescreen, text):
+    assert prescreen.scan(text) != []
+
+
+@pytest.mark.parametrize('text', [
+    "my father died of a heart attack, I have a cold",
+    "my grandma passed away from a stroke",
+    "history of seizures, mild cough today",
+    "I had a stroke 5 years ago",
+])
+def test_family_and_past_mentions_ignored(prescreen, text):
+    assert prescreen.scan(text) == []
+
+
+def test_current_symptom_next_to_family_history(prescreen):
+    assert prescreen.scan("chest pain and my dad had a heart attack") == ['chest_pain']
@@ -0,0 +1,64 @@
+from ratelimit import MemoryBuckets, RateLimiter
+
+
+def limiter(**settings):
+    # Refill so slow it doesn't matter during a test
+    settings.setdefault('user_per_minute', 0.001)
+    return RateLimiter(MemoryBuckets(), **settings)
+
+
+def test_batch_is_charged_its_full_cost():
+    rl = limiter(user_burst=10)
+    assert rl.check('1', cost=6).allowed
+    refused = rl.check('1', cost=6)
+    assert not refused.allowed
+    assert refused.scope == 'user'
+    assert rl.check('1', cost=4).allowed
+
+
+def test_cost_over_the_burst_is_too_large():
+    rl = limiter(user_burst=10)
+    assert not rl.too_large(10)
+    assert rl.too_large(11)
+    assert rl.stats()['limited']['too_large'] == 1
+
+
+def test_global_burst_bounds_the_cost():
+    rl = limiter(user_burst=50, global_burst=20, global_per_minute=0.001)
+    assert rl.max_cost == 20
+    assert rl.too_large(21)
+
+
+def test_global_refusal_returns_the_user_tokens():
+    rl = limiter(user_burst=10, global_burst=10, global_per_minute=0.001)
+    assert rl.check('1', cost=8).allowed
+    refused = rl.check('2', cost=5)
+    assert not refused.allowed
+    assert refused.scope == 'global'
+    # User 2 was charged nothing
+    allowed, remaining = rl.buckets.take('user:2', 10, 0.0, 0)
+    assert remaining == 10
+
+
+def test_users_have_separate_buckets():
+    rl = limiter(user_burst=2)
+    assert rl.check('1', cost=2).allowed
+    assert not rl.check('1').allowed
+    assert rl.check('2').allowed
+
+
+def test_zero_rate_turns_the_user_bucket_off():
+    rl = limiter(user_per_minute=0)
+    assert rl.max_cost is None
+    assert not rl.too_large(10 ** 6)
+    assert rl.check('1') is None
+
+
+def test_zero_user_rate_leaves_the_global_bucket():
+    rl = limiter(user_per_minute=0, global_burst=2, global_per_minute=0.001)
+    assert rl.max_cost == 2
+    decision = rl.check('1', cost=2)
+    assert decision.allowed and decision.scope == 'global'
+    refused = rl.check('1')
+    assert not refused.allowed
+    assert refused.headers()['Retry-After']
@@ -0,0 +1,123 @@
+import threading
+import time
+
+import pytest
+
+from fake_gemini import FakeGeminiServer
+from resilience import CircuitBreaker, CircuitOpen, DeadlineExceeded, ResilientModels
+
+genai = pytest.importorskip('google.genai')
+
+
+@pytest.fixture
+def server():
+    server = FakeGeminiServer(latency_ms=20).start()
+    yield server
+    server.stop()
+
+
+def resilient(server, **settings):
+    client = genai.Client(api_key='test', http_options={'base_url': server.url, 'timeout': 3000})
+    settings.setdefault('timeout', 1.0)
+    settings.setdefault('deadline', 5.0)
+    settings.setdefault('backoff_base', 0.01)
+    return ResilientModels(lambda: client.models, **settings)
+
+
+def test_retryable_errors_are_retried_then_raised(server):
+    server.error_rate = 1.0
+    models = resilient(server, max_attempts=3)
+    with pytest.raises(Exception) as raised:
+        models.generate_content(model='primary', contents='cough')
+    assert raised.value.code == 503
+    assert server.calls['primary'] == 3
+    assert models.retries == 2
+
+    server.error_rate = 0.0
+    assert 'is_emergency' in models.generate_content(model='primary', contents='cough').text
+
+
+def test_breaker_opens_and_fails_fast(server):
+    server.error_rate = 1.0
+    models = resilient(server, max_attempts=3, breaker=CircuitBreaker(window=4, min_calls=4, cooldown=60))
+    with pytest.raises(Exception):
+        models.generate_content(model='primary', contents='cough')
+    # The fourth failure opens the breaker; the attempt after it is never sent
+    with pytest.raises(CircuitOpen):
+        models.generate_content(model='primary', contents='cough')
+    with pytest.raises(CircuitOpen):
+        models.generate_content(model='primary', contents='cough')
+    assert server.calls['primary'] == 4
+    assert models.breaker.state == 'open'
+
+
+def test_slow_primary_is_hedged(server):
+    server.model_latency_ms = {'slow': 2000, 'fast': 20}
+    models = resilient(server, timeout=3.0, hedge_model='fast', hedge_min_delay=0.05)
+    for _ in range(20):
+        models.latency.add(0.05)
+    started = time.monotonic()
+    response = models.generate_content(model='slow', contents='cough')
+    assert 'is_emergency' in response.text
+    assert time.monotonic() - started < 1.0
+    assert (models.hedges, models.hedge_wins) == (1, 1)
+
+
+def test_stream_deadline_covers_the_whole_stream(server):
+    server.latency_ms = 4800  # a chunk every ~0.8s, each within the attempt timeout
+    models = resilient(server, timeout=0.9, deadline=1.0)
+    started = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        for _ in models.generate_content_stream(model='primary', contents='cough'):
+            pass
+    assert time.monotonic() - started < 1.4
+
+
+def test_stream_stall_counts_against_the_breaker(server):
+    server.stream_stall_ms = 2000
+    models = resilient(server, timeout=0.3, breaker=CircuitBreaker(window=2, min_calls=2, cooldown=60))
+    stream = models.generate_content_stream(model='primary', contents='cough')
+    assert next(stream).text
+    with pytest.raises(DeadlineExceeded):
+        next(stream)
+    assert models.breaker.state == 'open'
+    with pytest.raises(CircuitOpen):
+        next(models.generate_content_stream(model='primary', contents='cough'))
+
+
+class StallingModels:
+    """SDK stand-in whose stream hangs after the first chunk until released"""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.closed = threading.Event()
+
+    def generate_content_stream(self, model, contents, **kwargs):
+        try:
+            yield 'first'
+            self.release.wait(5)
+            yield 'late'
+        finally:
+            self.closed.set()
+
+
+def test_stalled_stream_is_closed_once_the_read_returns():
+    fake = StallingModels()
+    models = ResilientModels(lambda: fake, timeout=0.2, deadline=5.0)
+    stream = models.generate_content_stream(model='primary', contents='cough')
+    assert next(stream) == 'first'
+    with pytest.raises(DeadlineExceeded):
+        next(stream)
+    assert not fake.closed.is_set()
+    fake.release.set()
+    assert fake.closed.wait(2)
+
+
+def test_stream_closed_when_the_caller_stops_early():
+    fake = StallingModels()
+    fake.release.set()
+    models = ResilientModels(lambda: fake, timeout=1.0, deadline=5.0)
+    stream = models.generate_content_stream(model='primary', contents='cough')
+    assert next(stream) == 'first'
+    stream.close()
+    assert fake.closed.wait(2)
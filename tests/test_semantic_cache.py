@@ -0,0 +1,21 @@
+from semantic_cache import SemanticCache, shingles
+
+ANALYSIS = {'conditions': [{'name': 'Migraine', 'confidence': 0.6}]}
+
+
+def test_severity_words_are_part_of_the_key():
+    assert shingles('severe headache') != shingles('mild headache')
+    assert shingles('very bad cough') != shingles('cough')
+
+
+def test_severity_change_is_not_a_near_duplicate():
+    cache = SemanticCache()
+    cache.add('mild headache and fever', ANALYSIS)
+    assert cache.lookup('mild headache and fever') == ANALYSIS
+    assert cache.lookup('severe headache and fever') is None
+
+
+def test_rephrased_complaint_is_a_near_duplicate():
+    cache = SemanticCache()
+    cache.add('I have a headache and a fever', ANALYSIS)
+    assert cache.lookup('headache, fever') == ANALYSIS
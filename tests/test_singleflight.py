@@ -0,0 +1,82 @@
+import multiprocessing
+import os
+import threading
+import time
+
+import pytest
+
+from singleflight import FileLockBackend, SingleFlight, fcntl
+
+
+def test_concurrent_callers_share_one_call():
+    flight = SingleFlight()
+    calls = []
+    started = threading.Event()
+
+    def slow():
+        calls.append(1)
+        started.set()
+        time.sleep(0.2)
+        return 'result'
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flight.do('k', slow)))
+    leader.start()
+    started.wait(2)
+    followers = [threading.Thread(target=lambda: results.append(flight.do('k', slow))) for _ in range(3)]
+    for thread in followers:
+        thread.start()
+    for thread in [leader] + followers:
+        thread.join(5)
+    assert results == ['result'] * 4
+    assert len(calls) == 1
+    assert (flight.leaders, flight.collapsed) == (1, 3)
+
+
+def _worker(lock_dir, store_dir, start, queue):
+    """One worker process: a single-flight call for the same key through the shared lock directory"""
+    path = os.path.join(store_dir, 'answer')
+
+    def lookup(key):
+        if os.path.exists(path):
+            with open(path) as f:
+                return f.read()
+        return None
+
+    def upstream():
+        with open(os.path.join(store_dir, f'call-{os.getpid()}'), 'w'):
+            pass
+        time.sleep(0.5)
+        with open(path, 'w') as f:
+            f.write('answer')
+        return 'answer'
+
+    backend = FileLockBackend(lock_dir, lookup, timeout=10)
+    start.wait(10)
+    result = SingleFlight(backend).do('fever, cough', upstream)
+    queue.put((result, backend.collapsed_remote, backend.lock_timeouts))
+
+
+@pytest.mark.skipif(fcntl is None, reason="file locks need fcntl")
+def test_processes_sharing_a_lock_dir_make_one_call(tmp_path):
+    lock_dir, store_dir = str(tmp_path / 'locks'), str(tmp_path / 'store')
+    os.makedirs(store_dir)
+    context = multiprocessing.get_context('fork')
+    start, queue = context.Event(), context.Queue()
+    workers = [context.Process(target=_worker, args=(lock_dir, store_dir, start, queue)) for _ in range(2)]
+    for worker in workers:
+        worker.start()
+    start.set()
+    outcomes = sorted(queue.get(timeout=15) for _ in workers)
+    for worker in workers:
+        worker.join(5)
+    assert len([name for name in os.listdir(store_dir) if name.startswith('call-')]) == 1
+    # One worker called upstream, the other found its answer once the lock was free
+    assert outcomes == [('answer', 0, 0), ('answer', 1, 0)]
+
+
+def test_lock_files_are_striped(tmp_path):
+    backend = FileLockBackend(str(tmp_path), lambda key: None, stripes=4)
+    for i in range(50):
+        assert backend.run(f'key {i}', lambda: i) == i
+    assert len(os.listdir(tmp_path)) <= 4
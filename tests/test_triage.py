@@ -0,0 +1,112 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import text
+
+from triage import DEFAULT_RECOMMENDATION, TriageEngine
+
+CATALOG = [
+    ('symptom', 'upsert', 1, ('fever', False)),
+    ('symptom', 'upsert', 2, ('cough', False)),
+    ('symptom', 'upsert', 3, ('rash', False)),
+    ('symptom', 'upsert', 4, ('chest pain', True)),
+    ('condition', 'upsert', 10, 'Common Cold'),
+    ('condition', 'upsert', 11, 'Measles'),
+    ('condition', 'upsert', 12, 'Heart Attack'),
+    ('link', 'upsert', (1, 10), 1.0),
+    ('link', 'upsert', (2, 10), 1.0),
+    ('link', 'upsert', (1, 11), 1.0),
+    ('link', 'upsert', (3, 11), 1.0),
+    ('link', 'upsert', (4, 12), 1.0),
+    ('recommendation', 'upsert', 100, (10, 'Rest and fluids', False)),
+    ('recommendation', 'upsert', 101, (12, 'Call emergency services now.', True)),
+]
+
+
+@pytest.fixture
+def engine():
+    engine = TriageEngine()
+    engine.apply(CATALOG)
+    return engine
+
+
+def test_best_covering_condition_ranks_first(engine):
+    result, score = engine.triage('Fever and a cough')
+    assert score == pytest.approx(1.0)
+    assert result['possible_conditions'] == [
+        {'name': 'Common Cold', 'confidence': '100%'},
+        {'name': 'Measles', 'confidence': '50%'},
+    ]
+    assert result['is_emergency'] == 'false'
+    assert result['recommendations'] == 'Rest and fluids.'
+    assert result['source'] == 'local_triage'
+
+
+def test_high_severity_symptom_is_an_emergency(engine):
+    result, _ = engine.triage('sudden chest pain')
+    assert result['is_emergency'] == 'true'
+    assert result['possible_conditions'][0]['name'] == 'Heart Attack'
+
+
+def test_unknown_symptoms_have_no_answer(engine):
+    assert engine.triage('itchy ears') == (None, 0.0)
+
+
+def test_row_changes_apply_without_a_reload(engine):
+    engine.triage('rash')
+    engine.apply([('link', 'delete', (3, 11), None), ('recommendation', 'upsert', 102, (11, 'Isolate', False))])
+    assert engine.triage('rash') == (None, 0.0)
+    result, _ = engine.triage('fever')
+    assert result['recommendations'] != DEFAULT_RECOMMENDATION
+
+
+@pytest.fixture
+def app_db():
+    from config import app, db
+    from db import seed_sample_data
+
+    with app.app_context():
+        db.create_all()
+    seed_sample_data()
+    return app, db
+
+
+def test_changes_made_by_another_process_are_picked_up(app_db):
+    app, db = app_db
+    engine = TriageEngine(refresh_interval=0.05)
+    assert engine.ensure_loaded(app, db)
+    symptoms = engine.stats()['symptoms']
+    engine.triage('fever')
+
+    # Another worker adds a symptom - nothing in this process sees the commit
+    with app.app_context(), db.engine.begin() as conn:
+        conn.execute(text("INSERT INTO symptom (name, severity_rating) VALUES ('Fainting', 'High')"))
+    assert engine.ensure_loaded(app, db)
+    assert engine.stats()['symptoms'] == symptoms  # not due yet
+    time.sleep(0.06)
+    assert engine.ensure_loaded(app, db)
+    assert engine.stats()['symptoms'] == symptoms + 1
+    assert engine.triage('fainting')[0]['is_emergency'] == 'true'
+
+    # An unchanged catalog is not rebuilt
+    stats = engine.stats()
+    time.sleep(0.06)
+    engine.ensure_loaded(app, db)
+    engine.triage('fever')
+    assert engine.stats()['rebuilds'] == stats['rebuilds']
+    assert engine.stats()['refreshes'] == 1
+
+
+class FailingModels:
+    def generate_content(self, **kwargs):
+        raise ValueError('model unavailable')
+
+
+def test_analysis_falls_back_to_the_catalog_when_gemini_fails(app_db, monkeypatch):
+    import ai
+
+    monkeypatch.setattr(ai, 'client', SimpleNamespace(models=FailingModels()))
+    result = ai.get_medical_analysis('fever and cough since yesterday')
+    assert result['source'] == 'local_triage'
+    assert result['possible_conditions']
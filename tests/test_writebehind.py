@@ -0,0 +1,125 @@
+import threading
+
+from writebehind import WriteBehindBuffer
+
+
+class Store:
+    """flush_fn that keeps the rows it wrote and fails on demand"""
+
+    def __init__(self, fail_times=0, poison=()):
+        self.rows = []
+        self.calls = 0
+        self.fail_times = fail_times
+        self.poison = set(poison)
+        self.lock = threading.Lock()
+
+    def __call__(self, batch):
+        with self.lock:
+            self.calls += 1
+            if self.calls <= self.fail_times:
+                raise RuntimeError('database down')
+            if self.poison.intersection(batch):
+                raise ValueError('bad row')
+            self.rows.extend(batch)
+
+
+def buffer_for(store, **settings):
+    settings.setdefault('flush_interval', 0.01)
+    settings.setdefault('retry_max', 0.01)
+    buffer = WriteBehindBuffer(store, **settings)
+    buffer.start()
+    return buffer
+
+
+def test_records_written_in_batches():
+    store = Store()
+    buffer = buffer_for(store, flush_size=10, flush_interval=60)
+    for i in range(30):
+        assert buffer.add(i)
+    assert buffer.flush(timeout=5)
+    assert store.rows == list(range(30))
+    assert buffer.stats()['batches'] == 3
+    buffer.shutdown(timeout=5)
+
+
+def test_failed_batch_is_retried_in_order():
+    store = Store(fail_times=3)
+    buffer = buffer_for(store)
+    for i in range(5):
+        buffer.add(i)
+    assert buffer.flush(timeout=5)
+    assert store.rows == list(range(5))
+    stats = buffer.stats()
+    assert stats['failed_flushes'] == 3
+    assert stats['dead_lettered'] == 0
+    buffer.shutdown(timeout=5)
+
+
+def test_poison_record_is_dead_lettered():
+    store = Store(poison={3})
+    dead = []
+    buffer = buffer_for(store, row_errors=(ValueError,), dead_letter_fn=lambda records, errors: dead.extend(records))
+    for i in range(8):
+        buffer.add(i)
+    assert buffer.flush(timeout=5)
+    assert dead == [3]
+    assert sorted(store.rows) == [0, 1, 2, 4, 5, 6, 7]
+    # Later records aren't held up
+    buffer.add(8)
+    assert buffer.flush(timeout=5)
+    assert store.rows[-1] == 8
+    assert buffer.stats()['dead_lettered'] == 1
+    buffer.shutdown(timeout=5)
+
+
+def test_long_outage_is_retried_not_dead_lettered():
+    store = Store(fail_times=40)
+    dead = []
+    buffer = buffer_for(store, row_errors=(ValueError,), dead_letter_fn=lambda records, errors: dead.extend(records))
+    for i in range(20):
+        buffer.add(i)
+    assert buffer.flush(timeout=10)
+    assert store.rows == list(range(20))
+    assert dead == []
+    assert buffer.stats()['failed_flushes'] == 40
+    buffer.shutdown(timeout=5)
+
+
+def test_outage_while_splitting_sends_the_rest_back():
+    store = Store(poison={1})
+    calls = []
+
+    def flush(batch):
+        calls.append(list(batch))
+        if len(calls) == 2:
+            raise RuntimeError('database down')  # the first half, while splitting
+        store(batch)
+
+    dead = []
+    buffer = buffer_for(flush, flush_interval=60, row_errors=(ValueError,),
+                        dead_letter_fn=lambda records, errors: dead.extend(records))
+    for i in range(4):
+        buffer.add(i)
+    assert buffer.flush(timeout=5)
+    assert calls[1] == [0, 1]
+    assert dead == [1]
+    assert sorted(store.rows) == [0, 2, 3]
+    assert buffer.stats()['failed_flushes'] == 1
+    buffer.shutdown(timeout=5)
+
+
+def test_full_buffer_drops_without_blocking():
+    store = Store(fail_times=10 ** 6)
+    buffer = WriteBehindBuffer(store, max_pending=3)  # flusher not started
+    assert [buffer.add(i) for i in range(5)] == [True, True, True, False, False]
+    assert buffer.stats()['dropped'] == 2
+
+
+def test_shutdown_writes_what_is_left_and_refuses_more():
+    store = Store()
+    buffer = WriteBehindBuffer(store, flush_interval=60)
+    for i in range(4):
+        buffer.add(i)
+    buffer.shutdown(timeout=5)  # never started - drains anyway
+    assert store.rows == [0, 1, 2, 3]
+    assert not buffer.add(4)
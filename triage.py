@@ -0,0 +1,266 @@
+# ==========================================
+# LOCAL TRIAGE ENGINE
+# ==========================================
+# In-memory index over the symptom/condition catalog. Answers without any
+# model call, so it serves as a fast path and as the fallback when Gemini
+# is unavailable.
+
+import logging
+import re
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from cache import normalize_symptoms
+from models import Condition, Recommendation, Symptom, SymptomConditionMap
+from semantic_cache import fold_synonyms
+
+DEFAULT_RECOMMENDATION = "Consult a healthcare professional for a proper diagnosis."
+
+
+class _TriageIndex:
+    """Immutable snapshot of the catalog; swapped whole so readers never take a lock"""
+
+    def __init__(self, symptoms, conditions, links, recommendations):
+        import numpy as np  # deferred: only needed once the catalog loads, and slow to import
+
+        symptom_ids = sorted(symptoms)
+        condition_ids = sorted(conditions)
+        column = {sid: i for i, sid in enumerate(symptom_ids)}
+        row = {cid: j for j, cid in enumerate(condition_ids)}
+
+        # Dense condition x symptom weight matrix; the catalog is small enough
+        self.weights = np.zeros((len(condition_ids), len(symptom_ids)), dtype=np.float32)
+        for (sid, cid), weight in links.items():
+            if sid in column and cid in row:
+                self.weights[row[cid], column[sid]] = weight
+        self.totals = self.weights.sum(axis=1)
+        # Inverted index: symptom column -> rows of the conditions it points at
+        self.postings = [np.flatnonzero(self.weights[:, i]) for i in range(len(symptom_ids))]
+
+        self.symptom_high = np.array([symptoms[sid][1] for sid in symptom_ids], dtype=bool)
+        self.condition_names = [conditions[cid] for cid in condition_ids]
+        self.condition_advice = [[] for _ in condition_ids]
+        self.condition_emergency = np.zeros(len(condition_ids), dtype=bool)
+        for cid, text, is_emergency in recommendations.values():
+            if cid in row:
+                self.condition_advice[row[cid]].append(text)
+                self.condition_emergency[row[cid]] |= bool(is_emergency)
+
+        self.columns = {symptoms[sid][0]: column[sid] for sid in symptom_ids}
+        names = sorted(self.columns, key=len, reverse=True)
+        self.matcher = re.compile(r"\b(" + "|".join(map(re.escape, names)) + r")\b") if names else None
+
+    def match(self, symptoms_text):
+        """Catalog columns of the symptoms mentioned in the text"""
+        if self.matcher is None:
+            return []
+        text = fold_synonyms(normalize_symptoms(symptoms_text))
+        return sorted({self.columns[m] for m in self.matcher.findall(text)})
+
+
+class TriageEngine:
+    """Scores catalog conditions against free-text symptoms.
+
+    Catalog rows are mirrored in plain dicts; changes committed in this process
+    are applied row by row (see watch_catalog) and the numeric index is rebuilt
+    from memory on the next query, without going back to the database. Changes
+    made elsewhere (another worker, a migration) are picked up by reloading the
+    catalog every refresh_interval seconds; the index is only rebuilt when the
+    reload finds a difference.
+    """
+
+    def __init__(self, max_conditions=5, retry_interval=30.0, refresh_interval=60.0):
+        self.max_conditions = max_conditions
+        self.retry_interval = retry_interval
+        self.refresh_interval = refresh_interval  # 0 = load once, then only this process's changes
+        self._lock = threading.Lock()
+        self._loading = threading.Lock()
+        self._symptoms = {}  # symptom_id -> (lowercase name, is_high_severity)
+        self._conditions = {}  # condition_id -> name
+        self._links = {}  # (symptom_id, condition_id) -> weight
+        self._recommendations = {}  # rec_id -> (condition_id, guidance_text, is_emergency_alert)
+        self._index = None
+        self._last_attempt = 0.0
+        self._loaded_at = 0.0
+        self.loaded = False
+        self.rebuilds = 0
+        self.changes_applied = 0
+        self.refreshes = 0
+
+    def load(self, session):
+        """Full load of the catalog; True when it differs from what was loaded before"""
+        applied = self.changes_applied
+        symptoms = {s.symptom_id: (s.name.lower(), s.severity_rating == 'High')
+                    for s in session.query(Symptom).all()}
+        conditions = {c.condition_id: c.name for c in session.query(Condition).all()}
+        links = {(m.symptom_id, m.condition_id): m.weight for m in session.query(SymptomConditionMap).all()}
+        recommendations = {r.rec_id: (r.condition_id, r.guidance_text, r.is_emergency_alert)
+                           for r in session.query(Recommendation).all()}
+        with self._lock:
+            self._loaded_at = time.monotonic()
+            if self.loaded and self.changes_applied != applied:
+                # A change committed here while reading may be missing from the rows; the next refresh has it
+                return False
+            catalog = (symptoms, conditions, links, recommendations)
+            changed = catalog != (self._symptoms, self._conditions, self._links, self._recommendations)
+            if changed:
+                self._symptoms, self._conditions, self._links, self._recommendations = catalog
+                self._index = None
+            self.loaded = True
+        return changed
+
+    def ensure_loaded(self, app, db):
+        """Lazy first load, then a reload every refresh_interval seconds.
+
+        A failed first load is retried at most every retry_interval seconds; a failed refresh
+        keeps the catalog already loaded. One thread loads, the others carry on meanwhile.
+        """
+        now = time.monotonic()
+        if self.loaded:
+            if not self.refresh_interval or now - self._loaded_at < self.refresh_interval:
+                return True
+        elif now - self._last_attempt < self.retry_interval:
+            return False
+        if not self._loading.acquire(blocking=False):
+            return self.loaded
+        try:
+            self._last_attempt = now
+            refresh = self.loaded
+            with app.app_context():
+                changed = self.load(db.session)
+            if refresh and changed:
+                self.refreshes += 1
+                logging.info("Triage catalog changed elsewhere, reloaded")
+        except Exception as e:
+            logging.warning(f"Triage catalog load failed: {e}")
+            self._loaded_at = now
+        finally:
+            self._loading.release()
+        return self.loaded
+
+    def apply(self, changes):
+        """Apply (table, op, key, value) row changes captured by watch_catalog"""
+        tables = {
+            'symptom': self._symptoms,
+            'condition': self._conditions,
+            'link': self._links,
+            'recommendation': self._recommendations,
+        }
+        with self._lock:
+            for table, op, key, value in changes:
+                if op == 'delete':
+                    tables[table].pop(key, None)
+                else:
+                    tables[table][key] = value
+            self._index = None
+            self.changes_applied += len(changes)
+
+    def _snapshot(self):
+        index = self._index
+        if index is None:
+            with self._lock:
+                if self._index is None:
+                    self._index = _TriageIndex(self._symptoms, self._conditions, self._links, self._recommendations)
+                    self.rebuilds += 1
+                index = self._index
+        return index
+
+    def triage(self, symptoms_text):
+        """(analysis, top score 0-1) in the same shape as the Gemini result, or (None, 0.0)"""
+        index = self._snapshot()
+        columns = index.match(symptoms_text)
+        if not columns:
+            return None, 0.0
+
+        import numpy as np
+
+        candidates = np.unique(np.concatenate([index.postings[c] for c in columns]))
+        is_emergency = bool(index.symptom_high[columns].any())
+        if candidates.size == 0:
+            if not is_emergency:
+                return None, 0.0
+            return self._result(index, [], [], True), 0.0
+
+        matched = index.weights[np.ix_(candidates, columns)]
+        # How much of the condition's profile is present x how much of the complaint it explains
+        coverage = matched.sum(axis=1) / index.totals[candidates]
+        explained = (matched > 0).sum(axis=1) / len(columns)
+        scores = np.sqrt(coverage * explained)
+
+        order = np.argsort(-scores, kind='stable')[:self.max_conditions]
+        rows = candidates[order]
+        top_scores = scores[order]
+        is_emergency = is_emergency or bool(index.condition_emergency[rows[0]])
+        return self._result(index, rows, top_scores, is_emergency), float(top_scores[0])
+
+    def _result(self, index, rows, scores, is_emergency):
+        advice = []
+        for row in rows[:2]:
+            advice.extend(index.condition_advice[row])
+        return {
+            'is_emergency': 'true' if is_emergency else 'false',
+            'possible_conditions': [
+                {'name': index.condition_names[row], 'confidence': f"{round(float(score) * 100)}%"}
+                for row, score in zip(rows, scores)
+            ],
+            'recommendations': " ".join(a if a.endswith('.') else a + '.' for a in advice) or DEFAULT_RECOMMENDATION,
+            'source': 'local_triage',
+        }
+
+    def stats(self):
+        with self._lock:
+            return {
+                'loaded': self.loaded,
+                'symptoms': len(self._symptoms),
+                'conditions': len(self._conditions),
+                'links': len(self._links),
+                'rebuilds': self.rebuilds,
+                'changes_applied': self.changes_applied,
+                'refreshes': self.refreshes,
+            }
+
+
+# ==========================================
+# INCREMENTAL CATALOG SYNC
+# ==========================================
+
+def _row_change(obj, op):
+    if isinstance(obj, Symptom):
+        return 'symptom', op, obj.symptom_id, (obj.name.lower(), obj.severity_rating == 'High')
+    if isinstance(obj, Condition):
+        return 'condition', op, obj.condition_id, obj.name
+    if isinstance(obj, SymptomConditionMap):
+        return 'link', op, (obj.symptom_id, obj.condition_id), obj.weight
+    if isinstance(obj, Recommendation):
+        return 'recommendation', op, obj.rec_id, (obj.condition_id, obj.guidance_text, obj.is_emergency_alert)
+    return None
+
+
+def watch_catalog(engine):
+    """Mirror committed catalog row changes into the engine.
+
+    Changes are captured at flush time (when primary keys are known) and only
+    applied once the transaction commits; a rollback discards them.
+    """
+
+    @event.listens_for(Session, 'after_flush')
+    def _capture(session, flush_context):
+        pending = session.info.setdefault('triage_changes', [])
+        for objects, op in ((session.new, 'upsert'), (session.dirty, 'upsert'), (session.deleted, 'delete')):
+            for obj in objects:
+                change = _row_change(obj, op)
+                if change is not None:
+                    pending.append(change)
+
+    @event.listens_for(Session, 'after_commit')
+    def _apply(session):
+        changes = session.info.pop('triage_changes', None)
+        if changes and engine.loaded:
+            engine.apply(changes)
+
+    @event.listens_for(Session, 'after_soft_rollback')
+    def _discard(session, previous_transaction):
+        session.info.pop('triage_changes', None)
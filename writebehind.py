@@ -0,0 +1,233 @@
+# ==========================================
+# WRITE-BEHIND BUFFER
+# ==========================================
+# Requests hand records to an in-memory queue and return; one background
+# thread writes them in batches. Used for analysis history, so an analysis
+# response never waits on the database.
+
+import atexit
+import logging
+import threading
+import time
+from collections import deque
+
+
+class WriteBehindBuffer:
+    """Bounded queue drained in batches by a background thread.
+
+    add() never blocks: it returns False (counted as dropped) once max_pending records are
+    waiting or being written. A batch is written when flush_size records are waiting or the
+    oldest has waited flush_interval seconds. A batch that fails goes back to the front of the
+    queue and is retried with backoff for as long as it takes, so records are written at least
+    once - flush_fn must cope with a batch it already wrote (e.g. through a unique key). While
+    the store is down the queue fills up and add() starts dropping.
+
+    A batch failing with one of row_errors (a constraint or a value the store refuses) is split
+    in halves until the records that fail on their own are found; those go to
+    dead_letter_fn(records, errors) (logged when there is none) so one bad record can't hold up
+    every write behind it. Any other error while splitting sends the rest back to be retried.
+    """
+
+    def __init__(self, flush_fn, flush_size=200, flush_interval=1.0, max_pending=10000, retry_max=30.0,
+                 row_errors=(), dead_letter_fn=None, shutdown_timeout=10.0, name='write-behind'):
+        self.flush_fn = flush_fn
+        self.row_errors = tuple(row_errors)
+        self.dead_letter_fn = dead_letter_fn
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.retry_max = retry_max
+        self.shutdown_timeout = shutdown_timeout
+        self.name = name
+        self._pending = deque()
+        self._in_flight = 0
+        self._oldest_at = None  # when the oldest waiting record was added
+        self._retry_at = 0.0
+        self._failures_in_row = 0
+        self._stopping = False
+        self._thread = None
+        self._cond = threading.Condition()
+        self.accepted = 0
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+        self.failed_flushes = 0
+        self.dead_lettered = 0
+        self.flush_time_total = 0.0
+
+    @property
+    def pending(self):
+        return len(self._pending) + self._in_flight
+
+    def start(self):
+        """Start the flusher thread (per process - threads don't survive fork)"""
+        with self._cond:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+        atexit.register(self.shutdown)
+
+    def add(self, record):
+        with self._cond:
+            if self._stopping or len(self._pending) + self._in_flight >= self.max_pending:
+                self.dropped += 1
+                return False
+            first = not self._pending
+            if first:
+                self._oldest_at = time.monotonic()
+            self._pending.append(record)
+            self.accepted += 1
+            # Wake the flusher to start the interval, or because a batch is full
+            if first or len(self._pending) == self.flush_size:
+                self._cond.notify()
+        return True
+
+    def _wait_seconds(self, now):
+        """Until the next batch is due, or None when there's nothing to write"""
+        if not self._pending:
+            return None
+        if self._retry_at > now:
+            return self._retry_at - now
+        if len(self._pending) >= self.flush_size or self._stopping:
+            return 0.0
+        return max(0.0, self._oldest_at + self.flush_interval - now)
+
+    def _next_batch(self):
+        with self._cond:
+            while True:
+                wait = self._wait_seconds(time.monotonic())
+                if wait == 0.0:
+                    break
+                if wait is None and self._stopping:
+                    return None
+                self._cond.wait(wait)
+            batch = [self._pending.popleft() for _ in range(min(self.flush_size, len(self._pending)))]
+            self._in_flight = len(batch)
+            self._oldest_at = time.monotonic() if self._pending else None
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            started = time.perf_counter()
+            try:
+                self.flush_fn(batch)
+                written, failed, retry, retry_error = len(batch), [], [], None
+            except self.row_errors as e:
+                # Something in the batch itself: write around the records that fail on their own
+                written, failed, retry, retry_error = self._write_split(batch, e)
+            except Exception as e:
+                self._retry_later(batch, e)
+                continue
+            with self._cond:
+                self._in_flight = len(retry)
+                if not retry:
+                    self._failures_in_row = 0
+                    self._retry_at = 0.0
+                self.written += written
+                self.dead_lettered += len(failed)
+                self.batches += 1
+                self.flush_time_total += time.perf_counter() - started
+            if failed:
+                self._dead_letter(failed)
+            if retry:
+                self._retry_later(retry, retry_error)
+
+    def _retry_later(self, batch, error):
+        with self._cond:
+            # Back to the front, in order, and try again later
+            self._pending.extendleft(reversed(batch))
+            self._in_flight = 0
+            # Due as soon as the backoff is over, not another flush_interval later
+            self._oldest_at = time.monotonic() - self.flush_interval
+            self._failures_in_row += 1
+            self.failed_flushes += 1
+            delay = min(self.retry_max, 0.5 * 2 ** (self._failures_in_row - 1))
+            self._retry_at = time.monotonic() + delay
+        logging.warning(f"{self.name}: writing {len(batch)} records failed ({error}), retrying in {delay:.1f}s")
+
+    def _write_split(self, batch, error):
+        """Write a batch refused with a row error in halves.
+
+        Returns (records written, [(record, error)] for those that fail even alone, records to retry, their error).
+        """
+        if len(batch) == 1:
+            return 0, [(batch[0], error)], [], None
+        middle = len(batch) // 2
+        written_first, failed_first, retry_first, error_first = self._write_part(batch[:middle])
+        written_second, failed_second, retry_second, error_second = self._write_part(batch[middle:])
+        return (written_first + written_second, failed_first + failed_second, retry_first + retry_second,
+                error_first or error_second)
+
+    def _write_part(self, batch):
+        try:
+            self.flush_fn(batch)
+            return len(batch), [], [], None
+        except self.row_errors as e:
+            return self._write_split(batch, e)
+        except Exception as e:
+            # The store itself failing, not the records - keep them for a later attempt
+            return 0, [], list(batch), e
+
+    def _dead_letter(self, failed):
+        records = [record for record, _ in failed]
+        errors = [error for _, error in failed]
+        logging.error(f"{self.name}: setting aside {len(records)} records that fail on their own "
+                      f"(first error: {errors[0]})")
+        if self.dead_letter_fn is None:
+            for record in records:
+                logging.error(f"{self.name}: dropped {record!r}")
+            return
+        try:
+            self.dead_letter_fn(records, errors)
+        except Exception as e:
+            logging.error(f"{self.name}: dead-lettering {len(records)} records failed, they are lost ({e})")
+
+    def flush(self, timeout=None):
+        """Wait until everything accepted so far is written (or timeout seconds pass); True if it was"""
+        ends_at = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            self._retry_at = min(self._retry_at, time.monotonic())
+            if self._pending:
+                self._oldest_at = time.monotonic() - self.flush_interval
+                self._cond.notify()
+        while self.pending:
+            if ends_at is not None and time.monotonic() >= ends_at:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def shutdown(self, timeout=None):
+        """Stop taking records and write what's left; records still unwritten after the timeout are lost"""
+        timeout = self.shutdown_timeout if timeout is None else timeout
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+            thread = self._thread
+        if thread is None and self._pending:
+            # Never started (e.g. a script that exits right away): drain from here
+            self.start()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+        if self.pending:
+            logging.error(f"{self.name}: {self.pending} records not written at shutdown")
+
+    def stats(self):
+        with self._cond:
+            batches = self.batches
+            return {
+                'pending': len(self._pending) + self._in_flight,
+                'max_pending': self.max_pending,
+                'accepted': self.accepted,
+                'written': self.written,
+                'dropped': self.dropped,
+                'batches': batches,
+                'batch_size_avg': self.written / batches if batches else 0.0,
+                'flush_time_avg': self.flush_time_total / batches if batches else 0.0,
+                'failed_flushes': self.failed_flushes,
+                'dead_lettered': self.dead_lettered,
+            }